@@ -2,6 +2,7 @@ import json
 import time
 import os
 import argparse
+import random
 import tarfile
 import requests
 
@@ -47,6 +48,18 @@ def prettify(response, verbose=False):
     return response
 
 
+def poll_intervals(timeout, initial=0.2, maximum=10.0, factor=1.5, jitter=0.1):
+    # poll short jobs quickly and back off for long ones, for timeout seconds in total
+    deadline = time.monotonic() + timeout
+    interval = initial
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(remaining, interval * (1 + random.uniform(-jitter, jitter)))
+        interval = min(maximum, interval * factor)
+
+
 def run_job(job_dsl, config_data):
     print(job_dsl)
     print(config_data)
@@ -61,8 +74,8 @@ def run_job(job_dsl, config_data):
     job_status = query_job(query_condition)
     prettify(job_status, True)
 
-    for i in range(500):
-        time.sleep(1)
+    for interval in poll_intervals(500):
+        time.sleep(interval)
         job_detail = query_job(query_condition).json()
         final_status = job_detail["data"][0]["f_status"]
         print(final_status)
@@ -11,5 +11,19 @@
 # limitations under the License.
 
 from fml_manager.fml_manager import FMLManager
+from fml_manager.async_fml_manager import AsyncFMLManager
 from fml_manager.fml_cluster_manager import ClusterManager
+from fml_manager.admission import AdmissionController
+from fml_manager.job_history import JobHistory
+from fml_manager.job_memo import JobMemo, MemoEntry
+from fml_manager.job_snapshot import JobSnapshot, ComponentSnapshot
+from fml_manager.job_submitter import SubmitResult
+from fml_manager.job_waiter import JobWaiter, Backoff
+from fml_manager.job_watcher import JobWatcher
+from fml_manager.log_index import LogIndex, LogRecord
+from fml_manager.metric_watcher import MetricWatcher, MetricUpdate
+from fml_manager.response import FlowResponse
+from fml_manager.result_cache import ResultCache
+from fml_manager.transport import HttpTransport, AsyncHttpTransport
+from fml_manager.workflow import Workflow, WorkflowResult, StepResult
 from fml_manager.utils.fate_builders import *
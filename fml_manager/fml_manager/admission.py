@@ -0,0 +1,286 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from fml_manager.job_submitter import SubmitResult
+from fml_manager.job_waiter import TERMINAL_STATUSES
+
+#: Max number of our jobs waiting or running on the cluster at once
+cDefaultCapacity = 8
+
+#: User of the submissions which name none
+cDefaultUser = "default"
+
+
+class _Admission:
+    def __init__(self, index, dsl, config, priority, user):
+        self.index = index
+        self.dsl = dsl
+        self.config = config
+        self.priority = priority
+        self.user = user
+        self.future = Future()
+        # monotonic times of the submission to the controller, and to FATE Flow
+        self.queued_at = time.monotonic()
+        self.admitted_at = None
+
+
+class AdmissionController:
+    """AdmissionController holds the submissions until the cluster has room for them
+
+    At most capacity of the jobs it submitted are waiting or running on the
+    cluster at once, the others are queued locally. Their status comes from
+    a JobWatcher, and a slot is freed when a job reaches a terminal status.
+    The next job is the one of highest priority, and between users with
+    jobs of the same priority, the one of the user with the fewest jobs on
+    the cluster, e.g.
+
+        controller = manager.admission
+        controller.resize(16)
+        futures = controller.submit_jobs(sweep, user="alice")
+        controller.submit(dsl, config, priority=10, user="bob")
+        controller.join()
+        print(controller.stats())
+
+    Every submission returns a Future of its SubmitResult, set once the job
+    is submitted.
+    """
+
+    def __init__(self, manager, capacity=cDefaultCapacity, watcher=None):
+        """ Init the controller
+
+        :param manager: Manager submitting the jobs
+        :type manager: FMLManager
+        :param capacity: Max number of jobs on the cluster at once, default=8
+        :type capacity: int
+        :param watcher: Watcher of the job status, default=None for the one of the manager
+        :type watcher: JobWatcher
+
+        """
+        self.manager = manager
+        self.capacity = capacity
+        self.watcher = watcher if watcher is not None else manager.job_watcher
+
+        self._pending = {}
+        self._active = {}
+        self._submitting = 0
+        self._user_active = Counter()
+        self._served = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._subscription = None
+        self._thread = None
+        self._closed = False
+
+        self._started = None
+        self._admitted = Counter()
+        self._finished = Counter()
+        self._waits = {}
+
+    def submit(self, dsl, config, priority=0, user=cDefaultUser):
+        """ Queue a job, it is submitted once the cluster has room for it
+
+        :param dsl: DSL definition
+        :type dsl: Pipeline or dict
+        :param config: Config definition
+        :type config: Config or dict
+        :param priority: The jobs of higher priority are submitted first, default=0
+        :type priority: int
+        :param user: Name of the user sharing the capacity, default="default"
+        :type user: string
+
+        :rtype: concurrent.futures.Future
+
+        """
+        with self._condition:
+            if self._closed:
+                raise Exception("AdmissionController is closed")
+            admission = _Admission(next(self._counter), dsl, config, priority, user)
+            heapq.heappush(self._pending.setdefault(user, []), (-priority, admission.index, admission))
+            if self._started is None:
+                self._started = admission.queued_at
+            self._ensure_thread()
+            self._condition.notify_all()
+        return admission.future
+
+    def submit_jobs(self, jobs, priority=0, user=cDefaultUser):
+        """ Queue many jobs, e.g. the points of a sweep
+
+        :param jobs: Iterable of (dsl, config)
+        :type jobs: iterable
+
+        :rtype: list of concurrent.futures.Future
+
+        """
+        return [self.submit(dsl, config, priority, user) for dsl, config in jobs]
+
+    def resize(self, capacity):
+        """ Change the max number of jobs on the cluster at once
+        """
+        with self._condition:
+            self.capacity = capacity
+            self._condition.notify_all()
+
+    def active(self):
+        """ Return the ids of the submitted jobs which did not reach a terminal status
+        """
+        with self._condition:
+            return list(self._active)
+
+    def join(self, timeout=None):
+        """ Wait until every queued job is submitted and has reached a terminal status
+
+        :param timeout: Time in seconds to wait, default=None for no limit
+        :type timeout: float
+
+        :returns: Whether every job ended
+        :rtype: bool
+
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending_count() and not self._active and not self._submitting, timeout)
+
+    def stats(self):
+        """ Return the number of queued, active, admitted and finished jobs, the throughput and the queue wait
+
+        throughput is in finished jobs per minute since the first submission,
+        waits are the seconds spent in the local queue. users holds the same
+        counts per user.
+
+        :rtype: dict
+
+        """
+        with self._condition:
+            now = time.monotonic()
+            elapsed = now - self._started if self._started is not None else 0.0
+            stats = self._counts([wait for waits in self._waits.values() for wait in waits], sum(self._admitted.values()),
+                                 sum(self._finished.values()), elapsed)
+            stats.update({"pending": self._pending_count(),
+                          "active": len(self._active) + self._submitting,
+                          "capacity": self.capacity})
+            users = set(self._pending) | set(self._admitted)
+            stats["users"] = {}
+            for user in sorted(users):
+                user_stats = self._counts(self._waits.get(user, []), self._admitted[user],
+                                          self._finished[user], elapsed)
+                user_stats.update({"pending": len(self._pending.get(user, [])),
+                                   "active": self._user_active[user]})
+                stats["users"][user] = user_stats
+            return stats
+
+    def close(self):
+        """ Stop submitting, the queued jobs are cancelled and the submitted ones left running
+        """
+        with self._condition:
+            self._closed = True
+            pending = [item[2] for heap in self._pending.values() for item in heap]
+            self._pending.clear()
+            self._condition.notify_all()
+        for admission in pending:
+            admission.future.cancel()
+        if self._thread is not None:
+            self._thread.join()
+        if self._subscription is not None:
+            self.watcher.unsubscribe(self._subscription)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _counts(waits, admitted, finished, elapsed):
+        waits = sorted(waits)
+        return {"admitted": admitted,
+                "finished": finished,
+                "throughput": finished * 60.0 / elapsed if elapsed > 0 else 0.0,
+                "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_max": waits[-1] if waits else 0.0}
+
+    def _pending_count(self):
+        return sum(len(heap) for heap in self._pending.values())
+
+    def _ensure_thread(self):
+        if self._subscription is None:
+            self._subscription = self.watcher.subscribe(self._on_status)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fml-admission", daemon=True)
+            self._thread.start()
+
+    def _next(self):
+        # the job of highest priority, of the user with the fewest jobs on the cluster, served the longest ago
+        users = [user for user, heap in self._pending.items() if heap]
+        if not users:
+            return None
+        user = min(users, key=lambda user: (self._pending[user][0][0], self._user_active[user],
+                                            self._served.get(user, 0.0)))
+        return heapq.heappop(self._pending[user])[2]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (len(self._active) + self._submitting >= self.capacity
+                                            or not self._pending_count()):
+                    self._condition.wait()
+                if self._closed:
+                    return
+                admission = self._next()
+                admission.admitted_at = time.monotonic()
+                self._served[admission.user] = admission.admitted_at
+                self._waits.setdefault(admission.user, []).append(admission.admitted_at - admission.queued_at)
+                self._admitted[admission.user] += 1
+                self._user_active[admission.user] += 1
+                # the slot is taken while the job is submitted
+                self._submitting += 1
+            self._submit(admission)
+
+    def _submit(self, admission):
+        try:
+            result = SubmitResult(admission.index, admission.dsl, admission.config,
+                                  response=self.manager.submit_job(admission.dsl, admission.config))
+        except Exception as e:
+            result = SubmitResult(admission.index, admission.dsl, admission.config, error=e)
+        job_id = result.job_id
+        with self._condition:
+            self._submitting -= 1
+            if job_id is not None and job_id not in self._active:
+                self._active[job_id] = admission
+            else:
+                # rejected, or an earlier job returned by a memo, it does not take a slot
+                self._user_active[admission.user] -= 1
+            self._condition.notify_all()
+        admission.future.set_result(result)
+        if job_id is not None:
+            self.watcher.watch(job_id)
+            # a job the watcher already saw end sends no more changes
+            self._on_status(job_id, None, self.watcher.cached(job_id))
+
+    def _on_status(self, job_id, old, new):
+        if new not in TERMINAL_STATUSES:
+            return
+        with self._condition:
+            admission = self._active.pop(job_id, None)
+            if admission is None:
+                return
+            self._user_active[admission.user] -= 1
+            self._finished[admission.user] += 1
+            self._condition.notify_all()
@@ -0,0 +1,712 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import copy
+import os
+import time
+
+from fml_manager import flow_requests, job_history, job_snapshot, job_submitter
+from fml_manager.flow_requests import cDefaultChunkRows
+from fml_manager.fml_manager import FMLManagerBase, HttpDownloader, cDefaultReadSize
+from fml_manager.response import FlowResponse
+from fml_manager.job_waiter import Backoff, TERMINAL_STATUSES
+from fml_manager.job_snapshot import JobSnapshot
+from fml_manager.metric_watcher import MetricSeries, metric_filter
+from fml_manager.transport import AsyncHttpTransport, cDefaultPoolSize
+from fml_manager.utils import file_utils
+from fml_manager.utils.csv_stream import CsvBatchStream, cDefaultBatchRows
+from fml_manager.utils.fate_builders import QueryCondition
+from fml_manager.utils.frame_join import HashJoin
+from fml_manager.utils.multipart import cDefaultBufferSize
+from fml_manager.utils.shards import ShardReader, merge_progress, split_lines
+from fml_manager.utils.tar_stream import ChunkPipe, cTarBufferSize
+from fml_manager.utils.upload_manifest import cDefaultChunkSize
+
+
+class AsyncFMLManager(FMLManagerBase):
+    """AsyncFMLManager is the asyncio version of FMLManager
+
+    Every API of FMLManager is provided as a coroutine with the same
+    arguments, e.g.
+
+        manager = AsyncFMLManager(max_concurrency=32)
+        responses = await asyncio.gather(
+            *[manager.query_job(QueryCondition(job_id)) for job_id in job_ids])
+
+    """
+
+    def __init__(self, server_conf=None, log_path="./", transport=None, pool_size=cDefaultPoolSize, timeout=None, max_concurrency=None, cache=None, memo=None):
+        """ Init the AsyncFMLManager with config and log path
+
+        :param server_conf: Path to config file, default=None
+        :type server_conf: string
+        :param log_path: Path to log file, default=./
+        :type log_path: string
+        :param transport: Transport shared with other managers, a new one is created if None
+        :type transport: AsyncHttpTransport
+        :param pool_size: Max keep-alive connections of the new transport, default=10
+        :type pool_size: int
+        :param timeout: Default timeout in seconds of every call, default=None
+        :type timeout: float or tuple
+        :param max_concurrency: Max in-flight calls of the new transport, default=None
+        :type max_concurrency: int
+        :param cache: Cache of the tracking results of finished jobs, default=None for no cache
+        :type cache: ResultCache
+        :param memo: Memo of the submitted jobs, an equal submission returns the earlier job, default=None for no memo
+        :type memo: JobMemo
+
+        """
+        self.log_path = log_path
+
+        #: Pooled asyncio HTTP transport, pass it to other managers to share the connections
+        if transport is None:
+            transport = AsyncHttpTransport(
+                pool_size=pool_size, timeout=timeout, max_concurrency=max_concurrency)
+        self.transport = transport
+
+        #: Timeout of calls made by this manager, fallback to the transport's one if None
+        self.timeout = timeout
+
+        #: Cache of the tracking results of finished jobs, may be shared by managers
+        self.cache = cache
+
+        #: Memo of the submitted jobs, may be shared by managers
+        self.memo = memo
+
+        self._log_index = None
+        self._job_history = None
+
+        self._init_urls(server_conf)
+
+    def with_timeout(self, timeout):
+        """ Return a manager sharing this one's transport with another timeout
+
+        :param timeout: Timeout in seconds of calls made by the returned manager
+        :type timeout: float or tuple
+
+        :rtype: AsyncFMLManager
+
+        """
+        manager = copy.copy(self)
+        manager.timeout = timeout
+        return manager
+
+    async def close(self):
+        """ Close the pooled connections of the transport
+        """
+        if self._log_index is not None:
+            self._log_index.close()
+        if self._job_history is not None:
+            self._job_history.close()
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # Job management
+    async def submit_job(self, dsl, config, force=False):
+        """ Submit job to FATE cluster, see FMLManager.submit_job
+        """
+        request = flow_requests.submit_job(dsl, config)
+        if self.memo is None:
+            return await self._call(request)
+        # the memo is read and written off the event loop
+        loop = asyncio.get_event_loop()
+        key, tables = await loop.run_in_executor(None, self.memo.key, self.server_url, dsl, config)
+        entry = None if force else await loop.run_in_executor(None, self.memo.get, key)
+        status = None if entry is None else entry.status
+        if entry is not None and status not in TERMINAL_STATUSES:
+            status = await self._query_status(entry.job_id)
+        response = await loop.run_in_executor(None, self._memo_reuse, entry, status)
+        if response is None:
+            response = await self._call(request)
+            await loop.run_in_executor(None, self._memo_record, key, tables, response)
+        return response
+
+    async def submit_job_by_files(self, dsl_path, config_path):
+        """ Submit job with file to FATE cluster, see FMLManager.submit_job_by_files
+        """
+        dsl_data, config_data = flow_requests.load_job_files(
+            dsl_path, config_path)
+
+        return await self.submit_job(dsl_data, config_data)
+
+    async def submit_jobs(self, jobs, parallelism=4, rate_limit=None):
+        """ Submit many jobs, see FMLManager.submit_jobs
+
+        :rtype: async generator of SubmitResult
+
+        """
+        async for result in job_submitter.submit_jobs_async(self.submit_job, jobs, parallelism, rate_limit):
+            yield result
+
+    async def query_job_status(self, query_conditions, max_tries=200, backoff=None, timeout=None):
+        """ Fetch status of job, see FMLManager.query_job_status
+        """
+        if backoff is None:
+            backoff = Backoff()
+        job_status = "failed"
+        guest_status = None
+        if timeout is None:
+            timeout = max_tries
+        for interval in backoff.intervals(timeout):
+            await asyncio.sleep(interval)
+            try:
+                guest_status = flow_requests.job_status(
+                    (await self.query_job(query_conditions)).json())
+            except Exception as e:
+                print("Failed to fetch status: ", e)
+
+            print("Status: %s" % guest_status)
+            if guest_status == "failed":
+                job_status = "failed"
+                raise Exception("Failed to upload data.")
+            if guest_status in TERMINAL_STATUSES:
+                job_status = guest_status
+                break
+        return job_status
+
+    async def _query_status(self, job_id):
+        # see FMLManager._query_status
+        try:
+            response = await self._call(flow_requests.query_job(QueryCondition(job_id)))
+            return flow_requests.job_status(response.json())
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
+    async def query_job(self, query_conditions):
+        """ Fetch job, see FMLManager.query_job
+        """
+        return await self._call(flow_requests.query_job(query_conditions))
+
+    async def query_job_conf(self, query_conditions):
+        """ Fetch config of job, see FMLManager.query_job_conf
+        """
+        return await self._call(flow_requests.query_job_conf(query_conditions))
+
+    async def snapshot_job(self, job_id, role, party_id, output_data=True):
+        """ Fetch the status, config, tasks, metrics and outputs of a job for a party in one call, see FMLManager.snapshot_job
+
+        :rtype: JobSnapshot
+        """
+        start = time.perf_counter()
+        snapshot = JobSnapshot(job_id, role, party_id)
+
+        async def fetch(call, cached=True):
+            endpoint, component, request = call
+            begin = time.perf_counter()
+            try:
+                if cached:
+                    response = await self._send_cached(job_id, request)
+                else:
+                    response = await self._send(request)
+            except Exception as e:
+                snapshot.record(endpoint, component, error=e, seconds=time.perf_counter() - begin)
+                return None
+            snapshot.record(endpoint, component, response, seconds=time.perf_counter() - begin)
+            return response
+
+        response = await fetch(("job", None, flow_requests.query_job(QueryCondition(job_id))), cached=False)
+        if response is not None and self.cache is not None:
+            self._job_finished(response, job_id)
+
+        calls = job_snapshot.job_requests(job_id, role, party_id)
+        conf = asyncio.ensure_future(fetch(calls[0]))
+        others = [asyncio.ensure_future(fetch(call)) for call in calls[1:]]
+        await conf
+        others += [asyncio.ensure_future(fetch(call))
+                   for name in snapshot.component_names()
+                   for call in job_snapshot.component_requests(job_id, role, party_id, name, output_data)]
+        await asyncio.gather(*others)
+
+        snapshot.elapsed = time.perf_counter() - start
+        return snapshot
+
+    async def stop_job(self, job_id):
+        """ Stop job, see FMLManager.stop_job
+        """
+        return await self._call(flow_requests.stop_job(job_id))
+
+    async def update_job(self, job_id, role, party_id, notes):
+        return await self._call(flow_requests.update_job(job_id, role, party_id, notes))
+
+    async def fetch_job_log(self, job_id, compress=True, members=None, index=None):
+        """ Fetch the log of job, see FMLManager.fetch_job_log
+
+        The archive is extracted by a worker thread fed with the body as it
+        is received.
+        """
+        extract_dir = os.path.join(self.log_path, 'job_{}_log'.format(job_id))
+        request = flow_requests.fetch_job_log(job_id, compress)
+        loop = asyncio.get_event_loop()
+        async with self.transport.stream(request.method, self._url(*request.path), timeout=self.timeout, **request.kwargs) as response:
+            if not self._is_log_archive(response.status, response.headers):
+                content = await response.read()
+                return FlowResponse.of(self._response(response, content))
+            pipe = ChunkPipe()
+            extraction = loop.run_in_executor(
+                None, self._extract_pipe, pipe, job_id, extract_dir, members, index)
+            try:
+                async for chunk in response.content.iter_chunked(cTarBufferSize):
+                    await loop.run_in_executor(None, pipe.write, chunk)
+                await loop.run_in_executor(None, pipe.close)
+            except BaseException:
+                pipe.abort()
+                await asyncio.wait([extraction])
+                raise
+            files = await extraction
+
+        return FlowResponse.of(self._log_result(extract_dir, files))
+
+    async def fetch_job_logs(self, job_ids, parallelism=4, members=None, index=True):
+        """ Fetch the logs of many jobs at once and index them, see FMLManager.fetch_job_logs
+        """
+        job_ids = list(job_ids)
+        if index is True:
+            index = self.log_index
+        semaphore = asyncio.Semaphore(parallelism)
+
+        async def fetch(job_id):
+            async with semaphore:
+                return await self.fetch_job_log(job_id, members=members, index=index)
+
+        responses = await asyncio.gather(*[fetch(job_id) for job_id in job_ids])
+        return dict(zip(job_ids, responses))
+
+    # Data management
+    async def load_data(self, url, namespace, table_name, work_mode, head, partition, drop="1", api_version="1.4", progress=None, buffer_size=cDefaultBufferSize, allow_chunked=False, parallel=False, compress=False, resumable=False, chunk_size=cDefaultChunkSize, manifest=None, verify=False):
+        """ Upload data to FATE cluster, see FMLManager.load_data
+        """
+        request = flow_requests.load_data(
+            url, namespace, table_name, work_mode, head, partition, drop, api_version)
+        self._memo_touch(namespace, table_name)
+        if api_version != "1.4":
+            return await self._call(request)
+        if resumable:
+            return await self._upload_resumable(url, manifest, verify, chunk_size, namespace, table_name, work_mode,
+                                                head, partition, drop, buffer_size, progress, compress)
+
+        temp_file = None
+        if url.startswith("http://") or url.startswith("https://"):
+            # the source is not FATE Flow, it does not take a slot of max_concurrency
+            async with self.transport.stream("GET", url, timeout=self.timeout, bounded=False) as source:
+                source.raise_for_status()
+                size = HttpDownloader.content_length(source.headers)
+                filename = HttpDownloader(url).filename(source.headers)
+                # a compressed body is chunked anyway
+                if size is not None or allow_chunked or compress:
+                    # pipe the remote body straight into the upload
+                    return await self._upload(request, source.content.iter_chunked(buffer_size),
+                                              filename, size, buffer_size, progress, compress)
+
+                # FATE Flow needs the length of the upload, spool the data to disk first
+                temp_file = os.path.join(
+                    file_utils.get_project_base_directory(), filename)
+                with open(temp_file, 'wb') as fw:
+                    async for chunk in source.content.iter_chunked(buffer_size):
+                        fw.write(chunk)
+            url = temp_file
+
+        try:
+            ranges = []
+            if parallel and url.endswith(".gz"):
+                raise Exception("A gzipped file cannot be split into shards.")
+            if parallel:
+                header, ranges = split_lines(
+                    url, int(partition), str(head) == "1")
+            if len(ranges) > 1:
+                response = await self._upload_shards(url, header, ranges, namespace, table_name, work_mode,
+                                                     head, partition, drop, buffer_size, progress, compress)
+            else:
+                with open(url, "rb") as data_file:
+                    response = await self._upload(request, self._file_blocks(data_file, buffer_size),
+                                                  os.path.basename(url), os.fstat(data_file.fileno()).st_size,
+                                                  buffer_size, progress, compress)
+        finally:
+            if temp_file is not None and os.path.exists(temp_file):
+                print("Delete temp file...")
+                os.remove(temp_file)
+
+        return response
+
+    async def load_dataframe(self, data, namespace, table_name, work_mode, partition, drop="1", index=False, batch_rows=cDefaultBatchRows, progress=None, buffer_size=cDefaultBufferSize, allow_chunked=False, compress=False):
+        """ Upload a DataFrame, an Arrow table or a Parquet file to FATE cluster, see FMLManager.load_dataframe
+        """
+        request = flow_requests.load_data(
+            None, namespace, table_name, work_mode, 1, partition, drop)
+        self._memo_touch(namespace, table_name)
+        source = CsvBatchStream(data, index, batch_rows)
+        if not (allow_chunked or compress):
+            await asyncio.get_event_loop().run_in_executor(None, source.measure)
+        return await self._upload(request, self._file_blocks(source, buffer_size), "{}.csv".format(table_name),
+                                  source.size, buffer_size, progress, compress)
+
+    async def query_data(self, job_id, limit):
+        """ Query data of job
+        """
+        return await self._call(flow_requests.query_data(job_id, limit))
+
+    async def delete_table(self, namespace, table_name):
+        """ Delete a table from FATE cluster
+        """
+        self._memo_touch(namespace, table_name)
+        return await self._call(flow_requests.delete_table(namespace, table_name))
+
+    async def download_data(self, namespace, table_name, filename, work_mode, delimitor, output_folder="./"):
+        """ Download data to FATE Flow, see FMLManager.download_data
+        """
+        response = await self._send(flow_requests.download_data(
+            namespace, table_name, filename, work_mode, delimitor))
+
+        if response.status_code == 200:
+            output = FlowResponse.of(response).json()
+            job_id = output["jobId"]
+            query_condition = {
+                "job_id": job_id
+            }
+            for interval in Backoff().intervals(500):
+                await asyncio.sleep(interval)
+                status = flow_requests.job_status(
+                    (await self.query_job(query_condition)).json())
+                if status == "failed":
+                    print("Failed")
+                    print((await self.query_job(query_condition)).json())
+                    raise Exception("Failed to download data.")
+                if status == "success":
+                    return FlowResponse.of(response)
+        response = {
+            'retcode': 1,
+            'retmsg': 'Download failed'
+        }
+
+        return FlowResponse.of(response)
+
+    # Model management
+    async def load_model(self, initiator_party_id, federated_roles, work_mode, model_id, model_version):
+        return await self._call(flow_requests.load_model(
+            initiator_party_id, federated_roles, work_mode, model_id, model_version))
+
+    async def bind_model(self, service_id, initiator_party_id, federated_roles, work_mode, model_id, model_version):
+        return await self._call(flow_requests.bind_model(
+            self.serving_url, service_id, initiator_party_id, federated_roles, work_mode, model_id, model_version))
+
+    async def print_model_version(self, role, party_id, model_id, api_version="1.4"):
+        """ Print model version
+        """
+        return await self._call(flow_requests.print_model_version(
+            role, party_id, model_id, api_version))
+
+    async def model_output(self, role, party_id, model_id, model_version, model_component):
+        """ Output the model
+        """
+        response = await self._send(flow_requests.model_output(
+            role, party_id, model_id, model_version))
+        model = flow_requests.parse_model_output(
+            FlowResponse.of(response).json(), model_component)
+
+        return FlowResponse.of(model)
+
+    async def offline_predict_on_dataset(self, is_vertical, initiator_party_role, initiator_party_id, work_mode, model_id, model_version, federated_roles, guest_data_name="", guest_data_namespace="", host_data_name="", host_data_namespace=""):
+        if is_vertical:
+            print("This API is not support vertical federated machine learning yet. ")
+            return
+
+        dsl, config = flow_requests.offline_predict_job(
+            initiator_party_role, initiator_party_id, work_mode, model_id, model_version, federated_roles,
+            guest_data_name, guest_data_namespace, host_data_name, host_data_namespace)
+
+        return await self.submit_job(dsl, config)
+
+    # Task
+    async def query_task(self, query_conditions):
+        """ Query task
+        """
+        return await self._call(flow_requests.query_task(query_conditions))
+
+    async def sync_job_history(self, conditions=None, tasks=True, history=None):
+        """ Record the new and changed jobs of the cluster in a JobHistory, see FMLManager.sync_job_history
+        """
+        if history is None:
+            history = self.job_history
+        # the history is read and written off the event loop
+        loop = asyncio.get_event_loop()
+        responses = await asyncio.gather(
+            *[self._call(flow_requests.query_job(condition))
+              for condition in job_history.sync_conditions(conditions)])
+        jobs = await loop.run_in_executor(None, history.changed, [
+            job for response in responses for job in job_history.query_rows(response.json())])
+        task_rows = {}
+        if tasks and jobs:
+            job_ids = sorted(set(job["f_job_id"] for job in jobs))
+            responses = await asyncio.gather(
+                *[self._call(flow_requests.query_task({"job_id": job_id})) for job_id in job_ids])
+            task_rows = {job_id: job_history.query_rows(response.json())
+                         for job_id, response in zip(job_ids, responses)}
+        return await loop.run_in_executor(None, history.record, jobs, task_rows)
+
+    # Tracking
+    async def track_job_data(self, job_id, role, party_id):
+        """ Track job data
+        """
+        return await self._call_cached(job_id, flow_requests.track_job_data(job_id, role, party_id))
+
+    async def track_component_all_metric(self, job_id, role, party_id, component_name):
+        """ Track output all metric of component
+        """
+        return await self._call_cached(job_id, flow_requests.track_component_all_metric(
+            job_id, role, party_id, component_name))
+
+    async def track_component_metric_type(self, job_id, role, party_id, component_name):
+        """ Track output metric type of component
+        """
+        return await self._call_cached(job_id, flow_requests.track_component_metric_type(
+            job_id, role, party_id, component_name))
+
+    async def track_component_metric_data(self, job_id, role, party_id, component_name, metric_name, metric_namespace):
+        """ Track output metric data of component
+        """
+        return await self._call_cached(job_id, flow_requests.track_component_metric_data(
+            job_id, role, party_id, component_name, metric_name, metric_namespace))
+
+    async def get_metric_frame(self, job_ids, component_name, role, party_id, metrics=None):
+        """ Fetch the metric series of a component of many jobs as one DataFrame, see FMLManager.get_metric_frame
+        """
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+
+        async def metric_type(job_id):
+            response = await self._send_cached(job_id, flow_requests.track_component_metric_type(
+                job_id, role, party_id, component_name))
+            return response.json()
+
+        async def metric_data(job_id, namespace, name):
+            response = await self._send_cached(job_id, flow_requests.track_component_metric_data(
+                job_id, role, party_id, component_name, name, namespace))
+            return response.json()
+
+        types = await asyncio.gather(*[metric_type(job_id) for job_id in job_ids])
+        series = [(job_id, namespace, name)
+                  for job_id, result in zip(job_ids, types)
+                  for namespace, name in flow_requests.metric_names(result, metrics)]
+        results = await asyncio.gather(*[metric_data(*entry) for entry in series])
+
+        return flow_requests.metric_frame(
+            [entry + (result,) for entry, result in zip(series, results)])
+
+    async def watch_metrics(self, job_id, component_name, role, party_id, metrics=None, backoff=None):
+        """ Tail the metrics of a running job, see FMLManager.watch_metrics
+
+        The watches are polled by the event loop, every watch polls its
+        component with its own backoff.
+
+        :param backoff: Polling intervals, default=Backoff()
+        :type backoff: Backoff
+
+        :rtype: async generator of MetricUpdate
+        """
+        if backoff is None:
+            backoff = Backoff()
+        series = MetricSeries(job_id, component_name)
+        wanted = metric_filter(metrics)
+        attempt = 0
+        while True:
+            updates = []
+            try:
+                # the status is read first, so the metrics read after a terminal status are complete
+                response = await self._send(flow_requests.query_job(QueryCondition(job_id)))
+                status = flow_requests.job_status(response.json())
+                response = await self._send(flow_requests.track_component_all_metric(
+                    job_id, role, party_id, component_name))
+                updates = series.update(response.json())
+            except Exception as e:
+                print("Failed to fetch metrics of {}: {}".format(job_id, e))
+                status = None
+            for update in updates:
+                if wanted(update):
+                    yield update
+            if status in TERMINAL_STATUSES:
+                return
+            # new points bring the polls back to the shortest interval
+            attempt = 0 if updates else attempt + 1
+            await asyncio.sleep(backoff.interval(attempt))
+
+    async def track_component_parameters(self, job_id, role, party_id, component_name):
+        """ Track output parameter of component
+        """
+        return await self._call_cached(job_id, flow_requests.track_component_parameters(
+            job_id, role, party_id, component_name))
+
+    async def track_component_output_model(self, job_id, role, party_id, component_name):
+        """ Track output model of component
+        """
+        return await self._call_cached(job_id, flow_requests.track_component_output_model(
+            job_id, role, party_id, component_name))
+
+    async def track_component_output_data(self, job_id, role, party_id, component_name, typed=True, float32=False):
+        """ Track output data of component
+
+        :rtype: pandas.DataFrame
+        """
+        response = await self._send_cached(job_id, flow_requests.track_component_output_data(
+            job_id, role, party_id, component_name))
+
+        return flow_requests.output_data_frame(response.json(), typed, float32)
+
+    async def iter_component_output_data(self, job_id, role, party_id, component_name, chunk_size=cDefaultChunkRows, limit=None, offset=0, typed=True, float32=False):
+        """ Iterate the output data of component as DataFrames, see FMLManager.iter_component_output_data
+        """
+        frames = flow_requests.OutputDataFrames(
+            chunk_size, limit, offset, typed, float32)
+        request = flow_requests.track_component_output_data(
+            job_id, role, party_id, component_name)
+        async with self.transport.stream(request.method, self._url(*request.path), timeout=self.timeout, **request.kwargs) as response:
+            async for data in response.content.iter_chunked(cDefaultReadSize):
+                for frame in frames.feed(data):
+                    yield frame
+                if frames.done:
+                    return
+        for frame in frames.close():
+            yield frame
+
+    async def join_component_output_data(self, job_id, component_name, parties, on="id", chunk_size=cDefaultChunkRows, typed=True, float32=False):
+        """ Join the output data of several parties of a vertical federated job on the sample id, see FMLManager.join_component_output_data
+
+        :rtype: async generator of pandas.DataFrame
+        """
+        sides = self._join_sides(component_name, parties)
+        join = HashJoin([side[0] for side in sides], on, chunk_size)
+        chunks = [asyncio.Queue(maxsize=2) for _ in sides]
+
+        async def stream(chunk_queue, role, party_id, component):
+            try:
+                async for frame in self.iter_component_output_data(
+                        job_id, role, party_id, component, chunk_size, typed=typed, float32=float32):
+                    await chunk_queue.put(frame)
+                await chunk_queue.put(None)
+            except Exception as e:
+                await chunk_queue.put(e)
+
+        tasks = [asyncio.ensure_future(stream(chunk_queue, role, party_id, component))
+                 for chunk_queue, (_, role, party_id, component) in zip(chunks, sides)]
+        try:
+            # a chunk of every side in turn, so the smallest output ends first
+            active = list(range(len(sides)))
+            while active:
+                for index in list(active):
+                    item = await chunks[index].get()
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is None:
+                        active.remove(index)
+                        frames = join.end(sides[index][0])
+                    else:
+                        frames = join.feed(sides[index][0], item)
+                    for frame in frames:
+                        yield frame
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Utils
+    async def _send(self, request, **kwargs):
+        kwargs = dict(request.kwargs, **kwargs)
+        return await self.transport.request(request.method, self._url(*request.path), timeout=self.timeout, **kwargs)
+
+    async def _call(self, request, **kwargs):
+        return FlowResponse.of(await self._send(request, **kwargs))
+
+    async def _send_cached(self, job_id, request):
+        # see FMLManager._send_cached, the files are read and written off the event loop
+        if self.cache is None:
+            return await self._send(request)
+        loop = asyncio.get_event_loop()
+        key = self.cache.key(self.server_url, request)
+        response = await loop.run_in_executor(None, self.cache.get, key)
+        if response is not None:
+            return response
+        finished = self.cache.is_finished(self.server_url, job_id) or (
+            not self.cache.is_running(self.server_url, job_id) and self._job_finished(
+                await self._send(flow_requests.query_job(QueryCondition(job_id))), job_id))
+        response = await self._send(request)
+        if finished and self._cacheable(response):
+            await loop.run_in_executor(None, self.cache.put, key, response)
+        return response
+
+    async def _call_cached(self, job_id, request):
+        return FlowResponse.of(await self._send_cached(job_id, request))
+
+    async def _upload(self, request, blocks, filename, size, buffer_size, progress, compress=False):
+        body = self._multipart(None, filename, size,
+                               buffer_size, progress, compress)
+        return await self._call(request, data=body.iter_async(blocks), headers=body.headers)
+
+    async def _upload_resumable(self, path, manifest_path, verify, chunk_size, namespace, table_name, work_mode, head, partition, drop, buffer_size, progress, compress):
+        # the confirmed chunks are hashed again, off the event loop
+        manifest = await asyncio.get_event_loop().run_in_executor(
+            None, self._upload_manifest, path, manifest_path, verify, chunk_size, namespace, table_name,
+            work_mode, head, partition, drop)
+        # the upload jobs run concurrently, so the table is dropped once before the first chunk
+        if str(drop) == "1" and manifest.confirmed == 0:
+            await self.delete_table(namespace, table_name)
+        request = flow_requests.load_data(
+            path, namespace, table_name, work_mode, head, partition, "0")
+        filename = os.path.basename(path)
+        responses = []
+        for index in manifest.pending():
+            chunk = manifest.chunks[index]
+            with ShardReader(path, chunk["start"], chunk["end"], manifest.header, digest=True) as shard:
+                response = await self._upload(request, self._file_blocks(shard, buffer_size),
+                                              "{}.{}".format(filename, index), shard.size,
+                                              buffer_size, progress, compress)
+            result = response.json()
+            if result.get("retcode") != 0:
+                raise Exception("Failed to upload chunk {} of {}: {}".format(
+                    index, path, result.get("retmsg")))
+            manifest.confirm(index, shard.digest.hexdigest(), result.get("jobId"))
+            responses.append(response)
+        manifest.remove()
+        return responses
+
+    async def _upload_shards(self, path, header, ranges, namespace, table_name, work_mode, head, partition, drop, buffer_size, progress, compress):
+        # the shards are appended to the table, so it is dropped once up front
+        if str(drop) == "1":
+            await self.delete_table(namespace, table_name)
+        request = flow_requests.load_data(
+            path, namespace, table_name, work_mode, head, partition, "0")
+        filename = os.path.basename(path)
+        reports = merge_progress(progress, len(ranges))
+
+        async def upload(index):
+            start, end = ranges[index]
+            with ShardReader(path, start, end, header) as shard:
+                return await self._upload(request, self._file_blocks(shard, buffer_size),
+                                          "{}.{}".format(filename, index), shard.size,
+                                          buffer_size, reports[index], compress)
+
+        return list(await asyncio.gather(*[upload(index) for index in range(len(ranges))]))
+
+    async def _file_blocks(self, source, buffer_size):
+        # read the file off the event loop, one block at a time
+        loop = asyncio.get_event_loop()
+        while True:
+            block = await loop.run_in_executor(None, source.read, buffer_size)
+            if not block:
+                return
+            yield block
+
+    def _response(self, response, content):
+        return FlowResponse(response.status, content, response.headers, str(response.url))
@@ -0,0 +1,568 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Request construction of the FATE Flow API
+
+The functions here only build the requests and parse the responses, so
+FMLManager and AsyncFMLManager send exactly the same bodies.
+"""
+
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from fml_manager.utils.core import json_loads
+from fml_manager.utils.frames import infer_kinds, typed_frame
+from fml_manager.utils.json_stream import JsonMemberStream
+
+#: Number of rows of the DataFrames yielded by iter_component_output_data
+cDefaultChunkRows = 10000
+
+#: A FATE Flow call, path is relative to the server url, kwargs are passed to the transport
+FlowRequest = namedtuple("FlowRequest", ["method", "path", "kwargs"])
+
+
+def _post(*path, **kwargs):
+    return FlowRequest("POST", path, kwargs)
+
+
+def to_dict(obj):
+    """ Return obj.to_dict() for builder instances, or obj itself
+    """
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return obj
+
+
+# Job management
+def submit_job(dsl, config):
+    post_data = {'job_dsl': to_dict(dsl),
+                 'job_runtime_conf': to_dict(config)}
+    return _post("job", "submit", json=post_data)
+
+
+def load_job_files(dsl_path, config_path):
+    """ Load the DSL and config of a job from files
+
+    :rtype: tuple
+
+    """
+    config_data = {}
+    if config_path:
+        config_path = os.path.abspath(config_path)
+        with open(config_path, 'r') as f:
+            config_data = json.load(f)
+    else:
+        raise Exception('Conf cannot be null.')
+    dsl_data = {}
+    if dsl_path:
+        dsl_path = os.path.abspath(dsl_path)
+        with open(dsl_path, 'r') as f:
+            dsl_data = json.load(f)
+    else:
+        raise Exception('DSL_path cannot be null.')
+
+    return dsl_data, config_data
+
+
+def query_job(query_conditions):
+    return _post("job", "query", json=to_dict(query_conditions))
+
+
+def job_status(query_result):
+    """ Return f_status of the first job in a job query result
+    """
+    return query_result["data"][0]["f_status"]
+
+
+def query_job_conf(query_conditions):
+    return _post("job", "config", json=to_dict(query_conditions))
+
+
+def stop_job(job_id):
+    post_data = {
+        'job_id': job_id
+    }
+    return _post("job", "stop", json=post_data)
+
+
+def update_job(job_id, role, party_id, notes):
+    post_data = {
+        "job_id": job_id,
+        "role": role,
+        "party_id": party_id,
+        "notes": notes
+    }
+    return _post("job", "update", json=post_data)
+
+
+def fetch_job_log(job_id, compress=True):
+    data = {
+        "job_id": job_id
+    }
+    kwargs = {"json": data, "stream": True}
+    if not compress:
+        kwargs["headers"] = {"Accept-Encoding": "identity"}
+    return FlowRequest("GET", ("job", "log"), kwargs)
+
+
+# Data management
+def load_data(url, namespace, table_name, work_mode, head, partition, drop="1", api_version="1.4"):
+    """ Build the upload request, for API 1.4 the file part is attached by the caller
+    """
+    if api_version == "1.4":
+        post_data = {
+            "namespace": namespace,
+            "table_name": table_name,
+            "work_mode": work_mode,
+            "head": head,
+            "partition": partition,
+            "drop": drop
+        }
+        return _post("data", "upload", params=post_data)
+
+    post_data = {
+        "file": url,
+        "namespace": namespace,
+        "table_name": table_name,
+        "work_mode": work_mode,
+        "head": head,
+        "partition": partition
+    }
+    return _post("data", "upload", json=post_data)
+
+
+def query_data(job_id, limit):
+    post_data = {
+        "job_id": job_id,
+        "limit": limit
+    }
+    return _post("data", "upload", "history", json=post_data)
+
+
+def download_data(namespace, table_name, filename, work_mode, delimitor):
+    DEFAULT_DATA_FOLDER = "/data/projects/fate/python/download_dir"
+    output_path = "{}/{}".format(DEFAULT_DATA_FOLDER, filename)
+    post_data = {
+        "namespace": namespace,
+        "table_name": table_name,
+        "work_mode": work_mode,
+        "delimitor": delimitor,
+        "output_path": output_path
+    }
+    return _post("data", "download", json=post_data)
+
+
+def delete_table(namespace, table_name):
+    post_data = {
+        "namespace": namespace,
+        "table_name": table_name
+    }
+    return _post("table", "delete", json=post_data)
+
+
+# Model management
+def load_model(initiator_party_id, federated_roles, work_mode, model_id, model_version):
+    post_data = {
+        "initiator": {
+            "party_id": initiator_party_id,
+            "role": "guest"
+        },
+        "role": federated_roles,
+        "job_parameters": {
+            "work_mode": work_mode,
+            "model_id": model_id,
+            "model_version": model_version
+        }
+    }
+    return _post("model", "load", json=post_data)
+
+
+def bind_model(serving_url, service_id, initiator_party_id, federated_roles, work_mode, model_id, model_version):
+    if serving_url is None:
+        raise Exception(
+            'Federated Serving is not deployed or not correctly configured yet. ')
+    post_data = {
+        "service_id": service_id,
+        "initiator": {
+            "party_id": initiator_party_id,
+            "role": "guest"
+        },
+        "role": federated_roles,
+        "job_parameters": {
+            "work_mode": work_mode,
+            "model_id": model_id,
+            "model_version": model_version
+        },
+        "servings": serving_url
+    }
+    return _post("model", "bind", json=post_data)
+
+
+def print_model_version(role, party_id, model_id, api_version="1.4"):
+    action = "version"
+    if api_version == "1.4":
+        action = "version_history"
+
+    namespace = "#".join([role, str(party_id), model_id])
+    post_data = {
+        "namespace": namespace
+    }
+    return _post("model", action, json=post_data)
+
+
+def model_output(role, party_id, model_id, model_version):
+    namespace = "#".join([role, str(party_id), model_id])
+    post_data = {
+        "name": model_version,
+        "namespace": namespace
+    }
+    return _post("model", "transfer", json=post_data)
+
+
+def parse_model_output(model, model_component):
+    """ Pick metadata and parameters of the component from a model transfer result
+
+    :rtype: dict
+
+    """
+    en_model_metadata = None
+    en_model_parameters = None
+    if model["data"] != "":
+        en_model_metadata = model["data"]["%sMeta" % model_component]
+        en_model_parameters = model["data"]["%sParam" % model_component]
+
+    return {
+        "metadata": en_model_metadata,
+        "parameters": en_model_parameters
+    }
+
+
+def offline_predict_job(initiator_party_role, initiator_party_id, work_mode, model_id, model_version, federated_roles, guest_data_name="", guest_data_namespace="", host_data_name="", host_data_namespace=""):
+    """ Build the DSL and config of a predict job
+
+    :rtype: tuple
+
+    """
+    # For predict job, dsl is empty dict.
+    dsl = {}
+
+    config = {
+        "initiator": {
+            "role": initiator_party_role,
+            "party_id": initiator_party_id
+        },
+        "job_parameters": {
+            "work_mode": work_mode,
+            "job_type": "predict",
+            "model_id": model_id,
+            "model_version": model_version
+        },
+        "role": federated_roles,
+        "role_parameters": {}
+    }
+
+    if guest_data_name != "" or guest_data_namespace != "":
+        if initiator_party_role != "guest":
+            raise Exception("Initiator not has data sets.")
+
+        guest_parameters = {
+            "args": {
+                "data": {
+                    "eval_data": [{"name": guest_data_name, "namespace": guest_data_namespace}]
+                }
+            }
+        }
+
+        config["role_parameters"]["guest"] = guest_parameters
+
+    if host_data_name != "" or host_data_namespace != "":
+        host_parameters = {
+            "args": {
+                "data": {
+                    "eval_data": [{"name": host_data_name, "namespace": host_data_namespace}]
+                }
+            }
+        }
+        config["role_parameters"]["host"] = host_parameters
+
+    return dsl, config
+
+
+# Task
+def query_task(query_conditions):
+    return _post("job", "task", "query", json=to_dict(query_conditions))
+
+
+# Tracking
+def _component_post_data(job_id, role, party_id, component_name):
+    return {
+        "job_id": job_id,
+        "role": role,
+        "party_id": party_id,
+        "component_name": component_name
+    }
+
+
+def track_job_data(job_id, role, party_id):
+    post_data = {
+        "job_id": job_id,
+        "role": role,
+        "party_id": party_id
+    }
+    return _post("tracking", "job", "data_view", json=post_data)
+
+
+def track_component_all_metric(job_id, role, party_id, component_name):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    return _post("tracking", "component", "metric", "all", json=post_data)
+
+
+def track_component_metric_type(job_id, role, party_id, component_name):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    return _post("tracking", "component", "metrics", json=post_data)
+
+
+def track_component_metric_data(job_id, role, party_id, component_name, metric_name, metric_namespace):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    post_data["metric_name"] = metric_name
+    post_data["metric_namespace"] = metric_namespace
+    return _post("tracking", "component", "metric_data", json=post_data)
+
+
+def metric_names(result, metrics=None):
+    """ Return the (namespace, metric) pairs of a component metric type result
+
+    :param metrics: Metric names or (namespace, metric) pairs to keep, None keeps every metric
+    :type metrics: iterable
+
+    :rtype: list
+
+    """
+    if result.get("retcode") != 0:
+        raise Exception("Failed to fetch the metrics: {}".format(result.get("retmsg")))
+    wanted = None if metrics is None else set(
+        tuple(metric) if isinstance(metric, (list, tuple)) else metric for metric in metrics)
+    return [(namespace, name)
+            for namespace, names in sorted((result.get("data") or {}).items())
+            for name in names
+            if wanted is None or name in wanted or (namespace, name) in wanted]
+
+
+def _level(labels, codes):
+    # one categorical level of the index, the labels are given per series
+    level_codes, categories = pd.factorize(pd.Index(labels, dtype=object))
+    return pd.Categorical.from_codes(level_codes[codes], categories)
+
+
+def metric_frame(series):
+    """ Build one tidy DataFrame from component metric data results
+
+    The points of every series are converted by NumPy and concatenated, the
+    labels of the series are repeated on the index rather than per point.
+
+    :param series: (job_id, namespace, metric, result) of every series
+    :type series: list
+
+    :returns: A value column indexed by job_id, namespace, metric and step
+    :rtype: pandas.DataFrame
+
+    """
+    arrays = []
+    for job_id, namespace, name, result in series:
+        if result.get("retcode") != 0:
+            raise Exception("Failed to fetch {}.{} of {}: {}".format(
+                namespace, name, job_id, result.get("retmsg")))
+        arrays.append(np.asarray(result.get("data") or [], dtype=object).reshape(-1, 2))
+    points = np.concatenate(arrays) if arrays else np.empty((0, 2), dtype=object)
+    codes = np.repeat(np.arange(len(arrays)), [len(array) for array in arrays])
+    jobs, namespaces, names = ([entry[i] for entry in series] for i in range(3))
+    index = pd.MultiIndex.from_arrays(
+        [_level(jobs, codes), _level(namespaces, codes), _level(names, codes),
+         pd.Series(points[:, 0]).infer_objects().values],
+        names=["job_id", "namespace", "metric", "step"])
+    values = pd.Series(points[:, 1]).infer_objects().values
+    return pd.DataFrame({"value": values}, index=index)
+
+
+def track_component_parameters(job_id, role, party_id, component_name):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    return _post("tracking", "component", "parameters", json=post_data)
+
+
+def track_component_output_model(job_id, role, party_id, component_name):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    return _post("tracking", "component", "output", "model", json=post_data)
+
+
+def track_component_output_data(job_id, role, party_id, component_name):
+    post_data = _component_post_data(job_id, role, party_id, component_name)
+    return _post("tracking", "component", "output", "data", json=post_data)
+
+
+def output_data_frame(result, typed=True, float32=False):
+    """ Build a DataFrame from a component output data result
+
+    :param typed: Infer the dtypes of the columns, otherwise every column is object
+    :type typed: bool
+    :param float32: Store float features as float32, only if typed
+    :type float32: bool
+
+    :rtype: pandas.DataFrame
+
+    """
+    data = result['data']
+    header = result['meta']['header']
+
+    if typed:
+        return typed_frame(data, header, float32=float32)
+    return pd.DataFrame(data, columns=header)
+
+
+class OutputDataFrames:
+    """OutputDataFrames turns a streamed component output data response into DataFrames
+
+    Feed it the bytes of the response, it returns DataFrames of chunk_size
+    rows as soon as they are complete. The header is in the meta member,
+    which FATE Flow sends after the data, so the rows received before the
+    header are spooled to a temporary file rather than kept in memory.
+
+    For the same reason limit only cuts the rows kept: the frames need the
+    header, so the whole response is still received, though the rows past
+    limit are not spooled nor made into frames. Only a response sending
+    meta before data is dropped once limit rows are yielded.
+    """
+
+    def __init__(self, chunk_size=cDefaultChunkRows, limit=None, offset=0, typed=True, float32=False):
+        """ Init the assembler
+
+        :param chunk_size: Number of rows of every DataFrame, the last one may be shorter
+        :type chunk_size: int
+        :param limit: Max number of rows kept, None means all rows, it does not shorten the transfer
+        :type limit: int
+        :param offset: Number of rows skipped first
+        :type offset: int
+        :param typed: Infer the dtypes of the columns from the first chunk, see output_data_frame
+        :type typed: bool
+        :param float32: Store float features as float32, only if typed
+        :type float32: bool
+
+        """
+        self.chunk_size = chunk_size
+        self.limit = limit
+        self.offset = offset
+        self.typed = typed
+        self.float32 = float32
+        self._kinds = None
+
+        self._stream = JsonMemberStream("data", raw=True)
+        self._seen = 0
+        self._taken = 0
+        self._rows = []
+        self._spool = None
+
+    @property
+    def header(self):
+        meta = self._stream.members.get("meta")
+        return meta.get("header") if isinstance(meta, dict) else None
+
+    @property
+    def done(self):
+        """ Whether all the wanted rows are yielded, so the rest of the response can be dropped
+
+        It needs the header, so it is only true before the end of the
+        response if FATE Flow sent meta before data.
+        """
+        return self.header is not None and self.limit is not None and self._taken >= self.limit
+
+    def feed(self, data):
+        """ Parse the next bytes of the response
+
+        :returns: The DataFrames completed by these bytes, built while iterated
+        :rtype: generator of pandas.DataFrame
+
+        """
+        return self._take(self._stream.feed(data), False)
+
+    def close(self):
+        """ Parse the end of the response, raise if FATE Flow returned an error
+
+        :returns: The last DataFrames, built while iterated
+        :rtype: generator of pandas.DataFrame
+
+        """
+        rows = self._stream.close()
+        retcode = self._stream.members.get("retcode", 0)
+        if retcode != 0:
+            raise Exception("Failed to fetch output data: {}".format(
+                self._stream.members.get("retmsg")))
+        return self._take(rows, True)
+
+    def _take(self, rows, final):
+        if self.offset > self._seen:
+            skipped = min(len(rows), self.offset - self._seen)
+            rows = rows[skipped:]
+            self._seen += skipped
+        if self.limit is not None:
+            rows = rows[:max(0, self.limit - self._taken)]
+        self._seen += len(rows)
+        self._taken += len(rows)
+
+        header = self.header
+        if header is None:
+            if rows:
+                self._spool_rows(rows)
+            if final and self._spool is not None:
+                raise Exception("Output data has no header")
+            return
+
+        if self._spool is not None:
+            yield from self._unspool(header)
+        self._rows.extend(rows)
+        while len(self._rows) >= self.chunk_size:
+            yield self._frame(self._rows[:self.chunk_size], header)
+            del self._rows[:self.chunk_size]
+        if (final or self.done) and self._rows:
+            yield self._frame(self._rows, header)
+            self._rows = []
+
+    def _frame(self, rows, header):
+        # the rows are JSON texts, decode them with one call
+        rows = json_loads("[{}]".format(",".join(rows)))
+        if not self.typed:
+            return pd.DataFrame(rows, columns=header)
+        # every chunk gets the dtypes of the first one
+        if self._kinds is None:
+            self._kinds = infer_kinds(rows, header)
+        return typed_frame(rows, header, self._kinds, self.float32)
+
+    def _spool_rows(self, rows):
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile("w+")
+        for row in rows:
+            # a raw new line of a JSON text is only whitespace
+            self._spool.write(row.replace("\n", " ") if "\n" in row else row)
+            self._spool.write("\n")
+
+    def _unspool(self, header):
+        spool, self._spool = self._spool, None
+        with spool:
+            spool.seek(0)
+            for line in spool:
+                self._rows.append(line)
+                if len(self._rows) >= self.chunk_size:
+                    yield self._frame(self._rows, header)
+                    self._rows = []
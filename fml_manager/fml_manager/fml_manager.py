@@ -10,20 +10,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import json
 import os
-import tarfile
 import requests
 import base64
 import random
 import time
 import subprocess
 import tempfile
+import queue
+import threading
 
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
+from email.message import Message
+from email.utils import collapse_rfc2231_value
+from urllib.parse import unquote, urlsplit
 from fml_manager.utils import file_utils
 from fml_manager.utils.core import get_lan_ip
+from fml_manager.utils.csv_stream import CsvBatchStream, cDefaultBatchRows
+from fml_manager.utils.fate_builders import QueryCondition
+from fml_manager.utils.frame_join import HashJoin
+from fml_manager.utils.multipart import MultipartFileStream, cDefaultBufferSize
+from fml_manager.utils.shards import ShardReader, merge_progress, split_lines
+from fml_manager.utils.tar_stream import extract_tar_stream
+from fml_manager.utils.upload_manifest import UploadManifest, cDefaultChunkSize
+from fml_manager import flow_requests, job_history, job_memo, job_snapshot, job_submitter
+from fml_manager.flow_requests import cDefaultChunkRows
+from fml_manager.admission import AdmissionController
+from fml_manager.job_waiter import Backoff, TERMINAL_STATUSES
+from fml_manager.job_history import JobHistory, cDefaultHistoryName
+from fml_manager.job_snapshot import JobSnapshot
+from fml_manager.job_watcher import JobWatcher
+from fml_manager.log_index import LogIndex, cDefaultIndexName
+from fml_manager.metric_watcher import MetricWatcher
+from fml_manager.response import FlowResponse
+from fml_manager.transport import HttpTransport, cDefaultPoolSize
 
 cFateFlowHostEnv = "FATE_FLOW_HOST"
 cFateServingHostEnv = "FATE_SERVING_HOST"
@@ -35,26 +58,22 @@ cFateServingServiePort = 8059
 
 cFateClusterCR = "fatecluster"
 
+#: Size of the blocks read from a streamed response
+cDefaultReadSize = 64 * 1024
 
-class FMLManager:
-    """FMLManager is used to communicate with FATE cluster"""
-
-    def __init__(self, server_conf=None, log_path="./"):
-        """ Init the FMLManager with config and log path
+#: Name of an upload from a url which gives none
+cDefaultUploadName = "upload.csv"
 
-        :param server_conf: Path to config file, default=None
-        :type server_conf: string
-        :param log_path: Path to log file, default=./
-        :type log_path: string
 
-        """
+class FMLManagerBase:
+    """FMLManagerBase locates the FATE Flow and FATE Serving services"""
 
+    def _init_urls(self, server_conf):
         #: Url of FATE Flow service
         self.server_url = None
 
         #: Url of FATE Serving service
         self.serving_url = None
-        self.log_path = log_path
 
         if server_conf is not None:
             self._init_from_config(server_conf)
@@ -102,26 +121,272 @@ class FMLManager:
         except Exception as e:
             print(e)
 
+    def _url(self, *path):
+        return "/".join([self.server_url] + list(path))
+
+    def _multipart(self, source, filename, size, buffer_size, progress, compress):
+        # a gzipped file is passed through, and stored under its name without .gz
+        precompressed = compress and filename.endswith(".gz")
+        if precompressed:
+            filename = filename[:-len(".gz")]
+        return MultipartFileStream(source, filename, size=size, buffer_size=buffer_size,
+                                   progress=progress, compress=compress, precompressed=precompressed)
+
+    def _upload_manifest(self, path, manifest_path, verify, chunk_size, namespace, table_name, work_mode, head, partition, drop):
+        if path.startswith("http://") or path.startswith("https://"):
+            raise Exception("Only a local file can be uploaded resumably.")
+        if path.endswith(".gz"):
+            raise Exception("A gzipped file cannot be split into chunks.")
+        if manifest_path is None:
+            manifest_path = path + ".manifest.json"
+        manifest = UploadManifest(manifest_path, path, namespace, table_name, str(head) == "1",
+                                  chunk_size, work_mode, partition, drop)
+        if manifest.load_or_plan(verify):
+            print("Resume the upload of {} after {} of {} chunks".format(
+                path, manifest.confirmed, len(manifest.chunks)))
+        return manifest
+
+    def _job_finished(self, response, job_id):
+        # record in the cache whether the job of a job query response is finished, or running
+        try:
+            status = flow_requests.job_status(response.json())
+        except (ValueError, KeyError, IndexError, TypeError):
+            return False
+        if status not in TERMINAL_STATUSES:
+            self.cache.set_running(self.server_url, job_id)
+            return False
+        self.cache.set_finished(self.server_url, job_id)
+        return True
+
+    def _memo_reuse(self, entry, status):
+        # the earlier response of an equal submission whose job succeeded or may still succeed
+        if entry is not None and status != entry.status:
+            self.memo.set_status(entry.key, status)
+        hit = entry is not None and job_memo.reusable(status)
+        self.memo.record_lookup(hit)
+        return FlowResponse.from_result(entry.result) if hit else None
+
+    def _memo_record(self, key, tables, response):
+        try:
+            result = response.json()
+        except ValueError:
+            return
+        self.memo.put(key, self.server_url, tables, result)
+
+    def _memo_touch(self, namespace, table_name):
+        # the jobs reading a table no longer match the earlier ones once it changes
+        if self.memo is not None:
+            self.memo.touch_table(self.server_url, namespace, table_name)
+
+    @staticmethod
+    def _cacheable(response):
+        # errors, e.g. of a component not run, are asked again next time
+        if response.status_code != 200:
+            return False
+        try:
+            result = response.json()
+        except ValueError:
+            return False
+        return isinstance(result, dict) and result.get("retcode") == 0
+
+    def _log_result(self, extract_dir, files):
+        return {'retcode': 0,
+                'directory': extract_dir,
+                'files': files,
+                'retmsg': 'download successfully, please check {} directory'.format(extract_dir)}
+
+    @staticmethod
+    def _join_sides(component_name, parties):
+        # (label, role, party_id, component_name) of every party of a join
+        sides = []
+        for party in parties:
+            role, party_id = party[0], party[1]
+            component = party[2] if len(party) > 2 else component_name
+            if component is None:
+                raise ValueError("No component for {} {}".format(role, party_id))
+            sides.append(("{}_{}".format(role, party_id), role, party_id, component))
+        return sides
+
+    @staticmethod
+    def _is_log_archive(status_code, headers):
+        # FATE Flow answers a job without log with a JSON error
+        return status_code == 200 and not headers.get("Content-Type", "").startswith("application/json")
+
+    @property
+    def log_index(self):
+        """ LogIndex of the job logs fetched to log_path, see fetch_job_logs
+        """
+        if self._log_index is None:
+            self._log_index = LogIndex(os.path.join(self.log_path, cDefaultIndexName))
+        return self._log_index
+
+    @property
+    def job_history(self):
+        """ JobHistory of the jobs of the cluster in log_path, see sync_job_history
+        """
+        if self._job_history is None:
+            self._job_history = JobHistory(os.path.join(self.log_path, cDefaultHistoryName))
+        return self._job_history
+
+    def _extract_log(self, fileobj, job_id, extract_dir, members, index):
+        if index is None or index is False:
+            return extract_tar_stream(fileobj, extract_dir, members)
+        if index is True:
+            index = self.log_index
+        with index.indexer(job_id, extract_dir) as indexer:
+            return extract_tar_stream(fileobj, extract_dir, members, observer=indexer)
+
+    def _extract_pipe(self, pipe, job_id, extract_dir, members, index):
+        try:
+            return self._extract_log(pipe, job_id, extract_dir, members, index)
+        finally:
+            # release the writer whether the archive ends early or is broken
+            pipe.abort()
+
+
+class FMLManager(FMLManagerBase):
+    """FMLManager is used to communicate with FATE cluster"""
+
+    def __init__(self, server_conf=None, log_path="./", transport=None, pool_size=cDefaultPoolSize, timeout=None, cache=None, memo=None):
+        """ Init the FMLManager with config and log path
+
+        :param server_conf: Path to config file, default=None
+        :type server_conf: string
+        :param log_path: Path to log file, default=./
+        :type log_path: string
+        :param transport: Transport shared with other managers, a new one is created if None
+        :type transport: HttpTransport
+        :param pool_size: Max keep-alive connections of the new transport, default=10
+        :type pool_size: int
+        :param timeout: Default timeout in seconds of every call, default=None
+        :type timeout: float or tuple
+        :param cache: Cache of the tracking results of finished jobs, default=None for no cache
+        :type cache: ResultCache
+        :param memo: Memo of the submitted jobs, an equal submission returns the earlier job, default=None for no memo
+        :type memo: JobMemo
+
+        """
+        self.log_path = log_path
+
+        #: Pooled HTTP transport, pass it to other managers to share the connections
+        if transport is None:
+            transport = HttpTransport(pool_size=pool_size, timeout=timeout)
+        self.transport = transport
+
+        #: Timeout of calls made by this manager, fallback to the transport's one if None
+        self.timeout = timeout
+
+        #: Cache of the tracking results of finished jobs, may be shared by managers
+        self.cache = cache
+
+        #: Memo of the submitted jobs, may be shared by managers
+        self.memo = memo
+
+        self._metric_watcher = None
+        self._job_watcher = None
+        self._admission = None
+        self._watcher_lock = threading.Lock()
+        self._log_index = None
+        self._job_history = None
+
+        self._init_urls(server_conf)
+
+    def with_timeout(self, timeout):
+        """ Return a manager sharing this one's transport with another timeout
+
+        e.g. manager.with_timeout(5).query_job(query_condition)
+
+        :param timeout: Timeout in seconds of calls made by the returned manager
+        :type timeout: float or tuple
+
+        :rtype: FMLManager
+
+        """
+        manager = copy.copy(self)
+        manager.timeout = timeout
+        return manager
+
+    @property
+    def metric_watcher(self):
+        """ MetricWatcher polling the metrics tailed by watch_metrics
+        """
+        with self._watcher_lock:
+            if self._metric_watcher is None:
+                self._metric_watcher = MetricWatcher(self)
+            return self._metric_watcher
+
+    @property
+    def job_watcher(self):
+        """ JobWatcher caching the status of the jobs for every caller sharing this manager
+        """
+        with self._watcher_lock:
+            if self._job_watcher is None:
+                self._job_watcher = JobWatcher(self)
+            return self._job_watcher
+
+    @property
+    def admission(self):
+        """ AdmissionController holding the submissions of every caller sharing this manager until the cluster has room
+        """
+        job_watcher = self.job_watcher
+        with self._watcher_lock:
+            if self._admission is None:
+                self._admission = AdmissionController(self, watcher=job_watcher)
+            return self._admission
+
+    def close(self):
+        """ Close the pooled connections of the transport
+        """
+        if self._admission is not None:
+            self._admission.close()
+        if self._metric_watcher is not None:
+            self._metric_watcher.close()
+        if self._job_watcher is not None:
+            self._job_watcher.close()
+        if self._log_index is not None:
+            self._log_index.close()
+        if self._job_history is not None:
+            self._job_history.close()
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     # Job management
 
-    def submit_job(self, dsl, config):
+    def submit_job(self, dsl, config, force=False):
         """ Submit job to FATE cluster
 
+        With a memo, the response of an equal earlier submission is returned
+        if its job succeeded or is still running, see JobMemo.
+
         :param dsl: DSL definition
         :type dsl: Pipline
         :param config: Config definition
         :type config: Config
+        :param force: Submit even if the memo holds an equal job, the memo then records the new one, default=False
+        :type force: bool
 
         :returns: response
         :rtype: dict
 
         """
-        post_data = {'job_dsl': dsl,
-                     'job_runtime_conf': config}
-        response = requests.post(
-            "/".join([self.server_url, "job", "submit"]), json=post_data)
-
-        return self.prettify(response)
+        request = flow_requests.submit_job(dsl, config)
+        if self.memo is None:
+            return self._call(request)
+        key, tables = self.memo.key(self.server_url, dsl, config)
+        entry = None if force else self.memo.get(key)
+        status = None if entry is None else entry.status
+        if entry is not None and status not in TERMINAL_STATUSES:
+            status = self._query_status(entry.job_id)
+        response = self._memo_reuse(entry, status)
+        if response is None:
+            response = self._call(request)
+            self._memo_record(key, tables, response)
+        return response
 
     def submit_job_by_files(self, dsl_path, config_path):
         """ Submit job with file to FATE cluster
@@ -135,40 +400,62 @@ class FMLManager:
         :rtype: dict
 
         """
-
-        config_data = {}
-        if config_path:
-            config_path = os.path.abspath(config_path)
-            with open(config_path, 'r') as f:
-                config_data = json.load(f)
-        else:
-            raise Exception('Conf cannot be null.')
-        dsl_data = {}
-        if dsl_path:
-            dsl_path = os.path.abspath(dsl_path)
-            with open(dsl_path, 'r') as f:
-                dsl_data = json.load(f)
-        else:
-            raise Exception('DSL_path cannot be null.')
+        dsl_data, config_data = flow_requests.load_job_files(
+            dsl_path, config_path)
 
         return self.submit_job(dsl_data, config_data)
 
-    def query_job_status(self, query_conditions, max_tries=200):
-        """ Fetch status of job
+    def submit_jobs(self, jobs, parallelism=4, rate_limit=None):
+        """ Submit many jobs, e.g. the points of a hyperparameter sweep
+
+        A failed submission does not abort the batch, its error is kept in
+        the result. Results are yielded as soon as they complete, use
+        result.index to match them with the jobs.
+
+        :param jobs: Iterable of (dsl, config), both can be Pipeline/Config instances or dicts
+        :type jobs: iterable
+        :param parallelism: Max number of submissions in flight, default=4
+        :type parallelism: int
+        :param rate_limit: Max number of submissions per second, default=None for no limit
+        :type rate_limit: float
+
+        :rtype: generator of SubmitResult
+
+        """
+        return job_submitter.submit_jobs(self.submit_job, jobs, parallelism, rate_limit)
+
+    def query_job_status(self, query_conditions, max_tries=200, backoff=None, timeout=None):
+        """ Wait until the job reaches a terminal status
+
+        The job is polled with growing intervals, to wait for many jobs at
+        once use JobWaiter. The wait is bounded by time instead of by the
+        number of polls, by default max_tries seconds like the former polls
+        of one second each.
 
         :param query_conditions: Condition of the job
         :type query_conditions: dict
+        :param max_tries: Default timeout in seconds, kept from the polls of one second, default=200
+        :type max_tries: int
+        :param backoff: Polling intervals, default=Backoff()
+        :type backoff: Backoff
+        :param timeout: Total time in seconds to wait, default=max_tries
+        :type timeout: float
 
-        :returns: response
-        :rtype: dict
+        :returns: Terminal status of the job
+        :rtype: string
 
         """
+        if backoff is None:
+            backoff = Backoff()
         job_status = "failed"
-        for i in range(max_tries):
-            time.sleep(1)
+        guest_status = None
+        if timeout is None:
+            timeout = max_tries
+        for interval in backoff.intervals(timeout):
+            time.sleep(interval)
             try:
-                guest_status = self.query_job(query_conditions).json()[
-                    "data"][0]["f_status"]
+                guest_status = flow_requests.job_status(
+                    self.query_job(query_conditions).json())
             except Exception as e:
                 print("Failed to fetch status: ", e)
 
@@ -176,11 +463,18 @@ class FMLManager:
             if guest_status == "failed":
                 job_status = "failed"
                 raise Exception("Failed to upload data.")
-            if guest_status == "success":
-                job_status = "success"
+            if guest_status in TERMINAL_STATUSES:
+                job_status = guest_status
                 break
         return job_status
 
+    def _query_status(self, job_id):
+        # the status of a job, None if FATE Flow does not know it
+        try:
+            return flow_requests.job_status(self._call(flow_requests.query_job(QueryCondition(job_id))).json())
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
     def query_job(self, query_conditions):
         """ Fetch job
 
@@ -191,10 +485,7 @@ class FMLManager:
         :rtype: dict
 
         """
-
-        response = requests.post(
-            "/".join([self.server_url, "job", "query"]), json=query_conditions.to_dict())
-        return self.prettify(response)
+        return self._call(flow_requests.query_job(query_conditions))
 
     def query_job_conf(self, query_conditions):
         """ Fetch config of job
@@ -206,10 +497,64 @@ class FMLManager:
         :rtype: dict
 
         """
+        return self._call(flow_requests.query_job_conf(query_conditions))
+
+    def snapshot_job(self, job_id, role, party_id, output_data=True):
+        """ Fetch the status, config, tasks, metrics and outputs of a job for a party in one call
+
+        The status is queried first, so that the other calls of a finished
+        job are answered by the cache if the manager has one. The config,
+        tasks and job data are then fetched concurrently, and the tracking
+        calls of every component of the DSL as soon as the config is in, e.g.
+
+            snapshot = manager.snapshot_job(job_id, "guest", 9999)
+            snapshot.components["hetero_lr_0"].metrics
+            print(snapshot.timing_frame())
+
+        :param job_id: The UUID of job
+        :type job_id: string
+
+        :param role: Role of the party, e.g. guest
+        :type role: string
+
+        :param party_id: Id of the party
+        :type party_id: int
 
-        response = requests.post(
-            "/".join([self.server_url, "job", "config"]), json=query_conditions)
-        return self.prettify(response)
+        :param output_data: Fetch the output data of the components, default=True
+        :type output_data: bool
+
+        :rtype: JobSnapshot
+
+        """
+        start = time.perf_counter()
+        snapshot = JobSnapshot(job_id, role, party_id)
+
+        def fetch(call, cached=True):
+            endpoint, component, request = call
+            begin = time.perf_counter()
+            try:
+                response = self._send_cached(job_id, request) if cached else FlowResponse.of(self._send(request))
+            except Exception as e:
+                snapshot.record(endpoint, component, error=e, seconds=time.perf_counter() - begin)
+                return None
+            snapshot.record(endpoint, component, response, seconds=time.perf_counter() - begin)
+            return response
+
+        response = fetch(("job", None, flow_requests.query_job(QueryCondition(job_id))), cached=False)
+        if response is not None and self.cache is not None:
+            self._job_finished(response, job_id)
+
+        with ThreadPoolExecutor(max_workers=self.transport.pool_size) as executor:
+            futures = [executor.submit(fetch, call) for call in job_snapshot.job_requests(job_id, role, party_id)]
+            futures[0].result()
+            futures += [executor.submit(fetch, call)
+                        for name in snapshot.component_names()
+                        for call in job_snapshot.component_requests(job_id, role, party_id, name, output_data)]
+            for future in futures:
+                future.result()
+
+        snapshot.elapsed = time.perf_counter() - start
+        return snapshot
 
     def stop_job(self, job_id):
         """ Stop job
@@ -221,58 +566,85 @@ class FMLManager:
         :rtype: dict
 
         """
-        post_data = {
-            'job_id': job_id
-        }
-        response = requests.post(
-            "/".join([self.server_url, "job", "stop"]), json=post_data)
-        return self.prettify(response)
+        return self._call(flow_requests.stop_job(job_id))
 
     def update_job(self, job_id, role, party_id, notes):
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "notes": notes
-        }
-        response = requests.post(
-            "/".join([self.server_url, "job", "update"]), json=post_data)
-        return self.prettify(response)
+        return self._call(flow_requests.update_job(job_id, role, party_id, notes))
 
-    def fetch_job_log(self, job_id):
+    def fetch_job_log(self, job_id, compress=True, members=None, index=None):
         """ Fetch the log of job
 
+        The archive is extracted to log_path while it is received, it is
+        never written to disk. To fetch a part of the log, e.g. the errors
+        of the guest
+
+            manager.fetch_job_log(job_id, members="guest/*ERROR*")
+
         :param job_id: The UUID of job
         :type job_id: string
 
+        :param compress: Accept a gzip or deflate encoded response, default=True
+        :type compress: bool
+
+        :param members: Glob patterns of the files to extract, or a predicate on the name, default=None for all
+        :type members: string, list or callable
+
+        :param index: LogIndex updated while extracting, True for log_index, default=None for no index
+        :type index: LogIndex or bool
+
         :returns: response
         :rtype: dict
 
         """
-        data = {
-            "job_id": job_id
-        }
-
-        tar_file_name = 'job_{}_log.tar.gz'.format(job_id)
         extract_dir = os.path.join(self.log_path, 'job_{}_log'.format(job_id))
-        with closing(requests.get("/".join([self.server_url, "job", "log"]), json=data,
-                                  stream=True)) as response:
-            if response.status_code == 200:
-                self.__download_from_request(
-                    http_response=response, tar_file_name=tar_file_name, extract_dir=extract_dir)
-                response = {'retcode': 0,
-                            'directory': extract_dir,
-                            'retmsg': 'download successfully, please check {} directory, file name is {}'.format(extract_dir, tar_file_name)}
-
-                return self.prettify(response, True)
-            else:
-                return self.prettify(response, True)
+        with closing(self._send(flow_requests.fetch_job_log(job_id, compress))) as response:
+            if not self._is_log_archive(response.status_code, response.headers):
+                return FlowResponse.of(response)
+            # the raw stream is decoded from its Content-Encoding while it is read
+            response.raw.decode_content = True
+            files = self._extract_log(response.raw, job_id, extract_dir, members, index)
+
+        return FlowResponse.of(self._log_result(extract_dir, files))
+
+    def fetch_job_logs(self, job_ids, parallelism=4, members=None, index=True):
+        """ Fetch the logs of many jobs at once and index them
+
+        Every log is extracted as by fetch_job_log and indexed while it is
+        extracted, so the records can then be searched without reading the
+        logs again, e.g. the errors of a component in the last 300 jobs
+
+            manager.fetch_job_logs(job_ids, parallelism=8)
+            manager.log_index.search(component="hetero_lr_0", level="ERROR", last=300)
+
+        :param job_ids: The UUIDs of jobs
+        :type job_ids: list
+
+        :param parallelism: Max number of logs fetched at once, default=4
+        :type parallelism: int
+
+        :param members: Glob patterns of the files to extract, or a predicate on the name, default=None for all
+        :type members: string, list or callable
+
+        :param index: LogIndex updated while extracting, default=True for log_index, None for no index
+        :type index: LogIndex or bool
+
+        :returns: Job id to the response of fetch_job_log
+        :rtype: dict
+
+        """
+        job_ids = list(job_ids)
+        if index is True:
+            index = self.log_index
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            responses = executor.map(
+                lambda job_id: self.fetch_job_log(job_id, members=members, index=index), job_ids)
+            return dict(zip(job_ids, responses))
 
     # Data management
-    def load_data(self, url, namespace, table_name, work_mode, head, partition, drop="1", api_version="1.4"):
+    def load_data(self, url, namespace, table_name, work_mode, head, partition, drop="1", api_version="1.4", progress=None, buffer_size=cDefaultBufferSize, allow_chunked=False, parallel=False, compress=False, resumable=False, chunk_size=cDefaultChunkSize, manifest=None, verify=False):
         """ Upload data to FATE cluster
 
-        :param url: URL of data to upload
+        :param url: Path or http(s) URL of data to upload, a URL with a known length is piped to FATE Flow without touching the disk
         :type url: string
 
         :param namespace: Namespace of the data in FATE cluster
@@ -293,231 +665,214 @@ class FMLManager:
         :param drop: Flag to overwrite data with same identifier
         :type drop: string
 
-        :returns: response
-        :rtype: dict
+        :param progress: Called with (sent bytes, total bytes, bytes per second) while uploading
+        :type progress: callable
+
+        :param buffer_size: Size in bytes of the blocks streamed from the file, default=1MB
+        :type buffer_size: int
+
+        :param allow_chunked: Pipe a http(s) url of unknown length with chunked transfer encoding instead of spooling it to a temp file, only if FATE Flow accepts chunked requests
+        :type allow_chunked: bool
+
+        :param parallel: Split the file on line boundaries into one shard per partition and upload the shards concurrently
+        :type parallel: bool
+
+        :param resumable: Upload a local file in chunks and record the chunks confirmed by FATE Flow in a manifest, so calling load_data again after a failure resumes after the last confirmed chunk
+        :type resumable: bool
+
+        :param chunk_size: Approximate size in bytes of the chunks of a resumable upload, default=256MB
+        :type chunk_size: int
+
+        :param manifest: Path of the manifest of a resumable upload, default=<url>.manifest.json
+        :type manifest: string
+
+        :param verify: Hash every confirmed chunk again on resume, not only the last one, default=False
+        :type verify: bool
+
+        :param compress: Send the upload with gzip content encoding and chunked transfer encoding, only if FATE Flow decodes gzip requests. A .gz file is sent as is with Content-Length
+        :type compress: bool
+
+        :returns: response, or the responses of the shards or chunks in order if parallel or resumable
+        :rtype: dict or list
 
         """
-        if api_version == "1.4":
-            temp_file = None
-            if url.startswith("http://") or url.startswith("https://"):
-                downloader = HttpDownloader(url)
-                temp_file = downloader.download_to(
-                    file_utils.get_project_base_directory())
-                url = temp_file
-
-            post_data = {
-                "namespace": namespace,
-                "table_name": table_name,
-                "work_mode": work_mode,
-                "head": head,
-                "partition": partition,
-                "drop": drop
-            }
-            data_files = {
-                "file": open(url, "rb")
-            }
-            response = requests.post(
-                "/".join([self.server_url, "data", "upload"]), params=post_data, files=data_files)
+        request = flow_requests.load_data(
+            url, namespace, table_name, work_mode, head, partition, drop, api_version)
+        self._memo_touch(namespace, table_name)
+        if api_version != "1.4":
+            return self._call(request)
+        if resumable:
+            return self._upload_resumable(url, manifest, verify, chunk_size, namespace, table_name, work_mode,
+                                          head, partition, drop, buffer_size, progress, compress)
+
+        temp_file = None
+        if url.startswith("http://") or url.startswith("https://"):
+            downloader = HttpDownloader(url, self.transport, buffer_size)
+            source = downloader.open()
+            size = downloader.content_length(source.headers)
+            # a compressed body is chunked anyway
+            if size is not None or allow_chunked or compress:
+                # pipe the remote body straight into the upload
+                with closing(source):
+                    return self._upload(request, source.raw, downloader.filename(source.headers),
+                                        size, buffer_size, progress, compress)
+
+            # FATE Flow needs the length of the upload, spool the data to disk first
+            temp_file = downloader.download_to(
+                file_utils.get_project_base_directory(), source)
+            url = temp_file
 
+        try:
+            ranges = []
+            if parallel and url.endswith(".gz"):
+                raise Exception("A gzipped file cannot be split into shards.")
+            if parallel:
+                header, ranges = split_lines(
+                    url, int(partition), str(head) == "1")
+            if len(ranges) > 1:
+                response = self._upload_shards(url, header, ranges, namespace, table_name, work_mode,
+                                               head, partition, drop, buffer_size, progress, compress)
+            else:
+                with open(url, "rb") as data_file:
+                    response = self._upload(request, data_file, os.path.basename(url),
+                                            os.fstat(data_file.fileno()).st_size, buffer_size, progress, compress)
+        finally:
             if temp_file is not None and os.path.exists(temp_file):
                 print("Delete temp file...")
                 os.remove(temp_file)
-        else:
-            post_data = {
-                "file": url,
-                "namespace": namespace,
-                "table_name": table_name,
-                "work_mode": work_mode,
-                "head": head,
-                "partition": partition
-            }
-            response = requests.post(
-                "/".join([self.server_url, "data", "upload"]), json=post_data)
 
-        return self.prettify(response)
+        return response
+
+    def load_dataframe(self, data, namespace, table_name, work_mode, partition, drop="1", index=False, batch_rows=cDefaultBatchRows, progress=None, buffer_size=cDefaultBufferSize, allow_chunked=False, compress=False):
+        """ Upload a DataFrame, an Arrow table or a Parquet file to FATE cluster
+
+        The CSV with a head line is rendered in batches while it is uploaded,
+        no CSV file is written. The CSV is rendered twice, once to measure
+        its length and once to send it, unless it is sent chunked.
+
+        :param data: pandas DataFrame, pyarrow Table or path of a Parquet file, the last two require pyarrow
+        :type data: object
+
+        :param namespace: Namespace of the data in FATE cluster
+        :type namespace: string
+
+        :param table_name: Table name of the data in FATE cluster
+        :type table_name: string
+
+        :param work_mode: The work mode of upload
+        :type work_mode: int
+
+        :param partition: Partitions of the upload data
+        :type partition: int
+
+        :param drop: Flag to overwrite data with same identifier
+        :type drop: string
+
+        :param index: Write the index of a DataFrame as the first column, default=False
+        :type index: bool
+
+        :param batch_rows: Number of rows rendered to CSV at once, default=50000
+        :type batch_rows: int
+
+        :param progress: Called with (sent bytes, total bytes, bytes per second) while uploading
+        :type progress: callable
+
+        :param buffer_size: Size in bytes of the blocks streamed, default=1MB
+        :type buffer_size: int
+
+        :param allow_chunked: Send the CSV with chunked transfer encoding in one pass, only if FATE Flow accepts chunked requests
+        :type allow_chunked: bool
+
+        :param compress: Send the upload with gzip content encoding, see load_data
+        :type compress: bool
+
+        :returns: response
+        :rtype: dict
+
+        """
+        request = flow_requests.load_data(
+            None, namespace, table_name, work_mode, 1, partition, drop)
+        self._memo_touch(namespace, table_name)
+        source = CsvBatchStream(data, index, batch_rows)
+        if not (allow_chunked or compress):
+            source.measure()
+        return self._upload(request, source, "{}.csv".format(table_name),
+                            source.size, buffer_size, progress, compress)
 
     def query_data(self, job_id, limit):
         """ Query data of job
         """
-        post_data = {
-            "job_id": job_id,
-            "limit": limit
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "data", "upload", "history"]), json=post_data)
+        return self._call(flow_requests.query_data(job_id, limit))
 
-        return self.prettify(response)
+    def delete_table(self, namespace, table_name):
+        """ Delete a table from FATE cluster
+        """
+        self._memo_touch(namespace, table_name)
+        return self._call(flow_requests.delete_table(namespace, table_name))
 
     # The data is download to fateflow. FATE not ready to download to local.
     def download_data(self, namespace, table_name, filename, work_mode, delimitor, output_folder="./"):
         """ Download data to local
         """
-
-        DEFAULT_DATA_FOLDER = "/data/projects/fate/python/download_dir"
-        output_path = "{}/{}".format(DEFAULT_DATA_FOLDER, filename)
-        post_data = {
-            "namespace": namespace,
-            "table_name": table_name,
-            "work_mode": work_mode,
-            "delimitor": delimitor,
-            "output_path": output_path
-        }
-        response = requests.post(
-            "/".join([self.server_url, "data", "download"]), json=post_data)
+        response = self._send(flow_requests.download_data(
+            namespace, table_name, filename, work_mode, delimitor))
 
         if response.status_code == 200:
-            output = json.loads(response.content)
+            output = FlowResponse.of(response).json()
             job_id = output["jobId"]
             query_condition = {
                 "job_id": job_id
             }
-            for i in range(500):
-                time.sleep(1)
-                status = self.query_job(query_condition).json()[
-                    "data"][0]["f_status"]
+            for interval in Backoff().intervals(500):
+                time.sleep(interval)
+                status = flow_requests.job_status(
+                    self.query_job(query_condition).json())
                 if status == "failed":
                     print("Failed")
                     print(self.query_job(query_condition).json())
                     raise Exception("Failed to download data.")
                 if status == "success":
-                    return self.prettify(response, True)
+                    return FlowResponse.of(response)
         response = {
             'retcode': 1,
             'retmsg': 'Download failed'
         }
 
-        return self.prettify(response, True)
+        return FlowResponse.of(response)
 
     # Model management
     def load_model(self, initiator_party_id, federated_roles, work_mode, model_id, model_version):
-        post_data = {
-            "initiator": {
-                "party_id": initiator_party_id,
-                "role": "guest"
-            },
-            "role": federated_roles,
-            "job_parameters": {
-                "work_mode": work_mode,
-                "model_id": model_id,
-                "model_version": model_version
-            }
-        }
-        response = requests.post(
-            "/".join([self.server_url, "model", "load"]), json=post_data)
-
-        return self.prettify(response)
+        return self._call(flow_requests.load_model(
+            initiator_party_id, federated_roles, work_mode, model_id, model_version))
 
     def bind_model(self, service_id, initiator_party_id, federated_roles, work_mode, model_id, model_version):
-        if self.serving_url == nil:
-            raise Exception(
-                'Federated Serving is not deployed or not correctly configured yet. ')
-        post_data = {
-            "service_id": service_id,
-            "initiator": {
-                "party_id": initiator_party_id,
-                "role": "guest"
-            },
-            "role": federated_roles,
-            "job_parameters": {
-                "work_mode": work_mode,
-                "model_id": model_id,
-                "model_version": model_version
-            },
-            "servings": self.serving_url
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "model", "bind"]), json=post_data)
-        return self.prettify(response)
+        return self._call(flow_requests.bind_model(
+            self.serving_url, service_id, initiator_party_id, federated_roles, work_mode, model_id, model_version))
 
     def print_model_version(self, role, party_id, model_id, api_version="1.4"):
         """ Print model version
         """
-
-        action = "version"
-        if api_version == "1.4":
-            action = "version_history"
-
-        namespace = "#".join([role, str(party_id), model_id])
-        post_data = {
-            "namespace": namespace
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "model", action]), json=post_data)
-
-        return self.prettify(response, True)
+        return self._call(flow_requests.print_model_version(
+            role, party_id, model_id, api_version))
 
     def model_output(self, role, party_id, model_id, model_version, model_component):
         """ Output the model
         """
+        response = self._send(flow_requests.model_output(
+            role, party_id, model_id, model_version))
+        model = flow_requests.parse_model_output(
+            FlowResponse.of(response).json(), model_component)
 
-        namespace = "#".join([role, str(party_id), model_id])
-        post_data = {
-            "name": model_version,
-            "namespace": namespace
-        }
-        response = requests.post(
-            "/".join([self.server_url, "model", "transfer"]), json=post_data)
-        model = json.loads(response.content)
-        if model["data"] != "":
-            en_model_metadata = model["data"]["%sMeta" % model_component]
-            en_model_parameters = model["data"]["%sParam" % model_component]
-
-        model = {
-            "metadata": en_model_metadata,
-            "parameters": en_model_parameters
-        }
-
-        return self.prettify(model, True)
+        return FlowResponse.of(model)
 
     def offline_predict_on_dataset(self, is_vertical, initiator_party_role, initiator_party_id, work_mode, model_id, model_version, federated_roles, guest_data_name="", guest_data_namespace="", host_data_name="", host_data_namespace=""):
         if is_vertical:
             print("This API is not support vertical federated machine learning yet. ")
             return
 
-        # For predict job, dsl is empty dict.
-        dsl = {}
-
-        config = {
-            "initiator": {
-                "role": initiator_party_role,
-                "party_id": initiator_party_id
-            },
-            "job_parameters": {
-                "work_mode": work_mode,
-                "job_type": "predict",
-                "model_id": model_id,
-                "model_version": model_version
-            },
-            "role": federated_roles,
-            "role_parameters": {}
-        }
-
-        if guest_data_name != "" or guest_data_namespace != "":
-            if initiator_party_role != "guest":
-                raise Exception("Initiator not has data sets.")
-
-            guest_parameters = {
-                "args": {
-                    "data": {
-                        "eval_data": [{"name": guest_data_name, "namespace": guest_data_namespace}]
-                    }
-                }
-            }
-
-            config["role_parameters"]["guest"] = guest_parameters
-
-        if host_data_name != "" or host_data_namespace != "":
-            host_parameters = {
-                "args": {
-                    "data": {
-                        "eval_data": [{"name": host_data_name, "namespace": host_data_namespace}]
-                    }
-                }
-            }
-            config["role_parameters"]["host"] = guest_parameters
+        dsl, config = flow_requests.offline_predict_job(
+            initiator_party_role, initiator_party_id, work_mode, model_id, model_version, federated_roles,
+            guest_data_name, guest_data_namespace, host_data_name, host_data_namespace)
 
         return self.submit_job(dsl, config)
 
@@ -525,53 +880,61 @@ class FMLManager:
     def query_task(self, query_conditions):
         """ Query task
         """
+        return self._call(flow_requests.query_task(query_conditions))
 
-        response = requests.post(
-            "/".join([self.server_url, "job", "task", "query"]), json=query_conditions)
-        return self.prettify(response)
+    def sync_job_history(self, conditions=None, tasks=True, history=None):
+        """ Record the new and changed jobs of the cluster in a JobHistory, with their tasks
+
+        FATE Flow lists no job for a query without conditions, so the jobs are
+        listed by one query per status, or per given conditions. Only the jobs
+        new or changed since the last sync are written and have their tasks
+        queried, at once.
+
+        :param conditions: Conditions of the job query, e.g. {"tag": "sweep"}, or a list of them, default=None for a query per status of cSyncStatuses
+        :type conditions: dict, QueryCondition or list
+        :param tasks: Query the tasks of the new and changed jobs, default=True
+        :type tasks: bool
+        :param history: History updated, default=None for job_history
+        :type history: JobHistory
+
+        :returns: Number of job rows written
+        :rtype: int
+
+        """
+        if history is None:
+            history = self.job_history
+        queries = job_history.sync_conditions(conditions)
+        task_rows = {}
+        with ThreadPoolExecutor(max_workers=self.transport.pool_size) as executor:
+            responses = executor.map(
+                lambda condition: self._call(flow_requests.query_job(condition)), queries)
+            jobs = history.changed([job for response in responses
+                                    for job in job_history.query_rows(response.json())])
+            if tasks and jobs:
+                job_ids = sorted(set(job["f_job_id"] for job in jobs))
+                responses = list(executor.map(
+                    lambda job_id: self._call(flow_requests.query_task({"job_id": job_id})), job_ids))
+                task_rows = {job_id: job_history.query_rows(response.json())
+                             for job_id, response in zip(job_ids, responses)}
+        return history.record(jobs, task_rows)
 
     # Tracking
     def track_job_data(self, job_id, role, party_id):
         """ Track job data
         """
-
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "job", "data_view"]), json=post_data)
-        return self.prettify(response, True)
+        return self._call_cached(job_id, flow_requests.track_job_data(job_id, role, party_id))
 
     def track_component_all_metric(self, job_id, role, party_id, component_name):
         """ Track output all metric of component
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "metric", "all"]), json=post_data)
-        return self.prettify(response, True)
+        return self._call_cached(job_id, flow_requests.track_component_all_metric(
+            job_id, role, party_id, component_name))
 
     def track_component_metric_type(self, job_id, role, party_id, component_name):
         """ Track output metric type of component
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "metrics"]), json=post_data)
-        return self.prettify(response, True)
+        return self._call_cached(job_id, flow_requests.track_component_metric_type(
+            job_id, role, party_id, component_name))
 
     """
     metric_name and metric_namespace can be found in API track_component_metric_type
@@ -592,124 +955,444 @@ class FMLManager:
     def track_component_metric_data(self, job_id, role, party_id, component_name, metric_name, metric_namespace):
         """ Track output metric data of component
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name,
-            "metric_name": metric_name,
-            "metric_namespace": metric_namespace
-        }
+        return self._call_cached(job_id, flow_requests.track_component_metric_data(
+            job_id, role, party_id, component_name, metric_name, metric_namespace))
+
+    def get_metric_frame(self, job_ids, component_name, role, party_id, metrics=None):
+        """ Fetch the metric series of a component of many jobs as one DataFrame
+
+        The metric types of every job are discovered first, then all the
+        series are fetched concurrently, e.g. to plot the loss curves of a sweep
+
+            frame = manager.get_metric_frame(job_ids, "homo_lr_0", "guest", 10000, metrics=["loss"])
+            frame.xs("loss", level="metric")["value"].unstack("job_id").plot()
+
+        :param job_ids: The UUIDs of the jobs, or of one job
+        :type job_ids: list or string
+
+        :param component_name: Name of the component
+        :type component_name: string
+
+        :param role: Role of the party, e.g. guest
+        :type role: string
+
+        :param party_id: Id of the party
+        :type party_id: int
+
+        :param metrics: Metric names or (namespace, metric) pairs to fetch, default=None for all
+        :type metrics: list
+
+        :returns: A value column indexed by job_id, namespace, metric and step
+        :rtype: pandas.DataFrame
+
+        """
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+
+        def metric_type(job_id):
+            return self._send_cached(job_id, flow_requests.track_component_metric_type(
+                job_id, role, party_id, component_name)).json()
+
+        def metric_data(entry):
+            job_id, namespace, name = entry
+            return self._send_cached(job_id, flow_requests.track_component_metric_data(
+                job_id, role, party_id, component_name, name, namespace)).json()
+
+        with ThreadPoolExecutor(max_workers=self.transport.pool_size) as executor:
+            types = list(executor.map(metric_type, job_ids))
+            series = [(job_id, namespace, name)
+                      for job_id, result in zip(job_ids, types)
+                      for namespace, name in flow_requests.metric_names(result, metrics)]
+            results = list(executor.map(metric_data, series))
+
+        return flow_requests.metric_frame(
+            [entry + (result,) for entry, result in zip(series, results)])
+
+    def watch_metrics(self, job_id, component_name, role, party_id, metrics=None, watcher=None):
+        """ Tail the metrics of a running job
+
+        Yield the points of every series logged since the last poll, the
+        points already seen are not yielded again. The polls are frequent
+        while points arrive and slow down when the job logs nothing. The
+        generator ends when the job reaches a terminal status, e.g.
+
+            for update in manager.watch_metrics(job_id, "hetero_lr_0", "guest", 10000, metrics=["loss"]):
+                chart.extend(update.points)
+
+        All the watches of a manager are polled by its metric_watcher
+        thread, a component watched several times is polled once.
+
+        :param job_id: The UUID of job
+        :type job_id: string
+
+        :param component_name: Name of the component
+        :type component_name: string
 
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "metric_data"]), json=post_data)
-        return self.prettify(response, True)
+        :param role: Role of the party, e.g. guest
+        :type role: string
+
+        :param party_id: Id of the party
+        :type party_id: int
+
+        :param metrics: Metric names or (namespace, metric) pairs to watch, default=None for all
+        :type metrics: list
+
+        :param watcher: Watcher polling the metrics, default=None for the metric_watcher of the manager
+        :type watcher: MetricWatcher
+
+        :rtype: generator of MetricUpdate
+
+        """
+        if watcher is None:
+            watcher = self.metric_watcher
+        updates = queue.Queue()
+        future = watcher.watch(job_id, component_name, role,
+                               party_id, updates.put, metrics)
+        # the updates of the last poll are queued before the future is done
+        future.add_done_callback(lambda _: updates.put(None))
+        try:
+            while True:
+                update = updates.get()
+                if update is None:
+                    return
+                yield update
+        finally:
+            watcher.unwatch(future)
 
     def track_component_parameters(self, job_id, role, party_id, component_name):
         """ Track output parameter of component
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name
-        }
-
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "parameters"]), json=post_data)
-        return self.prettify(response, True)
+        return self._call_cached(job_id, flow_requests.track_component_parameters(
+            job_id, role, party_id, component_name))
 
     def track_component_output_model(self, job_id, role, party_id, component_name):
         """ Track output model of component
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name
-        }
+        return self._call_cached(job_id, flow_requests.track_component_output_model(
+            job_id, role, party_id, component_name))
 
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "output", "model"]), json=post_data)
-        return self.prettify(response, True)
-
-    def track_component_output_data(self, job_id, role, party_id, component_name):
+    def track_component_output_data(self, job_id, role, party_id, component_name, typed=True, float32=False):
         """ Track output data of component
 
+        The dtypes of the columns are inferred from the header and the first
+        rows: numbers for features, categoricals for ids and labels.
+        With a cache, the output of a finished job is read from disk.
+
+        :param typed: Infer the dtypes of the columns, otherwise every column is object, default=True
+        :type typed: bool
+
+        :param float32: Store float features as float32, default=False
+        :type float32: bool
+
         :rtype: pandas.DataFrame
         """
-        post_data = {
-            "job_id": job_id,
-            "role": role,
-            "party_id": party_id,
-            "component_name": component_name
-        }
+        response = self._send_cached(job_id, flow_requests.track_component_output_data(
+            job_id, role, party_id, component_name))
 
-        response = requests.post(
-            "/".join([self.server_url, "tracking", "component", "output", "data"]), json=post_data)
+        return flow_requests.output_data_frame(response.json(), typed, float32)
 
-        result = response.json()
-        data = result['data']
-        header = result['meta']['header']
+    def iter_component_output_data(self, job_id, role, party_id, component_name, chunk_size=cDefaultChunkRows, limit=None, offset=0, typed=True, float32=False):
+        """ Iterate the output data of component as DataFrames of chunk_size rows
 
-        return pd.DataFrame(data, columns=header)
+        The response is parsed while it is received, so the memory used does
+        not depend on the size of the output. limit cuts the rows kept, e.g.
+        for a quick look
 
-    # Utils
-    def prettify(self, response, verbose=False):
-        if verbose:
-            if isinstance(response, requests.Response):
-                if response.status_code == 200:
-                    print("Success!")
-                print(json.dumps(response.json(), indent=4, ensure_ascii=False))
-            else:
-                print(response)
+            first_rows = next(manager.iter_component_output_data(job_id, "guest", 10000, "dataio_0", limit=20))
+
+        FATE Flow sends the header of the rows after them, so the whole
+        response is still received, but the rows past limit are not kept,
+        see OutputDataFrames.
+
+        The response is not cached, it may be larger than the cache.
+
+        :param job_id: The UUID of job
+        :type job_id: string
+
+        :param role: Role of the party, e.g. guest
+        :type role: string
+
+        :param party_id: Id of the party
+        :type party_id: int
+
+        :param component_name: Name of the component
+        :type component_name: string
+
+        :param chunk_size: Number of rows of every DataFrame, default=10000
+        :type chunk_size: int
+
+        :param limit: Max number of rows, None means all rows, it does not shorten the transfer
+        :type limit: int
+
+        :param offset: Number of rows skipped first, default=0
+        :type offset: int
+
+        :param typed: Infer the dtypes of the columns from the first chunk, see track_component_output_data
+        :type typed: bool
+
+        :param float32: Store float features as float32, default=False
+        :type float32: bool
+
+        :rtype: generator of pandas.DataFrame
+
+        """
+        frames = flow_requests.OutputDataFrames(
+            chunk_size, limit, offset, typed, float32)
+        request = flow_requests.track_component_output_data(
+            job_id, role, party_id, component_name)
+        with closing(self._send(request, stream=True)) as response:
+            for data in response.iter_content(cDefaultReadSize):
+                yield from frames.feed(data)
+                if frames.done:
+                    return
+        yield from frames.close()
+
+    def join_component_output_data(self, job_id, component_name, parties, on="id", chunk_size=cDefaultChunkRows, typed=True, float32=False):
+        """ Join the output data of several parties of a vertical federated job on the sample id
+
+        The outputs of every party are streamed at once, and joined chunk
+        by chunk with a hash join, see HashJoin: the rows of the smallest
+        output are kept in memory, the rows of the others are not. E.g.
+        the predictions of the guest next to the features of the host
+
+            for frame in manager.join_component_output_data(
+                    job_id, "hetero_lr_0", [("guest", 9999), ("host", 10000, "dataio_0")]):
+                ...
+
+        :param job_id: The UUID of job
+        :type job_id: string
+
+        :param component_name: Name of the component of the parties without their own
+        :type component_name: string
 
+        :param parties: (role, party_id) or (role, party_id, component_name) of every party
+        :type parties: list
+
+        :param on: Name of the id column, default=id
+        :type on: string
+
+        :param chunk_size: Number of rows of the DataFrames read from every party, default=10000
+        :type chunk_size: int
+
+        :param typed: Infer the dtypes of the columns, see track_component_output_data
+        :type typed: bool
+
+        :param float32: Store float features as float32, default=False
+        :type float32: bool
+
+        :returns: The rows found in every output, columns of the same name are suffixed with role_party_id
+        :rtype: generator of pandas.DataFrame
+
+        """
+        sides = self._join_sides(component_name, parties)
+        join = HashJoin([side[0] for side in sides], on, chunk_size)
+        chunks = [queue.Queue(maxsize=2) for _ in sides]
+        stop = threading.Event()
+
+        def put(chunk_queue, item):
+            # give up once the consumer is gone
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def stream(chunk_queue, role, party_id, component):
+            try:
+                for frame in self.iter_component_output_data(
+                        job_id, role, party_id, component, chunk_size, typed=typed, float32=float32):
+                    if not put(chunk_queue, frame):
+                        return
+                put(chunk_queue, None)
+            except Exception as e:
+                put(chunk_queue, e)
+
+        with ThreadPoolExecutor(max_workers=len(sides)) as executor:
+            try:
+                for chunk_queue, (_, role, party_id, component) in zip(chunks, sides):
+                    executor.submit(stream, chunk_queue, role, party_id, component)
+                # a chunk of every side in turn, so the smallest output ends first
+                active = list(range(len(sides)))
+                while active:
+                    for index in list(active):
+                        item = chunks[index].get()
+                        if isinstance(item, Exception):
+                            raise item
+                        if item is None:
+                            active.remove(index)
+                            yield from join.end(sides[index][0])
+                        else:
+                            yield from join.feed(sides[index][0], item)
+            finally:
+                stop.set()
+
+    # Utils
+    def _send(self, request, **kwargs):
+        kwargs = dict(request.kwargs, **kwargs)
+        return self.transport.request(request.method, self._url(*request.path), timeout=self.timeout, **kwargs)
+
+    def _call(self, request, **kwargs):
+        return FlowResponse.of(self._send(request, **kwargs))
+
+    def _send_cached(self, job_id, request):
+        # a tracking call, answered from the cache once the job is finished
+        if self.cache is None:
+            return FlowResponse.of(self._send(request))
+        key = self.cache.key(self.server_url, request)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+        # the status is known before the result is fetched, so a stored
+        # result cannot be older than the end of the job, a job found
+        # running a moment ago is not queried again
+        finished = self.cache.is_finished(self.server_url, job_id) or (
+            not self.cache.is_running(self.server_url, job_id) and self._job_finished(
+                self._send(flow_requests.query_job(QueryCondition(job_id))), job_id))
+        response = FlowResponse.of(self._send(request))
+        if finished and self._cacheable(response):
+            self.cache.put(key, response)
         return response
 
+    def _call_cached(self, job_id, request):
+        return FlowResponse.of(self._send_cached(job_id, request))
+
+    def _upload(self, request, source, filename, size, buffer_size, progress, compress=False):
+        body = self._multipart(source, filename, size,
+                               buffer_size, progress, compress)
+        # requests only sends a body without a length chunked when it is an iterator
+        data = body if body.length is not None else iter(body)
+        return self._call(request, data=data, headers=body.headers)
+
+    def _upload_resumable(self, path, manifest_path, verify, chunk_size, namespace, table_name, work_mode, head, partition, drop, buffer_size, progress, compress):
+        manifest = self._upload_manifest(
+            path, manifest_path, verify, chunk_size, namespace, table_name, work_mode, head, partition, drop)
+        # the upload jobs run concurrently, so the table is dropped once before the first chunk
+        if str(drop) == "1" and manifest.confirmed == 0:
+            self.delete_table(namespace, table_name)
+        request = flow_requests.load_data(
+            path, namespace, table_name, work_mode, head, partition, "0")
+        filename = os.path.basename(path)
+        responses = []
+        for index in manifest.pending():
+            chunk = manifest.chunks[index]
+            with ShardReader(path, chunk["start"], chunk["end"], manifest.header, digest=True) as shard:
+                response = self._upload(request, shard, "{}.{}".format(filename, index),
+                                        shard.size, buffer_size, progress, compress)
+            result = response.json()
+            if result.get("retcode") != 0:
+                raise Exception("Failed to upload chunk {} of {}: {}".format(
+                    index, path, result.get("retmsg")))
+            manifest.confirm(index, shard.digest.hexdigest(), result.get("jobId"))
+            responses.append(response)
+        manifest.remove()
+        return responses
+
+    def _upload_shards(self, path, header, ranges, namespace, table_name, work_mode, head, partition, drop, buffer_size, progress, compress):
+        # the shards are appended to the table, so it is dropped once up front
+        if str(drop) == "1":
+            self.delete_table(namespace, table_name)
+        request = flow_requests.load_data(
+            path, namespace, table_name, work_mode, head, partition, "0")
+        filename = os.path.basename(path)
+        reports = merge_progress(progress, len(ranges))
+
+        def upload(index):
+            start, end = ranges[index]
+            with ShardReader(path, start, end, header) as shard:
+                return self._upload(request, shard, "{}.{}".format(filename, index),
+                                    shard.size, buffer_size, reports[index], compress)
+
+        workers = min(len(ranges), self.transport.pool_size)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(upload, range(len(ranges))))
+
     def __download_data_from_request(self, http_response, output):
         with open(output, 'wb') as fw:
             for chunk in http_response.iter_content(1024):
                 if chunk:
                     fw.write(chunk)
 
-    def __download_from_request(self, http_response, tar_file_name, extract_dir):
-        with open(tar_file_name, 'wb') as fw:
-            for chunk in http_response.iter_content(1024):
-                if chunk:
-                    fw.write(chunk)
-        tar = tarfile.open(tar_file_name, "r:gz")
-        file_names = tar.getnames()
-        for file_name in file_names:
-            tar.extract(file_name, extract_dir)
-        tar.close()
-        os.remove(tar_file_name)
-
 
 class HttpDownloader:
-    def __init__(self, url):
+    """HttpDownloader streams the data of load_data from a http(s) url"""
+
+    def __init__(self, url, transport=None, buffer_size=cDefaultBufferSize):
         self.url = url
+        self.transport = transport
+        self.buffer_size = buffer_size
 
-    def download_to(self, path_to_save):
-        r = requests.get(self.url, allow_redirects=True)
-        filename = self.__get_filename_from_cd(
-            r.headers.get('content-disposition'))
-        temp_file_to_write = os.path.join(
-            file_utils.get_project_base_directory(), filename)
-        open(temp_file_to_write, 'wb').write(r.content)
+    def open(self):
+        """ Send the request and return the response with its body unread
+
+        :rtype: requests.Response
+
+        """
+        if self.transport is None:
+            self.transport = HttpTransport()
+        response = self.transport.get(
+            self.url, allow_redirects=True, stream=True)
+        response.raise_for_status()
+        # reading response.raw returns the decoded body
+        response.raw.decode_content = True
+        return response
+
+    def filename(self, headers):
+        return self.__get_filename_from_cd(headers.get('content-disposition'))
+
+    @staticmethod
+    def content_length(headers):
+        """ Size in bytes of the decoded body, None if unknown
+
+        :rtype: int
+
+        """
+        if headers.get('content-encoding', 'identity') != 'identity':
+            return None
+        length = headers.get('content-length')
+        return int(length) if length is not None else None
+
+    def download_to(self, path_to_save, response=None):
+        """ Write the body to a file of path_to_save, block by block
+
+        :param path_to_save: Directory of the file
+        :type path_to_save: string
+        :param response: Response returned by open(), a new request is sent if None
+        :type response: requests.Response
+
+        :returns: Path of the file
+        :rtype: string
+
+        """
+        if response is None:
+            response = self.open()
+        with closing(response):
+            temp_file_to_write = os.path.join(
+                path_to_save, self.filename(response.headers))
+            with open(temp_file_to_write, 'wb') as fw:
+                for chunk in response.iter_content(self.buffer_size):
+                    fw.write(chunk)
 
         return temp_file_to_write
 
     def __get_filename_from_cd(self, cd):
         """
-        Get filename from content-disposition
+        Get filename from content-disposition, or from the url, default to cDefaultUploadName
         """
-        if not cd:
-            # just return file name
-            fname = self.url.split('/')[-1]
-            if len(fname) == 0:
-                return None
-            return fname
-        fname = re.findall('filename=(.+)', cd)
-        if len(fname) == 0:
-            return None
-        return fname[0]
+        fname = None
+        if cd:
+            # the email parser unquotes the name, filename*=UTF-8''... is preferred as in RFC 6266
+            message = Message()
+            message["content-disposition"] = cd
+            names = [value for key, value in message.get_params([], header="content-disposition")
+                     if key == "filename"]
+            names = [value for value in names if isinstance(value, tuple)] or names
+            if names:
+                fname = collapse_rfc2231_value(names[0])
+        if not fname:
+            fname = unquote(urlsplit(self.url).path.split('/')[-1])
+        # the name goes into a multipart header and a path, keep its last component without quotes or controls
+        fname = "".join(char for char in os.path.basename(fname.replace('\\', '/'))
+                        if char >= " " and char != '"')
+        return fname or cDefaultUploadName
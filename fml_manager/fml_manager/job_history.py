@@ -0,0 +1,382 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from fml_manager.flow_requests import to_dict
+
+#: File name of the history in the log path of a manager
+cDefaultHistoryName = "job_history.db"
+
+#: Quantiles of the runtime statistics
+cDefaultQuantiles = (0.5, 0.95)
+
+#: Status of the job queries of a sync without conditions, FATE Flow answers no job to a query without any
+cSyncStatuses = ("waiting", "ready", "running", "success", "failed", "canceled", "timeout")
+
+# retcode of a job or task query which found nothing
+_NOT_FOUND = 101
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (job_id TEXT, role TEXT, party_id TEXT, status TEXT, is_initiator INTEGER,
+    create_time REAL, start_time REAL, end_time REAL, elapsed REAL, update_time REAL, tag TEXT, description TEXT,
+    synced_at REAL, PRIMARY KEY (job_id, role, party_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, create_time, elapsed);
+CREATE INDEX IF NOT EXISTS jobs_party ON jobs (party_id, role, create_time);
+CREATE INDEX IF NOT EXISTS jobs_time ON jobs (create_time);
+CREATE TABLE IF NOT EXISTS components (job_id TEXT, component TEXT, module TEXT, PRIMARY KEY (job_id, component)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS components_module ON components (module, job_id);
+CREATE TABLE IF NOT EXISTS tasks (job_id TEXT, component TEXT, role TEXT, party_id TEXT, task_id TEXT, status TEXT,
+    create_time REAL, start_time REAL, end_time REAL, elapsed REAL,
+    PRIMARY KEY (job_id, component, role, party_id, task_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tasks_component ON tasks (component, status);
+"""
+
+_JOB_COLUMNS = ("job_id", "role", "party_id", "status", "is_initiator", "create_time", "start_time",
+                "end_time", "elapsed", "update_time", "tag", "description")
+_TASK_COLUMNS = ("job_id", "component", "role", "party_id", "task_id", "status", "create_time",
+                 "start_time", "end_time", "elapsed")
+
+
+def sync_conditions(conditions=None):
+    """ Return the conditions of the job queries of a sync, one per status of cSyncStatuses by default
+
+    :param conditions: Conditions of a job query, or a list of them
+    :type conditions: dict, QueryCondition or list
+
+    :rtype: list
+
+    """
+    if conditions is None:
+        return [{"status": status} for status in cSyncStatuses]
+    if not isinstance(conditions, (list, tuple)):
+        conditions = [conditions]
+    if not conditions or not all(to_dict(condition) for condition in conditions):
+        raise ValueError("A job query needs conditions, FATE Flow finds no job without any")
+    return list(conditions)
+
+
+def query_rows(result):
+    """ Return the rows of a job or task query result, an empty list if nothing was found
+
+    :param result: Body of the response
+    :type result: dict
+
+    :rtype: list
+
+    """
+    if result.get("retcode", 0) == _NOT_FOUND:
+        return []
+    if result.get("retcode", 0) != 0:
+        raise Exception(result.get("retmsg"))
+    return result.get("data") or []
+
+
+def _seconds(value):
+    # FATE Flow records times and durations in milliseconds
+    if value is None or value == "":
+        return None
+    return float(value) / 1000.0
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _job_row(job):
+    return (job["f_job_id"], _text(job.get("f_role")), _text(job.get("f_party_id")), job.get("f_status"),
+            None if job.get("f_is_initiator") is None else int(bool(job["f_is_initiator"])),
+            _seconds(job.get("f_create_time")), _seconds(job.get("f_start_time")), _seconds(job.get("f_end_time")),
+            _seconds(job.get("f_elapsed")), _seconds(job.get("f_update_time")),
+            _text(job.get("f_tag")), _text(job.get("f_description")))
+
+
+def _task_row(task):
+    return (task["f_job_id"], task.get("f_component_name"), _text(task.get("f_role")), _text(task.get("f_party_id")),
+            _text(task.get("f_task_id")), task.get("f_status"), _seconds(task.get("f_create_time")),
+            _seconds(task.get("f_start_time")), _seconds(task.get("f_end_time")), _seconds(task.get("f_elapsed")))
+
+
+def _modules(job):
+    # (component, module) of the components of the job DSL
+    dsl = job.get("f_dsl")
+    if isinstance(dsl, str):
+        try:
+            dsl = json.loads(dsl)
+        except ValueError:
+            return []
+    components = (dsl or {}).get("components") or {}
+    return [(name, component.get("module")) for name, component in components.items()
+            if isinstance(component, dict)]
+
+
+class JobHistory:
+    """JobHistory is a local database of the jobs and tasks of a FATE cluster
+
+    It is filled by sync_job_history from the job and task queries, only
+    the new jobs and the ones whose status or update time changed are
+    written, and their tasks queried. The jobs are indexed by status,
+    module, party and time, so questions over tens of thousands of jobs
+    are answered locally, e.g. the p95 runtime of the HomoLR jobs of the
+    last week
+
+        manager.sync_job_history()
+        history = manager.job_history
+        history.runtime_stats(module="HomoLR", since=time.time() - 7 * 86400)
+
+    FATE Flow returns a row per job and local party, the runtime of a job
+    is the longest of its rows. Times are epoch seconds.
+
+    The history is a SQLite database, it may be shared by threads and
+    processes.
+    """
+
+    def __init__(self, path):
+        """ Open the history, the database is created if missing
+
+        :param path: Path to the database
+        :type path: string
+
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def changed(self, jobs):
+        """ Return the jobs of a query which are new, or whose status or update time changed
+
+        :param jobs: Rows of a job query
+        :type jobs: list of dict
+
+        :rtype: list of dict
+
+        """
+        rows = {}
+        for job in jobs:
+            row = _job_row(job)
+            rows[row[:3]] = (job, row)
+        with self._lock:
+            known = {}
+            for (job_id, role, party_id, status, update_time, end_time) in self._db.execute(
+                    "SELECT job_id, role, party_id, status, update_time, end_time FROM jobs"):
+                known[(job_id, role, party_id)] = (status, update_time, end_time)
+        return [job for key, (job, row) in rows.items() if known.get(key) != (row[3], row[9], row[7])]
+
+    def record(self, jobs, tasks=None):
+        """ Write jobs, their components and tasks
+
+        :param jobs: Rows of a job query
+        :type jobs: list of dict
+        :param tasks: Job id to the rows of its task query, which replace the recorded ones
+        :type tasks: dict
+
+        :returns: Number of jobs written
+        :rtype: int
+
+        """
+        tasks = tasks or {}
+        now = time.time()
+        job_rows = [_job_row(job) + (now,) for job in jobs]
+        component_rows = {}
+        for job in jobs:
+            for component, module in _modules(job):
+                component_rows[(job["f_job_id"], component)] = module
+        with self._lock:
+            self._write(self._record, job_rows, component_rows, tasks)
+        return len(job_rows)
+
+    def jobs(self, status=None, module=None, role=None, party_id=None, since=None, until=None, limit=None):
+        """ Return the jobs matching every given condition, the last created first
+
+        :param status: Status or list of status, e.g. "success"
+        :type status: string or list
+        :param module: Module of a component of the jobs, e.g. "HomoLR"
+        :type module: string
+        :param role: Role of the local party
+        :type role: string
+        :param party_id: Id of the local party
+        :type party_id: string or int
+        :param since: Jobs created at or after this epoch time in seconds
+        :type since: float
+        :param until: Jobs created before this epoch time in seconds
+        :type until: float
+        :param limit: Max number of rows, default=None for all
+        :type limit: int
+
+        :rtype: pandas.DataFrame
+
+        """
+        conditions, args = self._job_conditions(status, module, role, party_id, since, until)
+        sql = "SELECT {} FROM jobs j".format(", ".join("j." + column for column in _JOB_COLUMNS))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY j.create_time DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return self.query(sql, args)
+
+    def tasks(self, job_ids=None, component=None, module=None, status=None):
+        """ Return the tasks matching every given condition
+
+        :param job_ids: Jobs of the tasks, default=None for every job
+        :type job_ids: list
+        :param component: Component name, e.g. "hetero_lr_0"
+        :type component: string
+        :param module: Module of the component, e.g. "HeteroLR"
+        :type module: string
+        :param status: Status of the tasks
+        :type status: string
+
+        :rtype: pandas.DataFrame
+
+        """
+        conditions, args = [], []
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            conditions.append("t.job_id IN ({})".format(",".join("?" * len(job_ids))))
+            args.extend(job_ids)
+        for column, value in (("t.component", component), ("t.status", status)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(value)
+        if module is not None:
+            conditions.append("c.module = ?")
+            args.append(module)
+        sql = ("SELECT {}, c.module FROM tasks t LEFT JOIN components c "
+               "ON c.job_id = t.job_id AND c.component = t.component").format(
+            ", ".join("t." + column for column in _TASK_COLUMNS))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self.query(sql, args)
+
+    def runtime_stats(self, module=None, status="success", since=None, until=None, by="module", quantiles=cDefaultQuantiles):
+        """ Return the count, mean and quantiles of the job runtime in seconds
+
+        e.g. the p95 runtime of the HomoLR jobs of the week
+        runtime_stats(module="HomoLR", since=time.time() - 7 * 86400)["p95"]
+
+        :param module: Only the jobs with a component of this module
+        :type module: string
+        :param status: Status of the jobs, default="success"
+        :type status: string or list
+        :param by: Group by "module", "status", "role", "party_id", or None for all the jobs
+        :type by: string
+        :param quantiles: Quantiles of the runtime, default=(0.5, 0.95)
+        :type quantiles: tuple
+
+        :returns: A row per group, or a row "all" if by is None, with the columns count, mean and p50, p95...
+        :rtype: pandas.DataFrame
+
+        """
+        conditions, args = self._job_conditions(status, module, None, None, since, until)
+        conditions.append("j.elapsed IS NOT NULL")
+        where = " WHERE " + " AND ".join(conditions)
+        if by == "module":
+            sql = ("SELECT c.module AS module, j.job_id, MAX(j.elapsed) AS elapsed FROM jobs j "
+                   "JOIN components c ON c.job_id = j.job_id{}{} GROUP BY c.module, j.job_id").format(
+                where, "" if module is None else " AND c.module = ?")
+            if module is not None:
+                args.append(module)
+        elif by is None:
+            sql = "SELECT j.job_id, MAX(j.elapsed) AS elapsed FROM jobs j{} GROUP BY j.job_id".format(where)
+        elif by in ("status", "role", "party_id"):
+            sql = "SELECT j.{0} AS {0}, j.job_id, MAX(j.elapsed) AS elapsed FROM jobs j{1} GROUP BY j.{0}, j.job_id".format(
+                by, where)
+        else:
+            raise ValueError("Unknown group {}, expected module, status, role, party_id or None".format(by))
+        runtimes = self.query(sql, args)
+        if by is None:
+            by = "jobs"
+            runtimes[by] = "all"
+        grouped = runtimes.groupby(by)["elapsed"]
+        stats = grouped.agg(["count", "mean"])
+        for quantile in quantiles:
+            stats["p{:g}".format(quantile * 100)] = grouped.quantile(quantile)
+        return stats
+
+    def query(self, sql, args=()):
+        """ Return the result of a SQL query over the jobs, components and tasks tables
+
+        :rtype: pandas.DataFrame
+
+        """
+        with self._lock:
+            return pd.read_sql_query(sql, self._db, params=list(args))
+
+    def count(self):
+        """ Return the number of recorded job rows
+        """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _job_conditions(status, module, role, party_id, since, until):
+        conditions, args = [], []
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else list(status)
+            conditions.append("j.status IN ({})".format(",".join("?" * len(statuses))))
+            args.extend(statuses)
+        if module is not None:
+            conditions.append("j.job_id IN (SELECT job_id FROM components WHERE module = ?)")
+            args.append(module)
+        for column, value in (("j.role", role), ("j.party_id", party_id)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(str(value))
+        if since is not None:
+            conditions.append("j.create_time >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("j.create_time < ?")
+            args.append(until)
+        return conditions, args
+
+    def _write(self, function, *args):
+        # see LogIndex._write
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(*args)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return result
+
+    def _record(self, job_rows, component_rows, tasks):
+        self._db.executemany("INSERT OR REPLACE INTO jobs VALUES ({})".format(",".join("?" * 13)), job_rows)
+        self._db.executemany("INSERT OR REPLACE INTO components VALUES (?, ?, ?)",
+                             [key + (module,) for key, module in component_rows.items()])
+        for job_id, rows in tasks.items():
+            self._db.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            self._db.executemany("INSERT OR REPLACE INTO tasks VALUES ({})".format(",".join("?" * 10)),
+                                 [_task_row(task) for task in rows])
@@ -0,0 +1,303 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from fml_manager.flow_requests import to_dict
+from fml_manager.job_waiter import TERMINAL_STATUSES
+
+#: Path of the memo when none is given
+cDefaultMemoPath = os.path.join("~", ".cache", "fml_manager", "job_memo.db")
+
+_MEMO_VERSION = 1
+
+#: A submission recorded in the memo, result is the body of the submit response
+MemoEntry = namedtuple("MemoEntry", ["key", "job_id", "model_id", "model_version", "status", "submitted_at", "result"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, server_url TEXT, job_id TEXT, model_id TEXT, model_version TEXT, status TEXT, submitted_at REAL, result TEXT);
+CREATE INDEX IF NOT EXISTS jobs_job ON jobs (job_id);
+CREATE TABLE IF NOT EXISTS job_tables (key TEXT, namespace TEXT, name TEXT, PRIMARY KEY (key, namespace, name)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS job_tables_table ON job_tables (namespace, name);
+CREATE TABLE IF NOT EXISTS tables (server_url TEXT, namespace TEXT, name TEXT, version TEXT, PRIMARY KEY (server_url, namespace, name)) WITHOUT ROWID;
+"""
+
+
+def canonical(value):
+    """ Return the canonical JSON text of a DSL or config, the same for equal dicts whatever the order of their keys
+
+    :param value: Pipeline, Config or dict
+    :type value: object
+
+    :rtype: string
+
+    """
+    return json.dumps(to_dict(value), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def input_tables(config):
+    """ Return the (namespace, name) of the tables referenced by a config, sorted
+
+    A table is a dict holding a name and a namespace, e.g. the train_data
+    of the role parameters.
+
+    :rtype: list
+
+    """
+    tables = set()
+    pending = [to_dict(config)]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            if isinstance(value.get("name"), str) and isinstance(value.get("namespace"), str):
+                tables.add((value["namespace"], value["name"]))
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return sorted(tables)
+
+
+def reusable(status):
+    """ Return whether a job in this status may stand for an equal submission, i.e. it succeeded or may still succeed
+    """
+    return status == "success" or (status is not None and status not in TERMINAL_STATUSES)
+
+
+class JobMemo:
+    """JobMemo records the jobs submitted by the managers, keyed by what they compute
+
+    The key of a submission is the hash of the canonical DSL and config and
+    of the version of their input tables. A manager with a memo returns the
+    earlier response of an equal submission whose job succeeded, or is still
+    running, instead of submitting it again, e.g.
+
+        memo = JobMemo()
+        manager = FMLManager(memo=memo)
+        first = manager.submit_job(pipeline, config)
+        again = manager.submit_job(pipeline, config)      # same jobId, nothing submitted
+        manager.submit_job(pipeline, config, force=True)  # a new job, the memo points to it
+        print(memo.hits, memo.misses)
+
+    A table version changes whenever a manager with the memo uploads or
+    deletes the table, so a job reading it is submitted again. Tables
+    changed by other clients are not seen, use invalidate for them.
+
+    The memo is a SQLite database, it may be shared by threads, processes
+    and managers of several clusters.
+    """
+
+    def __init__(self, path=cDefaultMemoPath):
+        """ Open the memo, the database is created if missing
+
+        :param path: Path to the database, default=~/.cache/fml_manager/job_memo.db
+        :type path: string
+
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        #: Number of submissions answered by the memo
+        self.hits = 0
+
+        #: Number of submissions sent to FATE Flow
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def key(self, server_url, dsl, config):
+        """ Return the key of a submission and its input tables
+
+        :param server_url: Url of FATE Flow
+        :type server_url: string
+        :param dsl: DSL definition
+        :type dsl: Pipeline or dict
+        :param config: Config definition
+        :type config: Config or dict
+
+        :returns: (key, tables)
+        :rtype: tuple
+
+        """
+        tables = input_tables(config)
+        with self._lock:
+            versions = [self._table_version(server_url, namespace, name) for namespace, name in tables]
+        identity = '[{},{},{},{},{}]'.format(_MEMO_VERSION, json.dumps(server_url), canonical(dsl),
+                                            canonical(config), canonical(versions))
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest(), tables
+
+    def get(self, key):
+        """ Return the entry of a key, or None
+
+        :rtype: MemoEntry
+
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, job_id, model_id, model_version, status, submitted_at, result FROM jobs WHERE key = ?",
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return MemoEntry(*row[:-1], json.loads(row[-1]))
+
+    def find(self, job_id):
+        """ Return the entry of a job, or None
+
+        :rtype: MemoEntry
+
+        """
+        with self._lock:
+            row = self._db.execute("SELECT key FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else self.get(row[0])
+
+    def put(self, key, server_url, tables, result):
+        """ Record a submission, replacing the earlier one of the key
+
+        :param result: Body of the submit response, only recorded if the job was accepted
+        :type result: dict
+
+        :returns: The entry, or None if the submission was rejected
+        :rtype: MemoEntry
+
+        """
+        if not isinstance(result, dict) or result.get("retcode", 0) != 0 or "jobId" not in result:
+            return None
+        model_info = (result.get("data") or {}).get("model_info") or {}
+        entry = MemoEntry(key, result["jobId"], model_info.get("model_id"), model_info.get("model_version"),
+                          None, time.time(), result)
+        with self._lock:
+            self._write(self._put, entry, server_url, tables)
+        return entry
+
+    def set_status(self, key, status):
+        """ Record the last known status of the job of a key
+        """
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ? WHERE key = ?", (status, key))
+
+    def record_lookup(self, hit):
+        """ Count a submission answered by the memo, or sent to FATE Flow
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def touch_table(self, server_url, namespace, name):
+        """ Give a new version to a table, the submissions reading it no longer match the earlier ones
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO tables (server_url, namespace, name, version) VALUES (?, ?, ?, ?)",
+                             (server_url, namespace, name, uuid.uuid4().hex))
+
+    def invalidate(self, job_id=None, table=None, before=None):
+        """ Forget the submissions of a job, of the jobs reading a table, or submitted before a time
+
+        :param job_id: The UUID of job
+        :type job_id: string
+        :param table: (namespace, name) of a table
+        :type table: tuple
+        :param before: Epoch time in seconds
+        :type before: float
+
+        :returns: Number of submissions forgotten
+        :rtype: int
+
+        """
+        conditions, args = [], []
+        if job_id is not None:
+            conditions.append("job_id = ?")
+            args.append(job_id)
+        if table is not None:
+            conditions.append("key IN (SELECT key FROM job_tables WHERE namespace = ? AND name = ?)")
+            args.extend(table)
+        if before is not None:
+            conditions.append("submitted_at < ?")
+            args.append(before)
+        if not conditions:
+            raise ValueError("Give a job_id, a table or a time, or use clear to forget every submission")
+        where = " AND ".join(conditions)
+        with self._lock:
+            return self._write(self._remove, where, args)
+
+    def clear(self):
+        """ Forget every submission and table version, and reset the counters
+        """
+        with self._lock:
+            self._write(self._clear)
+            self.hits = 0
+            self.misses = 0
+
+    def entries(self):
+        """ Return every entry, the last submitted first
+
+        :rtype: list of MemoEntry
+
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT key, job_id, model_id, model_version, status, submitted_at, result "
+                                    "FROM jobs ORDER BY submitted_at DESC").fetchall()
+        return [MemoEntry(*row[:-1], json.loads(row[-1])) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _table_version(self, server_url, namespace, name):
+        row = self._db.execute("SELECT version FROM tables WHERE server_url = ? AND namespace = ? AND name = ?",
+                               (server_url, namespace, name)).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, function, *args):
+        # see LogIndex._write
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(*args)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return result
+
+    def _put(self, entry, server_url, tables):
+        self._db.execute("DELETE FROM job_tables WHERE key = ?", (entry.key,))
+        self._db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (entry.key, server_url, entry.job_id, entry.model_id, entry.model_version,
+                          entry.status, entry.submitted_at, json.dumps(entry.result)))
+        self._db.executemany("INSERT OR IGNORE INTO job_tables VALUES (?, ?, ?)",
+                             [(entry.key, namespace, name) for namespace, name in tables])
+
+    def _remove(self, where, args):
+        keys = [row[0] for row in self._db.execute("SELECT key FROM jobs WHERE " + where, args).fetchall()]
+        self._db.executemany("DELETE FROM jobs WHERE key = ?", [(key,) for key in keys])
+        self._db.executemany("DELETE FROM job_tables WHERE key = ?", [(key,) for key in keys])
+        return len(keys)
+
+    def _clear(self):
+        for table in ("jobs", "job_tables", "tables"):
+            self._db.execute("DELETE FROM " + table)
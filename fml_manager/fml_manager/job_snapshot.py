@@ -0,0 +1,216 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+from collections import namedtuple
+
+import pandas as pd
+
+from fml_manager import flow_requests
+from fml_manager.job_waiter import TERMINAL_STATUSES
+
+#: Time taken by one call of a snapshot, component is None for the calls of the job
+EndpointTiming = namedtuple("EndpointTiming", ["endpoint", "component", "seconds", "status_code"])
+
+#: Calls of the component tracking endpoints, the metric types and series are all in "metrics"
+COMPONENT_ENDPOINTS = ("metrics", "parameters", "output_model", "output_data")
+
+
+def job_requests(job_id, role, party_id):
+    """ Return the (endpoint, component, request) calls of the job, the config first
+    """
+    conditions = {"job_id": job_id, "role": role, "party_id": party_id}
+    return [("conf", None, flow_requests.query_job_conf(conditions)),
+            ("tasks", None, flow_requests.query_task(conditions)),
+            ("job_data", None, flow_requests.track_job_data(job_id, role, party_id))]
+
+
+def component_requests(job_id, role, party_id, component_name, output_data=True):
+    """ Return the (endpoint, component, request) calls of a component
+    """
+    calls = [("metrics", flow_requests.track_component_all_metric),
+             ("parameters", flow_requests.track_component_parameters),
+             ("output_model", flow_requests.track_component_output_model)]
+    if output_data:
+        calls.append(("output_data", flow_requests.track_component_output_data))
+    return [(endpoint, component_name, request(job_id, role, party_id, component_name))
+            for endpoint, request in calls]
+
+
+class ComponentSnapshot:
+    """ComponentSnapshot holds the tracking results of one component of a job"""
+
+    def __init__(self, name, module=None):
+        self.name = name
+
+        #: Module of the component in the DSL, e.g. HeteroLR
+        self.module = module
+
+        #: Every metric series of the component, namespace to metric to data
+        self.metrics = None
+
+        self.parameters = None
+        self.output_model = None
+
+        #: Output data of the component, see FMLManager.track_component_output_data
+        self.output_data = None
+
+    def __repr__(self):
+        return "<ComponentSnapshot {} {}>".format(self.name, self.module)
+
+
+class JobSnapshot:
+    """JobSnapshot is the status, config, tasks, metrics and outputs of a job for a party
+
+    It is built by FMLManager.snapshot_job, which fetches everything
+    concurrently, e.g.
+
+        snapshot = manager.snapshot_job(job_id, "guest", 9999)
+        snapshot.status
+        snapshot.components["hetero_lr_0"].metrics
+        snapshot.timing_frame().sort_values("seconds")
+
+    A call that fails leaves its member None and its error in errors, the
+    other members are still filled. A snapshot only holds plain data, it
+    can be pickled or stored with save and read back with load.
+    """
+
+    def __init__(self, job_id, role, party_id):
+        self.job_id = job_id
+        self.role = role
+        self.party_id = party_id
+
+        #: Job entry of the party in the job query
+        self.job = None
+
+        #: Job config, with the dsl and runtime_conf of the job
+        self.conf = None
+
+        self.tasks = None
+        self.job_data = None
+
+        #: Name to ComponentSnapshot, in the order of the DSL
+        self.components = {}
+
+        #: (endpoint, component) to the error of the call
+        self.errors = {}
+
+        #: EndpointTiming of every call, in the order they ended
+        self.timings = []
+
+        #: Wall time in seconds of the whole snapshot
+        self.elapsed = None
+
+    @property
+    def status(self):
+        return None if self.job is None else self.job.get("f_status")
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def dsl(self):
+        if self.conf is None:
+            return None
+        return self.conf.get("dsl") or self.conf.get("job_dsl")
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def component_names(self):
+        """ Return the names of the components in the DSL of the job config
+        """
+        return list(((self.dsl or {}).get("components") or {}).keys())
+
+    def record(self, endpoint, component, response=None, error=None, seconds=0.0):
+        """ Record the result of a call
+
+        :param endpoint: Member set by the call, e.g. conf or metrics
+        :type endpoint: string
+        :param component: Name of the component, None for the calls of the job
+        :type component: string
+        :param response: Response of the call, None if it failed
+        :type response: FlowResponse
+        :param error: Exception raised by the call
+        :type error: Exception
+        :param seconds: Time taken by the call
+        :type seconds: float
+
+        """
+        status_code = None if response is None else response.status_code
+        self.timings.append(EndpointTiming(endpoint, component, seconds, status_code))
+        if error is None:
+            try:
+                value = self._value(endpoint, response.json())
+            except Exception as e:
+                error = e
+        if error is not None:
+            self.errors[(endpoint, component)] = error
+            return
+        if component is None:
+            setattr(self, endpoint, value)
+        else:
+            setattr(self._component(component), endpoint, value)
+
+    def _value(self, endpoint, result):
+        if result.get("retcode") != 0:
+            raise Exception(result.get("retmsg"))
+        if endpoint == "output_data":
+            return flow_requests.output_data_frame(result)
+        data = result.get("data")
+        if endpoint == "job":
+            # the entry of the party, a query by job id alone answers every party
+            entries = data or []
+            for entry in entries:
+                if entry.get("f_role") == self.role and str(entry.get("f_party_id")) == str(self.party_id):
+                    return entry
+            return entries[0] if entries else None
+        if endpoint == "conf":
+            for name, component in ((data.get("dsl") or data.get("job_dsl") or {}).get("components") or {}).items():
+                self._component(name).module = component.get("module")
+        return data
+
+    def _component(self, name):
+        component = self.components.get(name)
+        if component is None:
+            component = self.components[name] = ComponentSnapshot(name)
+        return component
+
+    def timing_frame(self):
+        """ Return the timings as a DataFrame with one row per call
+
+        :rtype: pandas.DataFrame
+
+        """
+        return pd.DataFrame(self.timings, columns=EndpointTiming._fields)
+
+    def save(self, path):
+        """ Store the snapshot in a file
+        """
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """ Read a snapshot stored by save
+
+        :rtype: JobSnapshot
+
+        """
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def __repr__(self):
+        return "<JobSnapshot {} {} {} status={} components={} errors={}>".format(
+            self.job_id, self.role, self.party_id, self.status, len(self.components), len(self.errors))
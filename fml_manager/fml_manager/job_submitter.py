@@ -0,0 +1,135 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fml_manager.utils.rate_limiter import RateLimiter
+
+
+class SubmitResult:
+    """SubmitResult is the outcome of one job of a bulk submission"""
+
+    def __init__(self, index, dsl, config, response=None, error=None):
+        #: Position of the job in the submitted iterable
+        self.index = index
+        self.dsl = dsl
+        self.config = config
+
+        #: Response of FATE Flow, None if the request failed
+        self.response = response
+
+        #: Exception raised by the request, or the retmsg of a rejected job
+        self.error = error
+
+        if error is None and response is not None:
+            try:
+                result = response.json()
+                if result.get("retcode", 0) != 0:
+                    self.error = Exception(result.get("retmsg"))
+            except ValueError as e:
+                self.error = e
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def job_id(self):
+        """ Job id given by FATE Flow, None if the submission failed
+        """
+        if not self.ok:
+            return None
+        return self.response.json().get("jobId")
+
+    def __repr__(self):
+        if self.ok:
+            return "<SubmitResult {} job_id={}>".format(self.index, self.job_id)
+        return "<SubmitResult {} error={!r}>".format(self.index, self.error)
+
+
+def submit_jobs(submit_job, jobs, parallelism=4, rate_limit=None):
+    """ Submit jobs from a thread pool and yield results as they complete
+
+    :param submit_job: Function submitting one (dsl, config)
+    :type submit_job: callable
+    :param jobs: Iterable of (dsl, config), it is consumed lazily
+    :type jobs: iterable
+    :param parallelism: Max number of submissions in flight
+    :type parallelism: int
+    :param rate_limit: Max number of submissions started per second, None means no limit
+    :type rate_limit: float
+
+    :rtype: generator of SubmitResult
+
+    """
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    def submit(index, dsl, config):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return SubmitResult(index, dsl, config, response=submit_job(dsl, config))
+        except Exception as e:
+            return SubmitResult(index, dsl, config, error=e)
+
+    jobs = enumerate(jobs)
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        in_flight = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < parallelism:
+                try:
+                    index, (dsl, config) = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.add(executor.submit(submit, index, dsl, config))
+            if not in_flight:
+                return
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+async def submit_jobs_async(submit_job, jobs, parallelism=4, rate_limit=None):
+    """ asyncio version of submit_jobs, submit_job is a coroutine function
+
+    :rtype: async generator of SubmitResult
+
+    """
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    async def submit(index, dsl, config):
+        if limiter is not None:
+            await asyncio.sleep(limiter.reserve())
+        try:
+            return SubmitResult(index, dsl, config, response=await submit_job(dsl, config))
+        except Exception as e:
+            return SubmitResult(index, dsl, config, error=e)
+
+    jobs = enumerate(jobs)
+    in_flight = set()
+    exhausted = False
+    while True:
+        while not exhausted and len(in_flight) < parallelism:
+            try:
+                index, (dsl, config) = next(jobs)
+            except StopIteration:
+                exhausted = True
+                break
+            in_flight.add(asyncio.ensure_future(submit(index, dsl, config)))
+        if not in_flight:
+            return
+        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
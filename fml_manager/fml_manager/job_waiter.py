@@ -0,0 +1,269 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from fml_manager import flow_requests
+from fml_manager.utils.fate_builders import QueryCondition
+
+#: Status of a job which will not change any more
+TERMINAL_STATUSES = ("success", "failed", "canceled", "timeout")
+
+
+class Backoff:
+    """Backoff gives the polling intervals of a job, short at first and longer for long jobs"""
+
+    def __init__(self, initial=0.2, maximum=10.0, factor=1.5, jitter=0.1):
+        """ Init the backoff
+
+        :param initial: Interval in seconds before the first poll, default=0.2
+        :type initial: float
+        :param maximum: Upper bound of the interval in seconds, default=10
+        :type maximum: float
+        :param factor: Growth of the interval after each poll, default=1.5
+        :type factor: float
+        :param jitter: Random ratio added to or removed from every interval, default=0.1
+        :type jitter: float
+
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+
+    def interval(self, attempt):
+        """ Return the interval in seconds before the given poll
+
+        :param attempt: Number of polls already done
+        :type attempt: int
+
+        :rtype: float
+
+        """
+        # cap the exponent, the interval stops growing at the maximum anyway
+        base = min(self.maximum, self.initial *
+                   self.factor ** min(attempt, 64))
+        return base * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def intervals(self, timeout, max_tries=None):
+        """ Yield the interval in seconds before every poll until the timeout
+
+        The last interval is cut to end at the timeout, so the total wait
+        does not depend on how fast the intervals grow.
+
+        :param timeout: Total time in seconds to wait
+        :type timeout: float
+        :param max_tries: Max number of polls, None means bounded by the timeout only
+        :type max_tries: int
+
+        """
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while max_tries is None or attempt < max_tries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            yield min(self.interval(attempt), remaining)
+            attempt += 1
+
+
+class _WaitedJob:
+    def __init__(self, job_id, future, callback, deadline):
+        self.job_id = job_id
+        self.future = future
+        self.callbacks = [callback] if callback is not None else []
+        self.deadline = deadline
+        self.attempt = 0
+        self.status = None
+
+
+class JobWaiter:
+    """JobWaiter waits for many jobs from one polling thread
+
+    Every job is polled with its own backoff, e.g.
+
+        waiter = JobWaiter(manager)
+        futures = [waiter.wait_for(job_id) for job_id in job_ids]
+        statuses = [future.result() for future in futures]
+
+    The future of a job resolves to its terminal status, or raises
+    TimeoutError when the deadline is reached first. The callbacks are
+    called in both cases, with None as status on the deadline.
+    """
+
+    def __init__(self, manager, backoff=None, deadline=None):
+        """ Init the waiter
+
+        :param manager: Manager used to query the jobs
+        :type manager: FMLManager
+        :param backoff: Polling intervals, default=Backoff()
+        :type backoff: Backoff
+        :param deadline: Default time in seconds to wait for a job, None means no deadline
+        :type deadline: float
+
+        """
+        self.manager = manager
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.deadline = deadline
+
+        #: Number of job queries issued
+        self.polls = 0
+
+        self._jobs = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def wait_for(self, job_id, callback=None, deadline=None):
+        """ Start waiting for a job
+
+        :param job_id: The UUID of job
+        :type job_id: string
+        :param callback: Called with (job_id, status) when the job reaches a terminal status, or with (job_id, None) at the deadline
+        :type callback: callable
+        :param deadline: Time in seconds to wait for the job, fallback to the default deadline
+        :type deadline: float
+
+        :rtype: concurrent.futures.Future
+
+        """
+        if deadline is None:
+            deadline = self.deadline
+        with self._condition:
+            if self._closed:
+                raise Exception("JobWaiter is closed")
+            waited = self._jobs.get(job_id)
+            if waited is not None:
+                if callback is not None:
+                    waited.callbacks.append(callback)
+                return waited.future
+
+            deadline_at = time.monotonic() + deadline if deadline is not None else None
+            waited = _WaitedJob(job_id, Future(), callback, deadline_at)
+            self._jobs[job_id] = waited
+            self._schedule(waited)
+            self._ensure_thread()
+            self._condition.notify()
+        return waited.future
+
+    def wait_all(self, job_ids, timeout=None):
+        """ Wait until all jobs reach a terminal status
+
+        :param job_ids: The UUIDs of jobs
+        :type job_ids: list
+        :param timeout: Time in seconds to wait for each job
+        :type timeout: float
+
+        :returns: Job id to terminal status
+        :rtype: dict
+
+        """
+        futures = {job_id: self.wait_for(job_id, deadline=timeout)
+                   for job_id in job_ids}
+        return {job_id: future.result() for job_id, future in futures.items()}
+
+    def pending(self):
+        """ Return the ids of jobs which are still waited
+        """
+        with self._condition:
+            return list(self._jobs)
+
+    def close(self):
+        """ Stop the polling thread, the pending futures are cancelled
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        for waited in list(self._jobs.values()):
+            waited.future.cancel()
+        self._jobs.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _schedule(self, waited):
+        poll_at = time.monotonic() + self.backoff.interval(waited.attempt)
+        if waited.deadline is not None:
+            poll_at = min(poll_at, waited.deadline)
+        heapq.heappush(self._queue, (poll_at, next(self._counter), waited.job_id))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fml-job-waiter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._queue:
+                        wait = self._queue[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                _, _, job_id = heapq.heappop(self._queue)
+                waited = self._jobs.get(job_id)
+            if waited is None:
+                continue
+            self._poll(waited)
+
+    def _poll(self, waited):
+        try:
+            self.polls += 1
+            result = self.manager.query_job(
+                QueryCondition(waited.job_id)).json()
+            waited.status = flow_requests.job_status(result)
+        except Exception as e:
+            # the job may not be visible yet, or FATE Flow is busy, try again later
+            print("Failed to fetch status of {}: {}".format(waited.job_id, e))
+
+        if waited.status in TERMINAL_STATUSES:
+            self._finish(waited, waited.status)
+            return
+        if waited.deadline is not None and time.monotonic() >= waited.deadline:
+            self._finish(waited, None)
+            return
+
+        waited.attempt += 1
+        with self._condition:
+            self._schedule(waited)
+
+    def _finish(self, waited, status):
+        with self._condition:
+            self._jobs.pop(waited.job_id, None)
+        if status is None:
+            waited.future.set_exception(TimeoutError(
+                "Job {} is still {} after the deadline".format(waited.job_id, waited.status)))
+        else:
+            waited.future.set_result(status)
+        for callback in waited.callbacks:
+            try:
+                callback(waited.job_id, status)
+            except Exception as e:
+                print("Callback of job {} failed: {}".format(waited.job_id, e))
@@ -0,0 +1,319 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from fml_manager import flow_requests
+from fml_manager.job_waiter import TERMINAL_STATUSES
+from fml_manager.utils.fate_builders import QueryCondition
+
+#: Interval in seconds between two polls of a running job
+cDefaultWatchInterval = 2.0
+
+#: Age in seconds of a cached status above which a read polls the job
+cDefaultMaxStaleness = 5.0
+
+
+class _WatchedStatus:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = None
+        # monotonic times of the last answered poll and of the last attempt
+        self.updated = None
+        self.polled = None
+        self.refresh = None
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def fresh(self, now, max_staleness):
+        if self.finished:
+            return True
+        return self.updated is not None and now - self.updated <= max_staleness
+
+
+class _Subscription:
+    def __init__(self, callback, job_ids):
+        self.callback = callback
+        self.job_ids = None if job_ids is None else set(job_ids)
+
+
+class JobWatcher:
+    """JobWatcher keeps one cache of the status of many jobs, for every caller of a process
+
+    The registered jobs are polled in rounds from one thread, the jobs due
+    in a round are queried at once. Reads are served from the cache unless
+    the cached status is older than max_staleness, then the job is polled
+    first, once for all the callers reading it. A job in a terminal status
+    is not polled again, e.g.
+
+        watcher = manager.job_watcher
+        watcher.watch(job_ids)
+        watcher.subscribe(lambda job_id, old, new: print(job_id, old, "->", new))
+        watcher.status(job_ids[0])
+        print(watcher.polls, watcher.reads, watcher.hits)
+    """
+
+    def __init__(self, manager, interval=cDefaultWatchInterval, max_staleness=cDefaultMaxStaleness, parallelism=8):
+        """ Init the watcher
+
+        :param manager: Manager used to query the jobs
+        :type manager: FMLManager
+        :param interval: Interval in seconds between two polls of a running job, default=2
+        :type interval: float
+        :param max_staleness: Default age in seconds above which a read polls the job, default=5
+        :type max_staleness: float
+        :param parallelism: Max number of job queries at once, default=8
+        :type parallelism: int
+
+        """
+        self.manager = manager
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.parallelism = parallelism
+
+        #: Number of job queries issued
+        self.polls = 0
+
+        #: Number of status reads
+        self.reads = 0
+
+        #: Number of status reads served from the cache without a poll
+        self.hits = 0
+
+        self._jobs = {}
+        self._subscriptions = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._closed = False
+
+    def watch(self, job_ids):
+        """ Register jobs, they are polled until they reach a terminal status
+
+        :param job_ids: The UUIDs of the jobs, or of one job
+        :type job_ids: list or string
+
+        """
+        with self._condition:
+            self._entries(job_ids)
+            self._ensure_thread()
+            self._condition.notify()
+
+    def unwatch(self, job_ids):
+        """ Forget jobs and their cached status
+        """
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+        with self._condition:
+            for job_id in job_ids:
+                self._jobs.pop(job_id, None)
+
+    def watched(self):
+        """ Return the ids of the registered jobs
+        """
+        with self._condition:
+            return list(self._jobs)
+
+    def status(self, job_id, max_staleness=None):
+        """ Return the status of a job, registered if it is not yet
+
+        :param job_id: The UUID of job
+        :type job_id: string
+        :param max_staleness: Age in seconds above which the job is polled first, fallback to the default one
+        :type max_staleness: float
+
+        :returns: Status of the job, None if it was never fetched
+        :rtype: string
+
+        """
+        return self.statuses([job_id], max_staleness)[job_id]
+
+    def statuses(self, job_ids, max_staleness=None):
+        """ Return the status of many jobs, the stale ones are polled at once
+
+        :rtype: dict
+
+        """
+        if max_staleness is None:
+            max_staleness = self.max_staleness
+        now = time.monotonic()
+        with self._condition:
+            entries = self._entries(job_ids)
+            stale = [entry for entry in entries if not entry.fresh(now, max_staleness)]
+            self.reads += len(entries)
+            self.hits += len(entries) - len(stale)
+            claimed = self._claim(stale)
+            futures = [entry.refresh for entry in stale]
+            self._ensure_thread()
+        if claimed:
+            self._poll(claimed)
+        wait(futures)
+        with self._condition:
+            return {entry.job_id: entry.status for entry in entries}
+
+    def cached(self, job_id):
+        """ Return the cached status of a job without polling it, None if it was never fetched
+        """
+        with self._condition:
+            entry = self._jobs.get(job_id)
+            return None if entry is None else entry.status
+
+    def subscribe(self, callback, job_ids=None):
+        """ Call callback(job_id, old_status, new_status) whenever the status of a job changes
+
+        :param callback: Called from the thread which polled the job
+        :type callback: callable
+        :param job_ids: Jobs followed, registered if they are not yet, default=None for every job
+        :type job_ids: list
+
+        :returns: The subscription, pass it to unsubscribe
+        :rtype: object
+
+        """
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+        subscription = _Subscription(callback, job_ids)
+        with self._condition:
+            self._subscriptions.append(subscription)
+        if job_ids is not None:
+            self.watch(job_ids)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def close(self):
+        """ Stop the polling thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _entries(self, job_ids):
+        if self._closed:
+            raise Exception("JobWatcher is closed")
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+        entries = []
+        for job_id in job_ids:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                entry = self._jobs[job_id] = _WatchedStatus(job_id)
+            entries.append(entry)
+        return entries
+
+    def _claim(self, entries):
+        # the entries without a poll in flight, polled by the caller
+        claimed = []
+        for entry in entries:
+            if entry.refresh is None:
+                entry.refresh = Future()
+                claimed.append(entry)
+        self.polls += len(claimed)
+        return claimed
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fml-job-watcher", daemon=True)
+            self._thread.start()
+
+    def _next_poll(self):
+        # (time of the next round, entries due now)
+        now = time.monotonic()
+        due, next_at = [], None
+        for entry in self._jobs.values():
+            if entry.finished or entry.refresh is not None:
+                continue
+            poll_at = now if entry.polled is None else entry.polled + self.interval
+            if poll_at <= now:
+                due.append(entry)
+            elif next_at is None or poll_at < next_at:
+                next_at = poll_at
+        return next_at, due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    next_at, due = self._next_poll()
+                    if due:
+                        break
+                    if next_at is None:
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(next_at - time.monotonic())
+                if self._closed:
+                    return
+                claimed = self._claim(due)
+            self._poll(claimed)
+
+    def _poll(self, entries):
+        if len(entries) == 1:
+            changes = [self._poll_one(entries[0])]
+        else:
+            with self._condition:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.parallelism, thread_name_prefix="fml-job-watcher")
+            changes = list(self._executor.map(self._poll_one, entries))
+        with self._condition:
+            subscriptions = list(self._subscriptions)
+            # the next round is computed again without the polled entries
+            self._condition.notify()
+        # the callbacks run after the round, from this thread
+        for change in changes:
+            if change is None:
+                continue
+            for subscription in subscriptions:
+                if subscription.job_ids is not None and change[0] not in subscription.job_ids:
+                    continue
+                try:
+                    subscription.callback(*change)
+                except Exception as e:
+                    print("Callback of job {} failed: {}".format(change[0], e))
+
+    def _poll_one(self, entry):
+        status = None
+        try:
+            status = flow_requests.job_status(
+                self.manager.query_job(QueryCondition(entry.job_id)).json())
+        except Exception as e:
+            # the job may not be visible yet, or FATE Flow is busy, try again next round
+            print("Failed to fetch status of {}: {}".format(entry.job_id, e))
+        with self._condition:
+            entry.polled = time.monotonic()
+            old = entry.status
+            if status is not None:
+                entry.status = status
+                entry.updated = entry.polled
+            refresh, entry.refresh = entry.refresh, None
+        refresh.set_result(entry.status)
+        if status is not None and status != old:
+            return entry.job_id, old, status
+        return None
@@ -0,0 +1,576 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+#: File name of the index in the log path of a manager
+cDefaultIndexName = "job_logs.index"
+
+#: Number of consecutive records of a file stored and tokenized together
+cIndexBlockRecords = 128
+
+#: Number of blocks written to the index at once
+cIndexBatchBlocks = 64
+
+#: A log record, a line and its continuation lines such as a traceback
+LogRecord = namedtuple("LogRecord", ["job_id", "role", "party_id", "component", "level", "path", "offset", "message"])
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# FATE log lines start with the level, e.g.
+# [ERROR] [2020-12-01 10:00:00,123] [1:140] - task_executor.py[line:123]: message
+_RECORD_START = re.compile(rb"\[(DEBUG|INFO|WARNING|ERROR|CRITICAL)\] ")
+_RECORD_LINE = re.compile(rb"^\[(DEBUG|INFO|WARNING|ERROR|CRITICAL)\] ", re.M)
+_MESSAGE_START = re.compile(rb"\]: ")
+_HEADER = re.compile(rb"^\[(?:DEBUG|INFO|WARNING|ERROR|CRITICAL)\] [^\n]*?\]: ", re.M)
+_TOKEN = re.compile(r"[0-9a-z_]{2,}")
+
+# code of a record without level in the blocks
+_NO_LEVEL = 255
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, directory TEXT, indexed_at REAL);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, job_id TEXT, role TEXT, party_id TEXT, component TEXT, path TEXT);
+CREATE INDEX IF NOT EXISTS files_job ON files (job_id);
+CREATE INDEX IF NOT EXISTS files_component ON files (component, job_id);
+CREATE TABLE IF NOT EXISTS blocks (id INTEGER PRIMARY KEY, file_id INTEGER, levels INTEGER, offset INTEGER, records BLOB);
+CREATE INDEX IF NOT EXISTS blocks_file ON blocks (file_id);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS postings (term_id INTEGER, block_id INTEGER, PRIMARY KEY (term_id, block_id)) WITHOUT ROWID;
+"""
+
+
+def tokenize(text):
+    """ Return the set of indexed tokens of a text, lower case words holding a letter
+
+    :rtype: set
+
+    """
+    # numbers alone are too frequent to be worth indexing
+    return set(token for token in set(_TOKEN.findall(text.lower())) if not token.isdigit())
+
+
+def message_text(record):
+    """ Return the text of a record without the level, time and source of its first line
+
+    :param record: A record as written in the log
+    :type record: bytes
+
+    :rtype: string
+
+    """
+    match = _RECORD_START.match(record)
+    if match is not None:
+        found = _MESSAGE_START.search(record, match.end(), record.find(b"\n"))
+        record = record[found.end() if found else match.end():]
+    return record.decode("utf-8", errors="replace")
+
+
+def log_file_location(name, job_id=None):
+    """ Return (role, party_id, component) of a file of a job log archive
+
+    e.g. "guest/9999/hetero_lr_0/ERROR.log" gives ("guest", "9999", "hetero_lr_0"),
+    the job files such as "fate_flow_schedule.log" give (None, None, None).
+
+    :rtype: tuple
+
+    """
+    parts = name.replace(os.sep, "/").strip("/").split("/")
+    if job_id is not None and parts[0] == job_id:
+        parts = parts[1:]
+    if len(parts) < 3:
+        return None, None, None
+    component = parts[2] if len(parts) > 3 else None
+    return parts[0], parts[1], component
+
+
+def _pack_block(records):
+    # level codes, then offsets relative to the first record and lengths, compressed
+    first = records[0][1]
+    levels = bytes(level for level, _, _ in records)
+    offsets = array("I", (offset - first for _, offset, _ in records))
+    lengths = array("I", (length for _, _, length in records))
+    return first, zlib.compress(levels + offsets.tobytes() + lengths.tobytes(), 1)
+
+
+def _unpack_block(first, blob):
+    data = zlib.decompress(blob)
+    count = len(data) // 9
+    offsets, lengths = array("I"), array("I")
+    offsets.frombytes(data[count:count * 5])
+    lengths.frombytes(data[count * 5:])
+    return [(level, first + offset, length) for level, offset, length in zip(data[:count], offsets, lengths)]
+
+
+class LogIndex:
+    """LogIndex is a local index of extracted job logs
+
+    It records the offset of every log record of a job file, with the
+    role, party, component and level of the record, and the tokens of
+    its message. Queries are answered from the index and only the matching
+    records are read from the logs, e.g. the ERROR records of hetero_lr_0
+    in the last 300 jobs mentioning a timeout
+
+        index = manager.log_index
+        manager.fetch_job_logs(job_ids, parallelism=8)
+        for record in index.search(component="hetero_lr_0", level="ERROR", text="timeout", last=300):
+            print(record.job_id, record.message)
+
+    FATE writes a record in the log of its level and in the logs of the
+    lower levels, so a record of a higher level than its file, e.g. an
+    ERROR record of INFO.log, is indexed from the file of the highest
+    level up to its own which is extracted, and every record is indexed
+    once. There is no CRITICAL.log, these records come from ERROR.log.
+
+    To keep the index small, the records of a file are stored by blocks
+    of 128, as compressed arrays of levels, offsets and lengths, and the
+    tokens are recorded per block. A text query reads the records of the
+    blocks holding every token and keeps the ones holding them too.
+
+    The index is a SQLite database, it may be shared by threads and
+    processes. The logs are not copied, a record whose file is removed is
+    not returned.
+    """
+
+    def __init__(self, path):
+        """ Open the index, the database is created if missing
+
+        :param path: Path to the database
+        :type path: string
+
+        """
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # transactions are explicit, see _write
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        # the index can be rebuilt from the logs, readers need not wait for writers
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._terms = {}
+
+    def indexer(self, job_id, directory):
+        """ Return a JobIndexer replacing the records of the job, see extract_tar_stream
+
+        :param job_id: The UUID of job
+        :type job_id: string
+        :param directory: Directory the log of the job is extracted to
+        :type directory: string
+
+        :rtype: JobIndexer
+
+        """
+        return JobIndexer(self, job_id, directory)
+
+    def index_directory(self, job_id, directory):
+        """ Index the log of a job already extracted, e.g. by an earlier fetch_job_log
+
+        :returns: Number of records indexed
+        :rtype: int
+
+        """
+        with self.indexer(job_id, directory) as indexer:
+            for root, _, names in os.walk(directory):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    parser = indexer(os.path.relpath(path, directory), path)
+                    if parser is None:
+                        continue
+                    with open(path, "rb") as f:
+                        while True:
+                            block = f.read(1024 * 1024)
+                            if not block:
+                                break
+                            parser.write(block)
+                    parser.close()
+        return indexer.records
+
+    def jobs(self):
+        """ Return the indexed jobs, the last indexed first
+
+        :rtype: list
+
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT job_id FROM jobs ORDER BY indexed_at DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, job_ids=None, role=None, party_id=None, component=None, level=None, text=None, last=None, limit=None):
+        """ Return the log records matching every given condition
+
+        :param job_ids: Jobs to search, default=None for every job
+        :type job_ids: list
+        :param role: Role of the party, e.g. "guest"
+        :type role: string
+        :param party_id: Party id
+        :type party_id: string or int
+        :param component: Component name, e.g. "hetero_lr_0"
+        :type component: string
+        :param level: Level or list of levels of the records, e.g. "ERROR"
+        :type level: string or list
+        :param text: Words that must all be in the record, case insensitive
+        :type text: string
+        :param last: Search the last indexed jobs only, e.g. 300
+        :type last: int
+        :param limit: Max number of records, default=None for all
+        :type limit: int
+
+        :returns: Records sorted by job, file and offset
+        :rtype: list of LogRecord
+
+        """
+        conditions, args = [], []
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            conditions.append("f.job_id IN ({})".format(",".join("?" * len(job_ids))))
+            args.extend(job_ids)
+        if last is not None:
+            conditions.append("f.job_id IN (SELECT job_id FROM jobs ORDER BY indexed_at DESC LIMIT ?)")
+            args.append(last)
+        for column, value in (("f.role", role), ("f.party_id", party_id), ("f.component", component)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(str(value))
+        codes = None
+        if level is not None:
+            levels = [level] if isinstance(level, str) else list(level)
+            for value in levels:
+                if value.upper() not in LEVELS:
+                    raise ValueError("Unknown log level {}, expected one of {}".format(value, ", ".join(LEVELS)))
+            codes = set(LEVELS.index(value.upper()) for value in levels)
+            conditions.append("b.levels & ? != 0")
+            args.append(sum(1 << code for code in codes))
+        tokens = tokenize(text or "")
+        for token in sorted(tokens):
+            conditions.append("b.id IN (SELECT p.block_id FROM postings p JOIN terms t "
+                              "ON p.term_id = t.id WHERE t.term = ?)")
+            args.append(token)
+        query = ("SELECT f.job_id, f.role, f.party_id, f.component, f.path, b.offset, b.records "
+                 "FROM blocks b JOIN files f ON b.file_id = f.id")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY f.job_id, f.id, b.id"
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        records = self._read(rows, codes)
+        if tokens:
+            # the block holds the tokens, not necessarily the record
+            records = (record for record in records if tokens <= tokenize(message_text(record.message.encode("utf-8"))))
+        return list(itertools.islice(records, limit))
+
+    def remove(self, job_id):
+        """ Remove the records of a job from the index, the logs are kept
+        """
+        with self._lock:
+            self._write(self._remove, job_id)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _read(self, rows, codes):
+        # the records of a file are read in order through a single handle
+        path, f = None, None
+        try:
+            for job_id, role, party_id, component, block_path, first, blob in rows:
+                if block_path != path:
+                    if f is not None:
+                        f.close()
+                    path = block_path
+                    try:
+                        f = open(path, "rb")
+                    except (IOError, OSError):
+                        f = None
+                if f is None:
+                    continue
+                for code, offset, length in _unpack_block(first, blob):
+                    if codes is not None and code not in codes:
+                        continue
+                    f.seek(offset)
+                    message = f.read(length).decode("utf-8", errors="replace").rstrip("\r\n")
+                    level = LEVELS[code] if code != _NO_LEVEL else None
+                    yield LogRecord(job_id, role, party_id, component, level, path, offset, message)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _write(self, function, *args):
+        # an immediate transaction takes the write lock of the database at once,
+        # so several processes writing the index wait for each other
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(*args)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return result
+
+    def _remove_files(self, file_ids):
+        marks = ",".join("?" * len(file_ids))
+        self._db.execute("DELETE FROM postings WHERE block_id IN (SELECT id FROM blocks WHERE file_id IN ({}))"
+                         .format(marks), file_ids)
+        self._db.execute("DELETE FROM blocks WHERE file_id IN ({})".format(marks), file_ids)
+        self._db.execute("DELETE FROM files WHERE id IN ({})".format(marks), file_ids)
+
+    def _remove(self, job_id):
+        # postings are keyed by term, removing a job scans them once
+        self._db.execute("DELETE FROM postings WHERE block_id IN (SELECT b.id FROM blocks b "
+                         "JOIN files f ON b.file_id = f.id WHERE f.job_id = ?)", (job_id,))
+        self._db.execute("DELETE FROM blocks WHERE file_id IN (SELECT id FROM files WHERE job_id = ?)", (job_id,))
+        self._db.execute("DELETE FROM files WHERE job_id = ?", (job_id,))
+        self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def _start_job(self, job_id, directory):
+        with self._lock:
+            self._write(self._replace_job, job_id, directory)
+
+    def _replace_job(self, job_id, directory):
+        if self._db.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone():
+            self._remove(job_id)
+        self._db.execute("INSERT INTO jobs VALUES (?, ?, ?)", (job_id, os.path.abspath(directory), time.time()))
+
+    def _add_file(self, job_id, name, path):
+        role, party_id, component = log_file_location(name, job_id)
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO files (job_id, role, party_id, component, path) VALUES (?, ?, ?, ?, ?)",
+                                      (job_id, role, party_id, component, os.path.abspath(path)))
+            return cursor.lastrowid
+
+    def _add_blocks(self, file_id, blocks):
+        with self._lock:
+            self._write(self._insert_blocks, file_id, blocks)
+
+    def _insert_blocks(self, file_id, blocks):
+        for levels, first, blob, terms in blocks:
+            cursor = self._db.execute("INSERT INTO blocks (file_id, levels, offset, records) VALUES (?, ?, ?, ?)",
+                                      (file_id, levels, first, blob))
+            term_ids = self._term_ids(terms)
+            self._db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)",
+                                 ((term_ids[term], cursor.lastrowid) for term in terms))
+
+    def _term_ids(self, terms):
+        missing = [term for term in terms if term not in self._terms]
+        if missing:
+            self._db.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", ((term,) for term in missing))
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                self._terms.update(self._db.execute(
+                    "SELECT term, id FROM terms WHERE term IN ({})".format(",".join("?" * len(chunk))), chunk))
+        return self._terms
+
+
+class JobIndexer:
+    """JobIndexer indexes the files of a job log as they are extracted
+
+    It is the observer of extract_tar_stream: called with the name and
+    path of a member, it returns a parser of the .log files to write the
+    blocks of the member to. Used as a context manager, the job is removed
+    from the index if the extraction fails.
+
+    The records of a level file of a higher level than the file are
+    indexed apart, and dropped at the end if a file of a level between
+    them was extracted in the same directory, as the members come in any
+    order.
+    """
+
+    def __init__(self, index, job_id, directory):
+        self.index = index
+        self.job_id = job_id
+
+        #: Number of records indexed
+        self.records = 0
+
+        # directory and level of the level files, and the writers of the records of higher levels by
+        # directory, file level and record level
+        self._level_files = set()
+        self._borrowed = {}
+
+        index._start_job(job_id, directory)
+
+    def __call__(self, name, path):
+        if not name.endswith(".log"):
+            return None
+        level = os.path.splitext(os.path.basename(name))[0].upper()
+        if level not in LEVELS:
+            level = None
+        else:
+            self._level_files.add((os.path.dirname(name), level))
+        return _RecordParser(self, name, path, level)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.index.remove(self.job_id)
+            return
+        dropped = [writer for key, writers in self._borrowed.items() if self._covered(*key)
+                   for writer in writers]
+        if dropped:
+            with self.index._lock:
+                self.index._write(self.index._remove_files, [writer.file_id for writer in dropped])
+            self.records -= sum(writer.records for writer in dropped)
+
+    def _writer(self, name, path):
+        return _BlockWriter(self.index, self.index._add_file(self.job_id, name, path))
+
+    def _covered(self, directory, file_level, level):
+        # whether a file of a level above the file, up to the one of the records, holds them too
+        levels = LEVELS[LEVELS.index(file_level) + 1:LEVELS.index(level) + 1]
+        return any((directory, other) in self._level_files for other in levels)
+
+    def _borrow(self, name, path, file_level, level):
+        # a writer of the records of a higher level, unless they are indexed from a higher file
+        key = (os.path.dirname(name), file_level, level)
+        if self._covered(*key):
+            return None
+        writer = self._writer(name, path)
+        self._borrowed.setdefault(key, []).append(writer)
+        return writer
+
+
+class _BlockWriter:
+    # sends the records of a file to the index by blocks of records
+
+    def __init__(self, index, file_id):
+        self.index = index
+        self.file_id = file_id
+
+        #: Number of records written
+        self.records = 0
+
+        self._records = []
+        self._texts = []
+        self._blocks = []
+
+    def add(self, code, offset, length, texts):
+        self._records.append((code, offset, length))
+        self._texts.extend(texts)
+        if len(self._records) >= cIndexBlockRecords:
+            self._end_block()
+
+    def close(self):
+        self._end_block()
+        self._flush()
+
+    def _end_block(self):
+        # the block is packed and tokenized outside the lock of the index
+        if not self._records:
+            return
+        levels = 0
+        for code, _, _ in self._records:
+            if code != _NO_LEVEL:
+                levels |= 1 << code
+        first, blob = _pack_block(self._records)
+        terms = tokenize(_HEADER.sub(b"", b"".join(self._texts)).decode("utf-8", errors="replace"))
+        self._blocks.append((levels, first, blob, terms))
+        self.records += len(self._records)
+        self._records = []
+        self._texts = []
+        if len(self._blocks) >= cIndexBatchBlocks:
+            self._flush()
+
+    def _flush(self):
+        if self._blocks:
+            self.index._add_blocks(self.file_id, self._blocks)
+            self._blocks = []
+
+
+class _RecordParser:
+    # splits the blocks of a log file into records and sends them to the writer of their level
+
+    def __init__(self, indexer, name, path, file_level):
+        self._indexer = indexer
+        self._name = name
+        self._path = path
+        self._file_level = file_level
+        self._writer = indexer._writer(name, path)
+        # writers of the records of higher levels, None for the levels indexed from a higher file
+        self._others = {}
+        self._offset = 0
+        self._rest = b""
+        # level, prefixed, offset, length and parts of the current record
+        self._record = None
+
+    def write(self, block):
+        data = self._rest + block
+        end = data.rfind(b"\n") + 1
+        self._rest = data[end:]
+        if end:
+            self._parse(data[:end])
+
+    def close(self):
+        if self._rest:
+            self._parse(self._rest)
+            self._rest = b""
+        self._end_record()
+        for writer in [self._writer] + list(self._others.values()):
+            if writer is not None:
+                writer.close()
+                self._indexer.records += writer.records
+
+    def _parse(self, data):
+        # data holds whole lines, a record runs until the next line starting with a level
+        base = self._offset
+        self._offset += len(data)
+        position = 0
+        for match in _RECORD_LINE.finditer(data):
+            if match.start() > position:
+                self._extend(data, position, match.start(), base)
+            self._end_record()
+            self._record = [match.group(1).decode("ascii"), True, base + match.start(), 0, []]
+            position = match.start()
+        self._extend(data, position, len(data), base)
+
+    def _extend(self, data, start, stop, base):
+        record = self._record
+        if record is not None and record[1]:
+            # tracebacks continue the record
+            record[3] += stop - start
+            record[4].append(data[start:stop])
+            return
+        # lines without level, an indented line continues the record
+        for line in data[start:stop].splitlines(True):
+            if record is not None and line[:1] in b" \t":
+                record[3] += len(line)
+                record[4].append(line)
+            else:
+                self._end_record()
+                record = self._record = [self._file_level, False, base + start, len(line), [line]]
+            start += len(line)
+
+    def _end_record(self):
+        record, self._record = self._record, None
+        if record is None:
+            return
+        writer = self._writer
+        # a level file also holds the records of the higher levels
+        if self._file_level is not None and record[0] != self._file_level:
+            if record[0] not in self._others:
+                self._others[record[0]] = self._indexer._borrow(
+                    self._name, self._path, self._file_level, record[0])
+            writer = self._others[record[0]]
+            if writer is None:
+                return
+        code = LEVELS.index(record[0]) if record[0] is not None else _NO_LEVEL
+        writer.add(code, record[2], record[3], record[4])
@@ -0,0 +1,278 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from fml_manager import flow_requests
+from fml_manager.job_waiter import Backoff, TERMINAL_STATUSES
+from fml_manager.utils.fate_builders import QueryCondition
+
+#: New points of a metric series, points is a list of [step, value]
+MetricUpdate = namedtuple("MetricUpdate", ["job_id", "component_name", "namespace", "metric", "points"])
+
+
+def metric_filter(metrics):
+    """ Return a predicate keeping the MetricUpdates of some metrics
+
+    :param metrics: Metric names or (namespace, metric) pairs, None keeps every metric
+    :type metrics: list
+
+    :rtype: callable
+
+    """
+    if metrics is None:
+        return lambda update: True
+    wanted = set(tuple(metric) if isinstance(metric, (list, tuple)) else metric for metric in metrics)
+    return lambda update: update.metric in wanted or (update.namespace, update.metric) in wanted
+
+
+class MetricSeries:
+    """MetricSeries keeps the last seen step of the metric series of a component
+
+    FATE Flow returns a series sorted by step, so the new points are found
+    from the end of the series and the points already seen are not looked at.
+    """
+
+    def __init__(self, job_id, component_name):
+        self.job_id = job_id
+        self.component_name = component_name
+        self._last = {}
+
+    def update(self, result):
+        """ Return the MetricUpdates of a component metric all result
+
+        :param result: Result of track_component_all_metric
+        :type result: dict
+
+        :rtype: list of MetricUpdate
+
+        """
+        if result.get("retcode") != 0:
+            # no metric is logged yet
+            return []
+        updates = []
+        for namespace, names in sorted((result.get("data") or {}).items()):
+            for name, series in sorted(names.items()):
+                points = self._new_points((namespace, name), series.get("data") or [])
+                if points:
+                    updates.append(MetricUpdate(self.job_id, self.component_name, namespace, name, points))
+        return updates
+
+    def _new_points(self, key, points):
+        if not points:
+            return []
+        last = self._last.get(key)
+        start = len(points)
+        try:
+            while start > 0 and (last is None or points[start - 1][0] > last):
+                start -= 1
+        except TypeError:
+            # steps of mixed types, the points after the last seen step are new
+            steps = [point[0] for point in points]
+            start = len(steps) - steps[::-1].index(last) if last in steps else 0
+        self._last[key] = points[-1][0]
+        return points[start:]
+
+
+class _Subscription:
+    def __init__(self, callback, metrics):
+        self.callback = callback
+        self.wanted = metric_filter(metrics)
+        self.future = Future()
+
+
+class _WatchedComponent:
+    def __init__(self, key):
+        self.key = key
+        self.job_id, self.component_name, self.role, self.party_id = key
+        self.series = MetricSeries(self.job_id, self.component_name)
+        self.subscriptions = []
+        self.attempt = 0
+        self.status = None
+
+
+class MetricWatcher:
+    """MetricWatcher tails the metrics of running jobs from one polling thread
+
+    Every watched component is polled with its own backoff, which starts
+    again from the shortest interval whenever new points arrive. Only the
+    points after the last seen step of every series are passed to the
+    callbacks, e.g.
+
+        watcher = MetricWatcher(manager)
+        future = watcher.watch(job_id, "hetero_lr_0", "guest", 10000, callback=print)
+        status = future.result()
+
+    A watch ends when the job reaches a terminal status, after the points
+    logged until then are delivered. Its future resolves to that status.
+    """
+
+    def __init__(self, manager, backoff=None):
+        """ Init the watcher
+
+        :param manager: Manager used to query the jobs
+        :type manager: FMLManager
+        :param backoff: Polling intervals, default=Backoff()
+        :type backoff: Backoff
+
+        """
+        self.manager = manager
+        self.backoff = backoff if backoff is not None else Backoff()
+
+        #: Number of polls issued, a poll is a job query and a metric query
+        self.polls = 0
+
+        self._components = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def watch(self, job_id, component_name, role, party_id, callback, metrics=None):
+        """ Start tailing the metrics of a component
+
+        A component watched several times is polled once for all callbacks,
+        a later callback gets the points from its first poll on.
+
+        :param job_id: The UUID of job
+        :type job_id: string
+        :param component_name: Name of the component
+        :type component_name: string
+        :param role: Role of the party, e.g. guest
+        :type role: string
+        :param party_id: Id of the party
+        :type party_id: int
+        :param callback: Called with every MetricUpdate, from the polling thread
+        :type callback: callable
+        :param metrics: Metric names or (namespace, metric) pairs to watch, default=None for all
+        :type metrics: list
+
+        :returns: Future of the terminal status of the job
+        :rtype: concurrent.futures.Future
+
+        """
+        subscription = _Subscription(callback, metrics)
+        key = (job_id, component_name, role, party_id)
+        with self._condition:
+            if self._closed:
+                raise Exception("MetricWatcher is closed")
+            watched = self._components.get(key)
+            if watched is None:
+                watched = _WatchedComponent(key)
+                self._components[key] = watched
+                heapq.heappush(self._queue, (time.monotonic(), next(self._counter), watched))
+            watched.subscriptions.append(subscription)
+            self._ensure_thread()
+            self._condition.notify()
+        return subscription.future
+
+    def unwatch(self, future):
+        """ Stop a watch, the component is not polled any more once it has no watch
+        """
+        with self._condition:
+            for key, watched in list(self._components.items()):
+                watched.subscriptions = [subscription for subscription in watched.subscriptions
+                                         if subscription.future is not future]
+                if not watched.subscriptions:
+                    del self._components[key]
+        future.cancel()
+
+    def close(self):
+        """ Stop the polling thread, the pending futures are cancelled
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        for watched in list(self._components.values()):
+            for subscription in watched.subscriptions:
+                subscription.future.cancel()
+        self._components.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fml-metric-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._queue:
+                        wait = self._queue[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                _, _, watched = heapq.heappop(self._queue)
+                # a component unwatched, and maybe watched again since, has a new entry
+                current = self._components.get(watched.key) is watched
+            if not current:
+                continue
+            self._poll(watched)
+
+    def _poll(self, watched):
+        updates = []
+        try:
+            self.polls += 1
+            # the status is read first, so the metrics read after a terminal status are complete
+            result = self.manager._send(flow_requests.query_job(QueryCondition(watched.job_id))).json()
+            watched.status = flow_requests.job_status(result)
+            result = self.manager._send(flow_requests.track_component_all_metric(
+                watched.job_id, watched.role, watched.party_id, watched.component_name)).json()
+            updates = watched.series.update(result)
+        except Exception as e:
+            # the job may not be visible yet, or FATE Flow is busy, try again later
+            print("Failed to fetch metrics of {}: {}".format(watched.job_id, e))
+            watched.status = None
+
+        with self._condition:
+            subscriptions = list(watched.subscriptions)
+        for update in updates:
+            for subscription in subscriptions:
+                if subscription.wanted(update):
+                    try:
+                        subscription.callback(update)
+                    except Exception as e:
+                        print("Callback of metrics of {} failed: {}".format(watched.job_id, e))
+
+        if watched.status in TERMINAL_STATUSES:
+            with self._condition:
+                self._components.pop(watched.key, None)
+            for subscription in subscriptions:
+                # unless unwatched meanwhile, a running future can no longer be cancelled by unwatch
+                if subscription.future.set_running_or_notify_cancel():
+                    subscription.future.set_result(watched.status)
+            return
+
+        # new points bring the polls back to the shortest interval
+        watched.attempt = 0 if updates else watched.attempt + 1
+        with self._condition:
+            poll_at = time.monotonic() + self.backoff.interval(watched.attempt)
+            heapq.heappush(self._queue, (poll_at, next(self._counter), watched))
@@ -0,0 +1,160 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from collections.abc import Mapping
+
+from fml_manager.utils.core import json_loads
+
+_UNDECODED = object()
+
+
+class FlowResponse(Mapping):
+    """FlowResponse is the result of the calls of the managers
+
+    It keeps the raw body of the response, which is decoded on the first
+    access to its JSON and only once, e.g.
+
+        response = manager.track_component_output_data(job_id, "guest", 10000, "dataio_0")
+        response.status_code    # the body is not decoded
+        response["data"]        # the body is decoded
+        response                # pretty printed when displayed
+
+    The body is decoded by orjson when it is installed, see
+    fml_manager.utils.core.set_json_decoder. FlowResponse provides the
+    subset of requests.Response used by the callers, so the responses of
+    AsyncFMLManager and FMLManager are handled alike, and is a read-only
+    mapping of the members of the body, as the results of fetch_job_log
+    or download_data were dicts, e.g. "files" in response, response.items().
+    As requests.Response, it is true if the status code is below 400.
+    """
+
+    def __init__(self, status_code, content, headers=None, url=None):
+        """ Init the response with the raw body
+
+        :param status_code: HTTP status code
+        :type status_code: int
+        :param content: Raw body of the response
+        :type content: bytes
+        :param headers: Headers of the response
+        :type headers: dict
+        :param url: Url of the request
+        :type url: string
+
+        """
+        self.status_code = status_code
+        self.headers = dict(headers or {})
+        self.url = url
+        self._content = content
+        self._json = _UNDECODED
+
+    @classmethod
+    def of(cls, response):
+        """ Return a requests.Response, or a result built by the client such as a dict, as a FlowResponse
+
+        :rtype: FlowResponse
+
+        """
+        if isinstance(response, FlowResponse):
+            return response
+        if isinstance(response, (dict, list)):
+            return cls.from_result(response)
+        return cls(response.status_code, response.content, response.headers, response.url)
+
+    @classmethod
+    def from_result(cls, result, status_code=200):
+        """ Return a result built by the client, e.g. the one of fetch_job_log, as a FlowResponse
+
+        The body is only encoded if content is read.
+
+        :rtype: FlowResponse
+
+        """
+        response = cls(status_code, None, {"Content-Type": "application/json"})
+        response._json = result
+        return response
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = json.dumps(self._json, ensure_ascii=False).encode("utf-8")
+        return self._content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        """ Return the decoded body, it is decoded on the first call and shared by the next ones
+        """
+        if self._json is _UNDECODED:
+            self._json = json_loads(self.content)
+        return self._json
+
+    @property
+    def retcode(self):
+        """ retcode of FATE Flow, None if the body has none
+        """
+        return self.get("retcode")
+
+    @property
+    def retmsg(self):
+        return self.get("retmsg")
+
+    @property
+    def data(self):
+        return self.get("data")
+
+    def get(self, key, default=None):
+        """ Return a member of the decoded body, default if missing or if the body is not an object
+        """
+        return self._members().get(key, default)
+
+    def _members(self):
+        # the members of the body, none if it is not an object
+        try:
+            result = self.json()
+        except ValueError:
+            return {}
+        return result if isinstance(result, dict) else {}
+
+    def __getitem__(self, key):
+        return self.json()[key]
+
+    def __contains__(self, key):
+        return key in self._members()
+
+    def __iter__(self):
+        return iter(self._members())
+
+    def __len__(self):
+        return len(self._members())
+
+    def __bool__(self):
+        return self.ok
+
+    def __str__(self):
+        try:
+            return json.dumps(self.json(), indent=4, ensure_ascii=False)
+        except ValueError:
+            return self.text
+
+    def _repr_pretty_(self, printer, cycle):
+        # IPython and Jupyter display the pretty printed body
+        printer.text(str(self))
+
+    def __repr__(self):
+        return "<FlowResponse [{}]>".format(self.status_code)
@@ -0,0 +1,226 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from fml_manager.response import FlowResponse
+
+#: Directory of the cache when none is given
+cDefaultCacheDir = os.path.join("~", ".cache", "fml_manager")
+
+#: Max total size in bytes of the cached results
+cDefaultCacheSize = 1024 * 1024 * 1024
+
+#: Seconds a job found running is not queried again before its tracking calls
+cDefaultRunningTTL = 10.0
+
+_ENTRY_SUFFIX = ".entry"
+_CACHE_VERSION = 1
+
+
+class ResultCache:
+    """ResultCache keeps the tracking results of finished jobs on disk
+
+    The tracking data of a job does not change once the job reaches a
+    terminal status, so the managers store the responses of the tracking
+    calls of finished jobs here and answer the next calls from disk, e.g.
+
+        cache = ResultCache()
+        manager = FMLManager(cache=cache)
+        manager.track_component_output_data(job_id, "guest", 10000, "dataio_0")
+        print(cache.hits, cache.misses)
+
+    Every result is a file named by the hash of the server, the endpoint
+    and the arguments of the call. Files are written to a temporary name
+    and renamed, so several processes can share the directory. A hit
+    touches the file, and the least recently used files are removed once
+    the total size goes over max_size.
+
+    A job found running is remembered for running_ttl seconds, so the
+    tracking calls of a running job do not each query its status first;
+    their results are not stored meanwhile.
+    """
+
+    def __init__(self, path=cDefaultCacheDir, max_size=cDefaultCacheSize, running_ttl=cDefaultRunningTTL):
+        """ Init the cache, the directory is created if missing
+
+        :param path: Directory of the cache, default=~/.cache/fml_manager
+        :type path: string
+        :param max_size: Max total size in bytes of the results, default=1GB
+        :type max_size: int
+        :param running_ttl: Seconds a job found running is taken as running, default=10
+        :type running_ttl: float
+
+        """
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.running_ttl = running_ttl
+        os.makedirs(self.path, exist_ok=True)
+
+        #: Number of calls answered from the cache
+        self.hits = 0
+
+        #: Number of cacheable calls sent to FATE Flow
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._finished = set()
+        self._running = {}
+        self._size = None
+
+    def key(self, server_url, request):
+        """ Return the key of a call, the hash of the server, endpoint and arguments
+
+        :param server_url: Url of FATE Flow
+        :type server_url: string
+        :param request: The call
+        :type request: FlowRequest
+
+        :rtype: string
+
+        """
+        identity = [_CACHE_VERSION, server_url, request.method, list(request.path),
+                    request.kwargs.get("json"), request.kwargs.get("params")]
+        encoded = json.dumps(identity, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """ Return the cached response of a call, or None and count a miss
+
+        :rtype: FlowResponse
+
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                content = f.read()
+            # the hit makes the entry the most recently used one
+            os.utime(path)
+        except (IOError, OSError, ValueError):
+            # missing, or evicted by another process meanwhile
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return FlowResponse(meta["status_code"], content, meta["headers"], meta["url"])
+
+    def put(self, key, response):
+        """ Store the response of a call
+
+        :param key: Key of the call
+        :type key: string
+        :param response: Fully read response
+        :type response: requests.Response or FlowResponse
+
+        """
+        # the content is stored decoded, so only its type is kept
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() == "content-type"}
+        meta = json.dumps({"status_code": response.status_code,
+                           "headers": headers, "url": response.url})
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(meta.encode("utf-8") + b"\n")
+                f.write(response.content)
+            os.replace(temp_path, self._entry_path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += len(meta) + 1 + len(response.content)
+            over = self._size is None or self._size > self.max_size
+        if over:
+            self.evict()
+
+    def is_finished(self, server_url, job_id):
+        """ Return whether the job is known to have reached a terminal status
+        """
+        return (server_url, job_id) in self._finished
+
+    def set_finished(self, server_url, job_id):
+        """ Record that the job has reached a terminal status
+        """
+        self._finished.add((server_url, job_id))
+        self._running.pop((server_url, job_id), None)
+
+    def is_running(self, server_url, job_id):
+        """ Return whether the job was found running less than running_ttl seconds ago
+        """
+        return self._running.get((server_url, job_id), 0.0) > time.monotonic()
+
+    def set_running(self, server_url, job_id):
+        """ Record that the job was found running, for running_ttl seconds
+        """
+        self._running[(server_url, job_id)] = time.monotonic() + self.running_ttl
+
+    @property
+    def size(self):
+        """ Total size in bytes of the cached results
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """ Remove the least recently used results until the total size is under max_size
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another process
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        """ Remove every cached result and reset the counters
+        """
+        for path, _, _ in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self._size = 0
+        self._finished.clear()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + _ENTRY_SUFFIX)
+
+    def _entries(self):
+        # (path, size, last use) of every result, files being written are skipped
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
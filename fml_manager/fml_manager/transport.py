@@ -0,0 +1,224 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fml_manager.response import FlowResponse
+
+cDefaultPoolSize = 10
+
+
+class HttpTransport:
+    """HttpTransport keeps a pool of keep-alive connections to FATE services
+
+    One transport can be shared by several FMLManager instances, so all of
+    them reuse the same connections instead of opening one per call.
+    """
+
+    def __init__(self, pool_size=cDefaultPoolSize, timeout=None, max_retries=0):
+        """ Init the transport with a connection pool
+
+        :param pool_size: Max number of keep-alive connections per host, default=10
+        :type pool_size: int
+        :param timeout: Default timeout in seconds of every call, None means wait forever
+        :type timeout: float or tuple
+        :param max_retries: Retries of failed connection attempts, default=0
+        :type max_retries: int
+
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """ Send a request through the pooled session
+
+        :param method: HTTP method
+        :type method: string
+        :param url: Url of the request
+        :type url: string
+        :param timeout: Timeout of this call, fallback to the default timeout if None
+        :type timeout: float or tuple
+
+        :returns: response
+        :rtype: requests.Response
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url, timeout=None, **kwargs):
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def post(self, url, timeout=None, **kwargs):
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def close(self):
+        """ Close all pooled connections
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncHttpTransport:
+    """AsyncHttpTransport is the asyncio counterpart of HttpTransport
+
+    It is backed by an aiohttp session which is created in the running event
+    loop on first use. max_concurrency bounds the in-flight calls of every
+    manager sharing the transport, so a fan-out does not overload FATE Flow.
+    """
+
+    def __init__(self, pool_size=cDefaultPoolSize, timeout=None, max_concurrency=None):
+        """ Init the transport, aiohttp is required
+
+        :param pool_size: Max number of keep-alive connections, default=10
+        :type pool_size: int
+        :param timeout: Default timeout in seconds of every call, None means wait forever
+        :type timeout: float or tuple
+        :param max_concurrency: Max number of in-flight calls, None means no limit
+        :type max_concurrency: int
+
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError(
+                "AsyncHttpTransport requires aiohttp, please install it by 'pip install aiohttp'")
+        self._aiohttp = aiohttp
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = self._aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = self._aiohttp.ClientSession(connector=connector)
+            if self.max_concurrency is not None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _client_timeout(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            return self._aiohttp.ClientTimeout(total=None)
+        if isinstance(timeout, tuple):
+            # same as requests, a tuple is (connect timeout, read timeout)
+            return self._aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return self._aiohttp.ClientTimeout(total=timeout)
+
+    def stream(self, method, url, timeout=None, bounded=True, **kwargs):
+        """ Send a request and return a context manager of the aiohttp response before its body is read, e.g.
+
+            async with transport.stream("GET", url) as response:
+                async for chunk in response.content.iter_chunked(65536):
+                    ...
+
+        :param method: HTTP method
+        :type method: string
+        :param url: Url of the request
+        :type url: string
+        :param timeout: Timeout of this call, fallback to the default timeout if None
+        :type timeout: float or tuple
+        :param bounded: Whether the call takes a slot of max_concurrency, default=True
+        :type bounded: bool
+
+        """
+        kwargs.pop("stream", None)
+        return _Stream(self, method, url, timeout, bounded, kwargs)
+
+    async def request(self, method, url, timeout=None, **kwargs):
+        """ Send a request and read the whole body
+
+        :returns: response
+        :rtype: FlowResponse
+
+        """
+        async with self.stream(method, url, timeout=timeout, **kwargs) as response:
+            content = await response.read()
+            return FlowResponse(response.status, content, response.headers, str(response.url))
+
+    async def get(self, url, timeout=None, **kwargs):
+        return await self.request("GET", url, timeout=timeout, **kwargs)
+
+    async def post(self, url, timeout=None, **kwargs):
+        return await self.request("POST", url, timeout=timeout, **kwargs)
+
+    async def close(self):
+        """ Close all pooled connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class _Stream:
+    # the async context manager of AsyncHttpTransport.stream, contextlib.asynccontextmanager needs Python 3.7
+
+    def __init__(self, transport, method, url, timeout, bounded, kwargs):
+        self._transport = transport
+        self._method = method
+        self._url = url
+        self._timeout = timeout
+        self._bounded = bounded
+        self._kwargs = kwargs
+        self._semaphore = None
+        self._request = None
+
+    async def __aenter__(self):
+        transport = self._transport
+        session = transport._get_session()
+        if self._bounded and transport._semaphore is not None:
+            self._semaphore = transport._semaphore
+            await self._semaphore.acquire()
+        try:
+            self._request = session.request(self._method, self._url,
+                                            timeout=transport._client_timeout(self._timeout), **self._kwargs)
+            return await self._request.__aenter__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            return await self._request.__aexit__(exc_type, exc_value, traceback)
+        finally:
+            self._release()
+
+    def _release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+            self._semaphore = None
@@ -46,10 +46,36 @@ def json_dumps(src, byte=False):
         return json.dumps(src)
 
 
+def _default_json_decoder():
+    # orjson decodes several times faster than json when it is installed
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+_json_decoder = _default_json_decoder()
+
+
+def set_json_decoder(loads=None):
+    """ Set the function decoding the JSON of FATE Flow, e.g. ujson.loads
+
+    :param loads: Called with bytes or str, default=None for orjson if installed, else json
+    :type loads: callable
+
+    """
+    global _json_decoder
+    _json_decoder = _default_json_decoder() if loads is None else loads
+
+
 def json_loads(src):
-    if isinstance(src, bytes):
-        return json.loads(bytes_to_string(src))
-    else:
+    try:
+        return _json_decoder(src)
+    except ValueError:
+        # e.g. NaN or big integers that only json accepts
+        if _json_decoder is json.loads:
+            raise
         return json.loads(src)
 
 
@@ -0,0 +1,129 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pandas as pd
+
+#: Number of rows rendered to CSV at once
+cDefaultBatchRows = 50000
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Arrow tables and Parquet files require pyarrow, please install it by 'pip install pyarrow'")
+    return pyarrow
+
+
+def _types_mapper(pyarrow):
+    # ints and bools become nullable pandas dtypes, so a batch with a null
+    # is not turned into floats or objects and renders like the others
+    dtypes = {pyarrow.bool_(): pd.BooleanDtype()}
+    for bits in (8, 16, 32, 64):
+        dtypes[getattr(pyarrow, "int{}".format(bits))()] = getattr(pd, "Int{}Dtype".format(bits))()
+        dtypes[getattr(pyarrow, "uint{}".format(bits))()] = getattr(pd, "UInt{}Dtype".format(bits))()
+    return dtypes.get
+
+
+def _frame_batches(data, batch_rows):
+    # yield the data as pandas DataFrames of at most batch_rows rows, at least one so the header is written
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, max(len(data), 1), batch_rows):
+            yield data.iloc[start:start + batch_rows]
+        return
+
+    pyarrow = _import_pyarrow()
+    if isinstance(data, pyarrow.Table):
+        schema = data.schema
+        batches = data.to_batches(max_chunksize=batch_rows)
+    elif isinstance(data, str):
+        parquet = pyarrow.parquet.ParquetFile(data)
+        schema = parquet.schema_arrow
+        batches = parquet.iter_batches(batch_size=batch_rows)
+    else:
+        raise Exception(
+            "Unsupported data {}, expect a DataFrame, an Arrow table or a Parquet path".format(type(data)))
+    # the dtypes follow the schema rather than the values of every batch
+    types_mapper = _types_mapper(pyarrow)
+    empty = True
+    for batch in batches:
+        empty = False
+        yield batch.to_pandas(types_mapper=types_mapper)
+    if empty:
+        yield schema.empty_table().to_pandas(types_mapper=types_mapper)
+
+
+class CsvBatchStream:
+    """CsvBatchStream reads a DataFrame, an Arrow table or a Parquet file as CSV bytes
+
+    The CSV is rendered batch_rows rows at a time while it is read, so the
+    text of the whole table never exists in memory. The data is rendered by
+    pandas.to_csv in every case, so all sources give the same text.
+
+    FATE Flow needs the length of the upload, measure() renders the data
+    once without keeping it to count the bytes.
+    """
+
+    def __init__(self, data, index=False, batch_rows=cDefaultBatchRows):
+        """ Init the stream
+
+        :param data: pandas DataFrame, pyarrow Table or path of a Parquet file
+        :type data: object
+        :param index: Write the index of a DataFrame as the first column, default=False
+        :type index: bool
+        :param batch_rows: Number of rows rendered at once, default=50000
+        :type batch_rows: int
+
+        """
+        self.data = data
+        self.index = index
+        self.batch_rows = batch_rows
+
+        #: Length in bytes of the CSV, None until measured
+        self.size = None
+
+        self._chunks = None
+        self._pending = memoryview(b"")
+        self._offset = 0
+
+    def measure(self):
+        """ Render the CSV once to count its bytes
+
+        :rtype: int
+
+        """
+        self.size = sum(len(chunk) for chunk in self._iter_csv())
+        return self.size
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = self._iter_csv()
+        while self._offset >= len(self._pending):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._pending, self._offset = memoryview(chunk), 0
+        if size is None or size < 0:
+            size = len(self._pending) - self._offset
+        data = self._pending[self._offset:self._offset + size]
+        self._offset += len(data)
+        return bytes(data)
+
+    def _iter_csv(self):
+        header = True
+        for frame in _frame_batches(self.data, self.batch_rows):
+            text = frame.to_csv(index=self.index, header=header)
+            header = False
+            if text:
+                yield text.encode("utf-8")
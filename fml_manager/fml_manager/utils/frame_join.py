@@ -0,0 +1,189 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inner join of DataFrames streamed in chunks by several sides
+
+The sides are fed a chunk at a time and in turns. The first side to end
+is the smallest one, it becomes the build side: its rows are kept and
+indexed by key. The chunks of the other sides are buffered until then,
+as many as the build side has, and probed against the index afterwards,
+so the memory used stays proportional to the smallest side.
+"""
+
+import numpy as np
+import pandas as pd
+
+#: Number of rows of the joined DataFrames
+cDefaultJoinRows = 10000
+
+
+class HashJoin:
+    """HashJoin joins the chunks of several sides on a key column
+
+    Feed the chunks of every side with feed and call end once a side has
+    no more rows, both return the joined DataFrames they complete, e.g.
+
+        join = HashJoin(["guest_9999", "host_10000"], on="id")
+        for label, frame in chunks:
+            for joined in join.feed(label, frame):
+                ...
+        for joined in join.end("guest_9999"):
+            ...
+
+    With two sides the joined rows are returned while the larger side is
+    fed. With more sides the rows of every other side matching the build
+    side are kept, and joined once all the sides ended. The joined
+    DataFrames have the key column, then the other columns of each side in
+    the order of the labels. A column name found in several sides is
+    suffixed with the label of its side, e.g. label_host_10000.
+    """
+
+    def __init__(self, labels, on="id", chunk_size=cDefaultJoinRows):
+        """ Init the join
+
+        :param labels: Name of every side, e.g. guest_9999
+        :type labels: list
+        :param on: Name of the key column of every side, default=id
+        :type on: string
+        :param chunk_size: Max number of rows of the DataFrames joined once all the sides ended
+        :type chunk_size: int
+
+        """
+        if len(set(labels)) != len(labels) or len(labels) < 2:
+            raise ValueError("A join needs two or more distinct sides: {}".format(labels))
+        self.labels = list(labels)
+        self.on = on
+        self.chunk_size = chunk_size
+
+        #: Label of the build side, None until a side ended
+        self.build_label = None
+
+        self._pending = {label: [] for label in self.labels}
+        self._columns = {}
+        self._ended = set()
+        self._build = None
+        self._index = None
+        self._counts = None
+        self._matched = {label: [] for label in self.labels}
+
+    @property
+    def done(self):
+        return len(self._ended) == len(self.labels)
+
+    def feed(self, label, frame):
+        """ Take the next chunk of a side
+
+        :rtype: list of pandas.DataFrame
+
+        """
+        if label in self._ended:
+            raise ValueError("Side {} already ended".format(label))
+        if self.on not in frame.columns:
+            raise KeyError("Side {} has no column {}".format(label, self.on))
+        self._columns.setdefault(label, [column for column in frame.columns if column != self.on])
+        if self._build is None:
+            self._pending[label].append(frame)
+            return []
+        return self._probe(label, frame)
+
+    def end(self, label):
+        """ Record that a side has no more rows
+
+        :rtype: list of pandas.DataFrame
+
+        """
+        self._ended.add(label)
+        joined = []
+        if self._build is None:
+            self._set_build(label)
+            for other in self.labels:
+                pending, self._pending[other] = self._pending[other], []
+                for frame in pending:
+                    joined.extend(self._probe(other, frame))
+        if self.done and len(self.labels) > 2:
+            joined.extend(self._join_matched())
+        return joined
+
+    def _keys(self, frame):
+        # categoricals of different chunks do not compare, the keys are plain objects
+        return np.asarray(frame[self.on], dtype=object)
+
+    def _set_build(self, label):
+        self.build_label = label
+        frames, self._pending[label] = self._pending[label], []
+        self._build = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({self.on: []})
+        self._index = pd.Index(self._keys(self._build))
+        if not self._index.is_unique:
+            self._counts = self._index.value_counts()
+
+    def _positions(self, keys):
+        # (row of the chunk, row of the build side) of every match
+        if self._counts is None:
+            positions = self._index.get_indexer(keys)
+            rows = np.arange(len(keys))
+        else:
+            # the matches of a key are listed together, a missing key once as -1
+            positions, _ = self._index.get_indexer_non_unique(keys)
+            counts = self._counts.reindex(keys).fillna(1).values.astype(np.int64)
+            rows = np.repeat(np.arange(len(keys)), counts)
+        found = positions >= 0
+        return rows[found], positions[found]
+
+    def _probe(self, label, frame):
+        if label == self.build_label or len(frame) == 0:
+            return []
+        keys = self._keys(frame)
+        rows, positions = self._positions(keys)
+        if len(rows) == 0:
+            return []
+        matched = frame.iloc[rows].reset_index(drop=True)
+        if len(self.labels) > 2:
+            self._matched[label].append((positions, matched))
+            return []
+        return [self._assemble(keys[rows], {label: matched, self.build_label: self._build.iloc[positions]})]
+
+    def _join_matched(self):
+        # join the rows of the sides by their position on the build side
+        rows = None
+        sides = {}
+        for label in self.labels:
+            if label == self.build_label:
+                continue
+            matched, self._matched[label] = self._matched[label], []
+            if not matched:
+                return []
+            sides[label] = pd.concat([frame for _, frame in matched], ignore_index=True)
+            side_rows = pd.DataFrame({"position": np.concatenate([positions for positions, _ in matched]),
+                                      label: np.arange(len(sides[label]))})
+            rows = side_rows if rows is None else rows.merge(side_rows, on="position")
+        rows = rows.sort_values(list(rows.columns)).reset_index(drop=True)
+        keys = self._index.values
+        frames = []
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows.iloc[start:start + self.chunk_size]
+            positions = chunk["position"].values
+            parts = {label: side.iloc[chunk[label].values] for label, side in sides.items()}
+            parts[self.build_label] = self._build.iloc[positions]
+            frames.append(self._assemble(keys[positions], parts))
+        return frames
+
+    def _assemble(self, keys, sides):
+        seen = {}
+        for label in sides:
+            for column in self._columns.get(label, []):
+                seen[column] = seen.get(column, 0) + 1
+        columns = {self.on: keys}
+        for label in self.labels:
+            for column in self._columns.get(label, []):
+                name = "{}_{}".format(column, label) if seen[column] > 1 else column
+                columns[name] = sides[label][column].values
+        return pd.DataFrame(columns)
@@ -0,0 +1,162 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Typed DataFrames from the rows returned by FATE Flow
+
+The rows of a component output are lists of Python values. Instead of a
+DataFrame of object columns, the type of every column is inferred from the
+header and a sample of the rows, then each column is converted at once
+by NumPy.
+"""
+
+import re
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+#: Number of rows looked at to infer the type of the columns
+cDefaultSampleRows = 1000
+
+#: Columns always stored as categoricals, the ids and labels of FATE data
+cCategoryColumns = ("id", "sid", "label", "y", "predict_result", "type")
+
+_INT = re.compile(r"^[+-]?\d+$")
+
+KIND_CATEGORY = "category"
+KIND_BOOL = "bool"
+KIND_INT = "int"
+KIND_FLOAT = "float"
+KIND_OBJECT = "object"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_float_text(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _infer(name, values):
+    if str(name).lower() in cCategoryColumns:
+        return KIND_CATEGORY
+    present = [value for value in values if value is not None]
+    if not present:
+        return KIND_OBJECT
+    if all(isinstance(value, bool) for value in present):
+        return KIND_BOOL
+    if all(_is_number(value) for value in present):
+        return KIND_INT if all(isinstance(value, int) for value in present) else KIND_FLOAT
+    if all(isinstance(value, str) for value in present):
+        if all(_is_float_text(value) for value in present):
+            return KIND_INT if all(_INT.match(value) for value in present) else KIND_FLOAT
+        # repeated strings are worth a categorical
+        if len(set(present)) * 2 <= len(present):
+            return KIND_CATEGORY
+    return KIND_OBJECT
+
+
+def infer_kinds(rows, header, sample=cDefaultSampleRows):
+    """ Infer the kind of every column from the header and the first rows
+
+    :param rows: Rows of the data
+    :type rows: list
+    :param header: Names of the columns
+    :type header: list
+    :param sample: Number of rows looked at, default=1000
+    :type sample: int
+
+    :returns: One of category, bool, int, float or object per column
+    :rtype: list
+
+    """
+    sampled = rows[:sample]
+    columns = list(zip(*sampled)) if sampled else [()] * len(header)
+    return [_infer(name, values) for name, values in zip(header, columns)]
+
+
+def _as_object(values):
+    return pd.Series(values, dtype=object).values
+
+
+def _as_int64(values):
+    # ints are converted exactly, float64 would round those above 2**53
+    try:
+        array = np.asarray(values)
+        if array.dtype.kind == "U":
+            array = array.astype(np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return array.astype(np.int64, copy=False) if array.dtype.kind == "i" else None
+
+
+def _convert(values, kind, float32):
+    if kind == KIND_CATEGORY:
+        try:
+            return pd.Categorical(values)
+        except TypeError:
+            return _as_object(values)
+    if kind == KIND_BOOL:
+        if set(values) <= {True, False}:
+            return np.asarray(values, dtype=bool)
+        return _as_object(values)
+    if kind == KIND_INT:
+        array = _as_int64(values)
+        if array is not None:
+            return array
+    if kind in (KIND_INT, KIND_FLOAT):
+        try:
+            array = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            # the sample did not show every value of the column
+            return _as_object(values)
+        # ints beyond int64 or mixed with a fraction or null end up here
+        if kind == KIND_INT and (np.abs(array) < 2.0 ** 63).all() and (array == np.trunc(array)).all():
+            return array.astype(np.int64)
+        return array.astype(np.float32) if float32 else array
+    return _as_object(values)
+
+
+def typed_frame(rows, header, kinds=None, float32=False):
+    """ Build a DataFrame column by column with inferred dtypes
+
+    Features get numeric dtypes, ids, labels and repeated strings are
+    categoricals. A column whose values do not all match the inferred kind
+    is kept as object, so no value is lost.
+
+    :param rows: Rows of the data, lists of Python values
+    :type rows: list
+    :param header: Names of the columns
+    :type header: list
+    :param kinds: Kinds of the columns from infer_kinds, inferred from rows if None
+    :type kinds: list
+    :param float32: Store float features as float32 to halve their memory
+    :type float32: bool
+
+    :rtype: pandas.DataFrame
+
+    """
+    if kinds is None:
+        kinds = infer_kinds(rows, header)
+    # one column is pulled out of the rows at a time, so a single column of
+    # Python values is alive besides the converted ones, keyed by position
+    # as a header may repeat a name
+    data = {index: _convert(list(map(itemgetter(index), rows)), kind, float32)
+            for index, kind in enumerate(kinds)}
+    frame = pd.DataFrame(data, columns=range(len(header)))
+    frame.columns = header
+    return frame
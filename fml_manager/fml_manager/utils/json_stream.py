@@ -0,0 +1,184 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import codecs
+import json
+import re
+
+from fml_manager.utils.core import json_loads
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# an array of scalars, the usual row, is cut out by the regex without being decoded
+_FLAT_ARRAY = re.compile(
+    r'[ \t\n\r]*,?[ \t\n\r]*(\[[^\[\]"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^\[\]"]*)*\])')
+
+_START, _KEY, _COLON, _VALUE, _ARRAY_OPEN, _ITEMS, _DONE = range(7)
+
+
+class JsonMemberStream:
+    """JsonMemberStream parses a JSON object fed in pieces and streams the items of one array member
+
+    The items of the streamed member are returned by feed() as soon as they
+    are complete, the other members are decoded whole into members. Only
+    the bytes of the current item are buffered. With raw the items are
+    returned as JSON texts, so many of them can be decoded by one
+    json.loads call, e.g.
+
+        stream = JsonMemberStream("data")
+        for chunk in response.iter_content(65536):
+            for row in stream.feed(chunk):
+                ...
+        stream.close()
+        header = stream.members["meta"]["header"]
+
+    """
+
+    def __init__(self, key, raw=False):
+        """ Init the parser
+
+        :param key: Name of the top level member whose items are streamed
+        :type key: string
+        :param raw: Return the items as JSON texts instead of decoded values
+        :type raw: bool
+
+        """
+        self.key = key
+        self.raw = raw
+
+        #: Decoded top level members, except the streamed one
+        self.members = {}
+
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._pos = 0
+        self._state = _START
+        self._member = None
+
+    @property
+    def finished(self):
+        return self._state == _DONE
+
+    def feed(self, data):
+        """ Parse the next bytes
+
+        :param data: Next bytes of the document
+        :type data: bytes
+
+        :returns: Items of the streamed member completed by these bytes
+        :rtype: list
+
+        """
+        self._text = self._text[self._pos:] + self._utf8.decode(data)
+        self._pos = 0
+        return self._parse(False)
+
+    def close(self):
+        """ Parse the end of the document, raise if it is incomplete
+
+        :rtype: list
+
+        """
+        self._text = self._text[self._pos:] + self._utf8.decode(b"", True)
+        self._pos = 0
+        items = self._parse(True)
+        if self._state != _DONE:
+            raise ValueError("Truncated JSON document")
+        return items
+
+    def _skip(self):
+        self._pos = _WHITESPACE.match(self._text, self._pos).end()
+        return self._text[self._pos] if self._pos < len(self._text) else None
+
+    def _decode(self, final):
+        # return (True, value) once a whole value is buffered
+        try:
+            value, end = self._decoder.raw_decode(self._text, self._pos)
+        except ValueError:
+            if final:
+                raise
+            return False, None
+        if end == len(self._text) and not final and not isinstance(value, (dict, list, str)):
+            # a number or literal at the end of the buffer may go on in the next bytes
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _parse(self, final):
+        items = []
+        while True:
+            char = self._skip()
+            if char is None or self._state == _DONE:
+                return items
+
+            if self._state == _START:
+                if char != "{":
+                    raise ValueError("Expect a JSON object, got {!r}".format(char))
+                self._pos += 1
+                self._state = _KEY
+            elif self._state == _KEY:
+                if char == ",":
+                    self._pos += 1
+                    continue
+                if char == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                done, self._member = self._decode(final)
+                if not done:
+                    return items
+                self._state = _COLON
+            elif self._state == _COLON:
+                if char != ":":
+                    raise ValueError("Expect ':' after {!r}".format(self._member))
+                self._pos += 1
+                self._state = _ARRAY_OPEN if self._member == self.key else _VALUE
+            elif self._state == _ARRAY_OPEN and char == "[":
+                self._pos += 1
+                self._state = _ITEMS
+            elif self._state in (_VALUE, _ARRAY_OPEN):
+                # the streamed member may be null in an error response
+                done, value = self._decode(final)
+                if not done:
+                    return items
+                self.members[self._member] = value
+                self._state = _KEY
+            else:
+                if self._take_flat_arrays(items):
+                    continue
+                if char == ",":
+                    self._pos += 1
+                    continue
+                if char == "]":
+                    self._pos += 1
+                    self._state = _KEY
+                    continue
+                start = self._pos
+                done, item = self._decode(final)
+                if not done:
+                    return items
+                items.append(self._text[start:self._pos] if self.raw else item)
+
+    def _take_flat_arrays(self, items):
+        match = _FLAT_ARRAY.match(self._text, self._pos)
+        if match is None:
+            return False
+        first = len(items)
+        while match is not None:
+            items.append(match.group(1))
+            self._pos = match.end()
+            match = _FLAT_ARRAY.match(self._text, self._pos)
+        if not self.raw:
+            # decode the whole run of items at once
+            items[first:] = json_loads("[{}]".format(",".join(items[first:])))
+        return True
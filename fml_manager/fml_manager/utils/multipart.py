@@ -0,0 +1,197 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import time
+import uuid
+import zlib
+
+#: Size of the blocks read from the source of an upload
+cDefaultBufferSize = 1024 * 1024
+
+#: Level of the gzip compression of upload bodies, a fast level keeps up with the network
+cCompressLevel = 3
+
+
+class MultipartFileStream:
+    """MultipartFileStream is a multipart/form-data body with one file part
+
+    The file is read from the source in blocks while the body is sent, so
+    uploading a file of any size takes a constant amount of memory. When the
+    size of the source is known the body has a length and is sent with
+    Content-Length, otherwise it is sent with chunked transfer encoding.
+
+    With compress the body is sent with gzip content encoding. It is
+    compressed on the fly, so it has no length, except for a precompressed
+    source: a gzip stream may be made of several members, so the already
+    gzipped file is sent as is between gzipped parts of the framing.
+    """
+
+    def __init__(self, source, filename, size=None, field="file", buffer_size=cDefaultBufferSize, progress=None, compress=False, precompressed=False):
+        """ Init the body
+
+        :param source: Readable binary stream of the file
+        :type source: file object
+        :param filename: Name of the file in the form
+        :type filename: string
+        :param size: Size in bytes of the file, None if unknown
+        :type size: int
+        :param field: Name of the form field, default=file
+        :type field: string
+        :param buffer_size: Size in bytes of the blocks read from the source
+        :type buffer_size: int
+        :param progress: Called with (sent bytes, total bytes or None, bytes per second) after every block
+        :type progress: callable
+        :param compress: Send the body with gzip content encoding
+        :type compress: bool
+        :param precompressed: The source is already gzipped, only used with compress
+        :type precompressed: bool
+
+        """
+        self.source = source
+        self.size = size
+        self.buffer_size = buffer_size
+        self.progress = progress
+        self.compress = compress
+
+        self.boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary={}".format(
+            self.boundary)
+
+        self._preamble = ('--{}\r\n'
+                          'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                          'Content-Type: application/octet-stream\r\n\r\n'
+                          ).format(self.boundary, field, filename).encode("utf-8")
+        self._epilogue = "\r\n--{}--\r\n".format(self.boundary).encode("utf-8")
+
+        self._compressor = None
+        if compress and precompressed:
+            self._preamble = gzip.compress(self._preamble, cCompressLevel)
+            self._epilogue = gzip.compress(self._epilogue, cCompressLevel)
+        elif compress:
+            self._compressor = zlib.compressobj(
+                cCompressLevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._preamble = self._compressor.compress(self._preamble)
+
+        self._pending = memoryview(self._preamble)
+        self._offset = 0
+        self._source_done = False
+        self._epilogue_sent = False
+
+        #: Number of body bytes handed to the transport
+        self.sent = 0
+        self._started_at = None
+
+    @property
+    def length(self):
+        """ Length in bytes of the whole body, None if the size of the source is unknown
+        """
+        if self.size is None or self._compressor is not None:
+            return None
+        return len(self._preamble) + self.size + len(self._epilogue)
+
+    @property
+    def headers(self):
+        headers = {"Content-Type": self.content_type}
+        if self.length is not None:
+            headers["Content-Length"] = str(self.length)
+        if self.compress:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    def __len__(self):
+        # a body of unknown length must be passed as iter(body) to be sent chunked
+        return self.length or 0
+
+    def read(self, size=-1):
+        """ Read the next bytes of the body, at most one buffer of the source at a time
+        """
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if size is None or size < 0:
+            size = self.buffer_size
+
+        if self._offset >= len(self._pending):
+            self._pending, self._offset = self._next_block(), 0
+
+        chunk = self._pending[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        if chunk:
+            self.sent += len(chunk)
+            if self._offset >= len(self._pending):
+                self._report()
+        return bytes(chunk)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.buffer_size)
+            if not chunk:
+                return
+            yield chunk
+
+    async def iter_async(self, blocks):
+        """ Yield the body around the file blocks of an async iterable, the source is not used
+
+        :param blocks: Async iterable of the file content
+        :type blocks: async iterable
+
+        """
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        for part in (self._preamble, blocks, None):
+            if part is None:
+                part = self._closing()
+            if isinstance(part, bytes):
+                if part:
+                    self.sent += len(part)
+                    yield part
+                continue
+            async for block in part:
+                block = self._encode(block)
+                if block:
+                    self.sent += len(block)
+                    self._report()
+                    yield block
+        self._report()
+
+    def _next_block(self):
+        while not self._source_done:
+            block = self.source.read(self.buffer_size)
+            if not block:
+                self._source_done = True
+                break
+            # the compressor may keep a whole block in its window
+            block = self._encode(block)
+            if block:
+                return memoryview(block)
+        if not self._epilogue_sent:
+            self._epilogue_sent = True
+            return memoryview(self._closing())
+        return memoryview(b"")
+
+    def _encode(self, block):
+        if self._compressor is None:
+            return block
+        return self._compressor.compress(block)
+
+    def _closing(self):
+        if self._compressor is None:
+            return self._epilogue
+        return self._compressor.compress(self._epilogue) + self._compressor.flush()
+
+    def _report(self):
+        # called once a block of the source is fully sent
+        if self.progress is None:
+            return
+        elapsed = time.monotonic() - self._started_at
+        rate = self.sent / elapsed if elapsed > 0 else 0.0
+        self.progress(self.sent, self.length, rate)
@@ -0,0 +1,51 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class RateLimiter:
+    """RateLimiter spaces calls so no more than rate calls start per second"""
+
+    def __init__(self, rate):
+        """ Init the limiter
+
+        :param rate: Max number of calls per second
+        :type rate: float
+
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Reserve the next slot
+
+        :returns: Seconds to wait before the call may start
+        :rtype: float
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+            return slot - now
+
+    def acquire(self):
+        """ Block until the next slot
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
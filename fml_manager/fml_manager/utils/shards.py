@@ -0,0 +1,149 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import threading
+import time
+
+
+def split_lines(path, shards, head=True):
+    """ Split a text file into byte ranges which start and end on line boundaries
+
+    Only the header and one line around every boundary are read, the file is
+    never loaded in memory.
+
+    :param path: Path of the file
+    :type path: string
+    :param shards: Number of ranges wanted, less are returned for a small file
+    :type shards: int
+    :param head: Whether the first line is a header, it is kept out of the ranges
+    :type head: bool
+
+    :returns: The header and a list of (start, end) byte offsets
+    :rtype: tuple
+
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline() if head else b""
+        start = f.tell()
+        if start >= size:
+            return header, []
+
+        step = max(1, (size - start) // max(1, shards))
+        ranges = []
+        while start < size:
+            end = start + step
+            if end >= size or len(ranges) == shards - 1:
+                end = size
+            else:
+                # move the boundary to the end of the line it falls in
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+class ShardReader:
+    """ShardReader reads the header followed by one byte range of a file
+
+    The reader is a file object on its own, so a shard can be streamed as a
+    regular file and several shards of the same file can be read at once.
+    """
+
+    def __init__(self, path, start, end, header=b"", digest=False):
+        """ Init the reader
+
+        :param path: Path of the file
+        :type path: string
+        :param start: Offset of the first byte of the shard
+        :type start: int
+        :param end: Offset after the last byte of the shard
+        :type end: int
+        :param header: Bytes sent before the shard, e.g. the header line of a CSV
+        :type header: bytes
+        :param digest: Compute the sha256 of the range while it is read
+        :type digest: bool
+
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.header = header
+
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._header_sent = not header
+
+        #: sha256 of the bytes of the range read so far, if digest
+        self.digest = hashlib.sha256() if digest else None
+
+    @property
+    def size(self):
+        return len(self.header) + self.end - self.start
+
+    def read(self, size=-1):
+        if not self._header_sent:
+            self._header_sent = True
+            return self.header
+        remaining = self.end - self._file.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self._file.read(size) if size > 0 else b""
+        if self.digest is not None:
+            self.digest.update(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def merge_progress(progress, count):
+    """ Return one progress callback per shard, which report the sum of all shards to progress
+
+    :param progress: Called with (sent bytes, total bytes, bytes per second) of all shards
+    :type progress: callable
+    :param count: Number of shards
+    :type count: int
+
+    :rtype: list
+
+    """
+    if progress is None:
+        return [None] * count
+
+    lock = threading.Lock()
+    sent = [0] * count
+    totals = [0] * count
+    started_at = time.monotonic()
+
+    def shard_progress(index):
+        def report(shard_sent, shard_total, rate):
+            with lock:
+                sent[index] = shard_sent
+                totals[index] = shard_total or 0
+                elapsed = time.monotonic() - started_at
+                total_sent = sum(sent)
+                progress(total_sent, sum(totals),
+                         total_sent / elapsed if elapsed > 0 else 0.0)
+        return report
+
+    return [shard_progress(index) for index in range(count)]
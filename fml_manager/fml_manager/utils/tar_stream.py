@@ -0,0 +1,156 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import os
+import queue
+import tarfile
+
+#: Size of the blocks read from a streamed tar archive
+cTarBufferSize = 1024 * 1024
+
+#: Max number of received blocks waiting for the extraction
+cPipeDepth = 16
+
+
+def _matcher(members):
+    if members is None:
+        return lambda name: True
+    if callable(members):
+        return members
+    patterns = [members] if isinstance(members, str) else list(members)
+    return lambda name: any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def _is_safe(member, extract_dir):
+    # only plain files and directories inside extract_dir, no link or device
+    if not (member.isfile() or member.isdir()):
+        return False
+    root = os.path.realpath(extract_dir)
+    target = os.path.realpath(os.path.join(root, member.name))
+    return target == root or target.startswith(root + os.sep)
+
+
+def extract_tar_stream(fileobj, extract_dir, members=None, bufsize=cTarBufferSize, observer=None):
+    """ Extract a gzipped tar archive while it is read, the archive is never stored
+
+    The archive is read once, in order, by blocks of bufsize. Members
+    outside extract_dir, links and devices are skipped.
+
+    :param fileobj: File-like object with the archive, e.g. the raw stream of a response
+    :type fileobj: file
+    :param extract_dir: Directory the members are extracted to
+    :type extract_dir: string
+    :param members: Glob patterns of the member names to extract, e.g. "guest/*ERROR*", or a predicate on the name, default=None for all
+    :type members: string, list or callable
+    :param bufsize: Size of the blocks read from fileobj, default=1MB
+    :type bufsize: int
+    :param observer: Called with the name and path of every extracted file, it may return an object whose write gets the blocks of the file and close is called at its end, e.g. a JobIndexer
+    :type observer: callable
+
+    :returns: Names of the extracted files
+    :rtype: list
+
+    """
+    wanted = _matcher(members)
+    extracted = []
+    with tarfile.open(fileobj=fileobj, mode="r|gz", bufsize=bufsize) as tar:
+        for member in tar:
+            if not wanted(member.name) or not _is_safe(member, extract_dir):
+                continue
+            if member.isdir():
+                os.makedirs(os.path.join(extract_dir, member.name), exist_ok=True)
+                continue
+            path = os.path.join(extract_dir, member.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            source = tar.extractfile(member)
+            sink = observer(member.name, path) if observer is not None else None
+            with open(path, "wb") as target:
+                while True:
+                    block = source.read(bufsize)
+                    if not block:
+                        break
+                    target.write(block)
+                    if sink is not None:
+                        sink.write(block)
+            if sink is not None:
+                sink.close()
+            extracted.append(member.name)
+    return extracted
+
+
+class ChunkPipe:
+    """ChunkPipe turns blocks pushed from one thread into a file read from another
+
+    It lets extract_tar_stream run in a worker thread on the body of an
+    asyncio response. The pipe holds at most depth blocks, a writer is
+    blocked until the reader catches up. Once the reader is done, it
+    aborts the pipe and the blocks written later are dropped.
+    """
+
+    def __init__(self, depth=cPipeDepth):
+        self._queue = queue.Queue(maxsize=depth)
+        self._chunks = []
+        self._buffered = 0
+        self._eof = False
+        self._aborted = False
+
+    def write(self, data):
+        """ Push a block, blocks while the pipe is full
+        """
+        while data and not self._aborted:
+            try:
+                self._queue.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """ Mark the end of the data
+        """
+        while not self._aborted:
+            try:
+                self._queue.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def abort(self):
+        """ Stop the transfer, the writer and the reader are released and the rest of the data dropped
+        """
+        self._aborted = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        # a reader waiting for data gets the end of the data
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or self._buffered < size):
+            data = self._queue.get()
+            if data is None:
+                self._eof = True
+            else:
+                self._chunks.append(data)
+                self._buffered += len(data)
+        buffer = b"".join(self._chunks)
+        if size < 0:
+            size = len(buffer)
+        data, rest = buffer[:size], buffer[size:]
+        self._chunks = [rest] if rest else []
+        self._buffered = len(rest)
+        return data
@@ -0,0 +1,192 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+
+from fml_manager.utils.shards import split_lines
+
+#: Size of the chunks of a resumable upload
+cDefaultChunkSize = 256 * 1024 * 1024
+
+_MANIFEST_VERSION = 2
+
+
+def hash_range(path, start, end, buffer_size=1024 * 1024):
+    """ Return the sha256 of a byte range of a file
+
+    :rtype: string
+
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(buffer_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """UploadManifest records the chunks of a resumable upload confirmed by FATE Flow
+
+    The file is split on line boundaries into chunks which are uploaded one
+    after another and appended to the table, which is dropped once before
+    the first chunk if asked. The manifest is rewritten atomically after
+    every confirmed chunk, so an interrupted upload resumes after the last
+    confirmed chunk. It is discarded when the file, the target table, the
+    upload parameters or the chunk size change, or when a confirmed chunk
+    no longer has its hash. A resume checks the size and time of the file
+    and hashes the last confirmed chunk only, unless asked to verify all.
+
+    The rows of the confirmed chunks are in the table, so a manifest of
+    the same table which no longer matches raises unless the table is
+    dropped, restarting would append the rows twice.
+
+    A chunk is confirmed by the response of FATE Flow, so a chunk whose
+    response is lost with the connection is sent again on resume.
+    """
+
+    def __init__(self, manifest_path, source, namespace, table_name, head, chunk_size=cDefaultChunkSize,
+                 work_mode=None, partition=None, drop=None):
+        """ Init the manifest, load_or_plan() reads or creates it
+
+        :param manifest_path: Path of the manifest file
+        :type manifest_path: string
+        :param source: Path of the uploaded file
+        :type source: string
+        :param namespace: Namespace of the data in FATE cluster
+        :type namespace: string
+        :param table_name: Table name of the data in FATE cluster
+        :type table_name: string
+        :param head: Whether the first line is a header, it is sent with every chunk
+        :type head: bool
+        :param chunk_size: Approximate size in bytes of a chunk, default=256MB
+        :type chunk_size: int
+        :param work_mode: Work mode of the upload jobs
+        :type work_mode: int
+        :param partition: Number of partitions of the table
+        :type partition: int
+        :param drop: Whether the table is dropped before the first chunk
+        :type drop: string
+
+        """
+        self.manifest_path = manifest_path
+        self.source = os.path.abspath(source)
+        self.head = head
+        stat = os.stat(self.source)
+        self.key = {
+            "version": _MANIFEST_VERSION,
+            "source": self.source,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "namespace": namespace,
+            "table_name": table_name,
+            "head": head,
+            "chunk_size": chunk_size,
+            "work_mode": None if work_mode is None else str(work_mode),
+            "partition": None if partition is None else str(partition),
+            "drop": None if drop is None else str(drop)
+        }
+
+        #: Header line sent before every chunk
+        self.header = b""
+
+        #: Chunks of the file, dicts of start, end, sha256 and job_id, the last two are set once confirmed
+        self.chunks = []
+
+    def load_or_plan(self, verify=False):
+        """ Resume from the manifest file if it matches the upload, otherwise split the file again
+
+        :param verify: Hash every confirmed chunk, not only the last one, default=False
+        :type verify: bool
+
+        :returns: Whether a previous upload is resumed
+        :rtype: bool
+
+        """
+        saved = self._read()
+        if saved is not None:
+            confirmed = [chunk for chunk in saved.get("chunks", []) if chunk.get("sha256") is not None]
+            if saved.get("key") == self.key:
+                # size and mtime are in the key, the chunks are confirmed in order
+                checked = confirmed if verify else confirmed[-1:]
+                if all(hash_range(self.source, chunk["start"], chunk["end"]) == chunk["sha256"]
+                       for chunk in checked):
+                    self.header = saved["header"].encode("latin-1")
+                    self.chunks = saved["chunks"]
+                    return self.confirmed > 0
+            if confirmed and self._same_table(saved.get("key")) and str(self.key["drop"]) != "1":
+                raise Exception(
+                    "{} no longer matches the {} chunks already appended to {}.{}, drop the table "
+                    "or remove the manifest to upload again".format(
+                        self.manifest_path, len(confirmed), self.key["namespace"], self.key["table_name"]))
+
+        shards = max(1, int(math.ceil(self.key["size"] / float(self.key["chunk_size"]))))
+        self.header, ranges = split_lines(self.source, shards, self.head)
+        self.chunks = [{"start": start, "end": end, "sha256": None, "job_id": None}
+                       for start, end in ranges]
+        self.save()
+        return False
+
+    def _same_table(self, key):
+        return isinstance(key, dict) and (key.get("namespace"), key.get("table_name")) == (
+            self.key["namespace"], self.key["table_name"])
+
+    @property
+    def confirmed(self):
+        """ Number of chunks confirmed by FATE Flow
+        """
+        return sum(1 for chunk in self.chunks if chunk["sha256"] is not None)
+
+    def pending(self):
+        """ Return the indexes of the chunks still to upload
+        """
+        return [index for index, chunk in enumerate(self.chunks) if chunk["sha256"] is None]
+
+    def confirm(self, index, sha256, job_id):
+        """ Record a chunk accepted by FATE Flow and save the manifest
+        """
+        self.chunks[index]["sha256"] = sha256
+        self.chunks[index]["job_id"] = job_id
+        self.save()
+
+    def save(self):
+        # write a new file and rename it, a crash never leaves a torn manifest
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"key": self.key, "header": self.header.decode("latin-1"),
+                           "chunks": self.chunks}, f, indent=4)
+            os.replace(temp_path, self.manifest_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def remove(self):
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    def _read(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
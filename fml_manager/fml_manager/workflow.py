@@ -0,0 +1,389 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from fml_manager.flow_requests import to_dict
+from fml_manager.job_waiter import JobWaiter
+
+#: A reference to the output of a step in a DSL or config, e.g. "${train.model_id}"
+_REFERENCE = re.compile(r"\$\{(\w+)\.(\w+)\}")
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCESS = "success"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class StepResult:
+    """StepResult is the outcome of one step of a Workflow
+
+    The times are in seconds since the start of the run: ready_at when the
+    steps before it ended, started_at when a slot was free to run it,
+    submitted_at when its jobs were submitted and finished_at when they ended.
+    """
+
+    def __init__(self, name, after):
+        self.name = name
+        self.after = list(after)
+
+        #: One of pending, running, success, failed or skipped
+        self.status = PENDING
+
+        #: Ids of the jobs of the step, e.g. the shards of an upload
+        self.job_ids = []
+
+        #: What the step returned, e.g. the response of submit_job
+        self.value = None
+
+        self.model_id = None
+        self.model_version = None
+        self.error = None
+
+        self.ready_at = None
+        self.started_at = None
+        self.submitted_at = None
+        self.finished_at = None
+
+    @property
+    def job_id(self):
+        return self.job_ids[0] if self.job_ids else None
+
+    @property
+    def waited(self):
+        """ Seconds between ready and started, waiting for a slot
+        """
+        return _span(self.ready_at, self.started_at)
+
+    @property
+    def submitting(self):
+        """ Seconds taken by the step function, e.g. an upload or a submission
+        """
+        return _span(self.started_at, self.submitted_at)
+
+    @property
+    def running(self):
+        """ Seconds between submitted and finished, running on the cluster
+        """
+        return _span(self.submitted_at, self.finished_at)
+
+    def output(self, field):
+        """ Return an output of the step: job_id, model_id, model_version, status, or a key of the value it returned
+        """
+        if field in ("job_id", "model_id", "model_version", "status"):
+            return getattr(self, field)
+        if isinstance(self.value, dict) and field in self.value:
+            return self.value[field]
+        raise KeyError("Step {} has no output {}".format(self.name, field))
+
+    def __repr__(self):
+        return "<StepResult {} {} job_id={}>".format(self.name, self.status, self.job_id)
+
+
+def _span(start, end):
+    if start is None or end is None:
+        return None
+    return end - start
+
+
+def resolve(value, outputs):
+    """ Return a copy of a DSL or config with the references to step outputs replaced
+
+    A string which is only a reference, e.g. "${train.model_version}", is
+    replaced by the output itself, a reference within a string by its text.
+
+    :param outputs: Name to StepResult of the ended steps
+    :type outputs: dict
+
+    """
+    if isinstance(value, dict):
+        return {key: resolve(item, outputs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, outputs) for item in value]
+    if not isinstance(value, str) or "${" not in value:
+        return value
+
+    def lookup(match):
+        step = outputs.get(match.group(1))
+        if step is None:
+            raise KeyError("Unknown step {} in {}".format(match.group(1), value))
+        return step.output(match.group(2))
+
+    whole = _REFERENCE.fullmatch(value)
+    if whole is not None:
+        return lookup(whole)
+    return _REFERENCE.sub(lambda match: str(lookup(match)), value)
+
+
+def _job_responses(value):
+    # the responses of FATE Flow jobs in what a step returned
+    values = value if isinstance(value, (list, tuple)) else [value]
+    responses = []
+    for item in values:
+        try:
+            result = item.json()
+        except (AttributeError, ValueError):
+            continue
+        if isinstance(result, dict) and ("jobId" in result or result.get("retcode", 0) != 0):
+            responses.append(result)
+    return responses
+
+
+class _Step:
+    def __init__(self, name, run, after):
+        self.name = name
+        self.run = run
+        self.after = after
+
+
+class Workflow:
+    """Workflow runs FATE jobs which depend on each other
+
+    Every step is a function of the outputs of the steps before it. A step
+    returning the response of a job, e.g. of load_data or submit_job, ends
+    when its job ends; other steps end when they return. The steps whose
+    dependencies succeeded run at once, up to max_running. A step after a
+    failed one is skipped, e.g.
+
+        flow = Workflow(manager, max_running=4)
+        flow.add("upload_guest", lambda outputs: manager.load_data(guest_csv, ...))
+        flow.add("upload_host", lambda outputs: manager.load_data(host_csv, ...))
+        flow.add_job("train", dsl, config, after=["upload_guest", "upload_host"])
+        flow.add("predict", lambda outputs: manager.offline_predict_on_dataset(
+            ..., model_id=outputs["train"].model_id, model_version=outputs["train"].model_version), after=["train"])
+        result = flow.run()
+        print(result.report())
+
+    The dependencies of a step are added before it, so there is no cycle.
+    """
+
+    def __init__(self, manager, max_running=4, backoff=None, deadline=None):
+        """ Init an empty workflow
+
+        :param manager: Manager running the steps
+        :type manager: FMLManager
+        :param max_running: Max number of steps running at once, default=4
+        :type max_running: int
+        :param backoff: Polling intervals of the jobs, see JobWaiter
+        :type backoff: Backoff
+        :param deadline: Time in seconds to wait for every job, None means no deadline
+        :type deadline: float
+
+        """
+        self.manager = manager
+        self.max_running = max_running
+        self.backoff = backoff
+        self.deadline = deadline
+        self._steps = {}
+
+    def add(self, name, run, after=()):
+        """ Add a step
+
+        :param name: Unique name of the step
+        :type name: string
+        :param run: Called with the name to StepResult of the ended steps, returns the response of a job or any value
+        :type run: callable
+        :param after: Names of the steps it depends on, added before
+        :type after: list
+
+        :returns: The name of the step
+        :rtype: string
+
+        """
+        if isinstance(after, str):
+            after = [after]
+        if name in self._steps:
+            raise ValueError("Step {} is already added".format(name))
+        for dependency in after:
+            if dependency not in self._steps:
+                raise ValueError("Step {} depends on {}, which is not added".format(name, dependency))
+        self._steps[name] = _Step(name, run, list(after))
+        return name
+
+    def add_job(self, name, dsl, config, after=()):
+        """ Add a step submitting a job, the references to step outputs in dsl and config are resolved first
+
+        e.g. {"initiator": ..., "job_parameters": {"model_id": "${train.model_id}"}}
+
+        :param dsl: DSL definition
+        :type dsl: Pipeline or dict
+        :param config: Config definition
+        :type config: Config or dict
+
+        """
+        dsl, config = copy.deepcopy(to_dict(dsl)), copy.deepcopy(to_dict(config))
+        return self.add(name, lambda outputs: self.manager.submit_job(
+            resolve(dsl, outputs), resolve(config, outputs)), after)
+
+    def run(self):
+        """ Run the steps, and wait until they all end
+
+        :rtype: WorkflowResult
+
+        """
+        start = time.monotonic()
+        clock = lambda: time.monotonic() - start
+        results = {name: StepResult(name, step.after) for name, step in self._steps.items()}
+        events = queue.Queue()
+        running = 0
+        waiting = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_running) as executor, \
+                JobWaiter(self.manager, self.backoff, self.deadline) as waiter:
+            while True:
+                # the steps are in dependency order, one pass settles them
+                for name, step in self._steps.items():
+                    result = results[name]
+                    if result.status != PENDING:
+                        continue
+                    dependencies = [results[dependency] for dependency in step.after]
+                    if any(dependency.status in (FAILED, SKIPPED) for dependency in dependencies):
+                        result.status = SKIPPED
+                        continue
+                    if any(dependency.status != SUCCESS for dependency in dependencies):
+                        continue
+                    result.ready_at = max([dependency.finished_at for dependency in dependencies] or [0.0])
+                    if running >= self.max_running:
+                        continue
+                    result.status = RUNNING
+                    result.started_at = clock()
+                    running += 1
+                    outputs = {done: results[done] for done in results if results[done].status == SUCCESS}
+                    executor.submit(self._start, step, outputs, events)
+
+                if running == 0:
+                    break
+                event, name, payload = events.get()
+                result = results[name]
+                if event == "started":
+                    self._started(result, payload, clock(), waiter, events, waiting)
+                elif event == "failed":
+                    result.error = payload
+                    result.status = FAILED
+                elif event == "job":
+                    job_id, future = payload
+                    waiting[name].discard(job_id)
+                    error = future.exception()
+                    if error is None and future.result() != SUCCESS:
+                        error = Exception("Job {} is {}".format(job_id, future.result()))
+                    if error is not None and result.error is None:
+                        result.error = error
+                    if not waiting[name]:
+                        result.status = SUCCESS if result.error is None else FAILED
+                if result.status in (SUCCESS, FAILED):
+                    result.finished_at = clock()
+                    running -= 1
+
+        return WorkflowResult(results, clock())
+
+    @staticmethod
+    def _start(step, outputs, events):
+        try:
+            value = step.run(outputs)
+        except Exception as e:
+            events.put(("failed", step.name, e))
+            return
+        events.put(("started", step.name, value))
+
+    @staticmethod
+    def _started(result, value, now, waiter, events, waiting):
+        result.value = value
+        result.submitted_at = now
+        responses = _job_responses(value)
+        rejected = [response for response in responses if response.get("retcode", 0) != 0]
+        if rejected:
+            result.error = Exception(rejected[0].get("retmsg"))
+            result.status = FAILED
+            return
+        if not responses:
+            # a local step, e.g. an evaluation in pandas
+            result.status = SUCCESS
+            return
+        result.job_ids = [response["jobId"] for response in responses]
+        model_info = (responses[0].get("data") or {}).get("model_info") or {}
+        result.model_id = model_info.get("model_id")
+        result.model_version = model_info.get("model_version")
+        waiting[result.name] = set(result.job_ids)
+        for job_id in result.job_ids:
+            future = waiter.wait_for(job_id)
+            future.add_done_callback(
+                lambda future, job_id=job_id: events.put(("job", result.name, (job_id, future))))
+
+
+class WorkflowResult:
+    """WorkflowResult holds the StepResult of every step of a run"""
+
+    def __init__(self, steps, elapsed):
+        #: Name to StepResult, in the order the steps were added
+        self.steps = steps
+
+        #: Wall time in seconds of the run
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return all(step.status == SUCCESS for step in self.steps.values())
+
+    def __getitem__(self, name):
+        return self.steps[name]
+
+    def critical_path(self):
+        """ Return the steps of the chain which ended last, from the first step on
+
+        Each step of the chain is the dependency of the next one which ended
+        last, so the chain is what made the run last elapsed seconds.
+
+        :rtype: list of StepResult
+
+        """
+        ended = [step for step in self.steps.values() if step.finished_at is not None]
+        if not ended:
+            return []
+        path = [max(ended, key=lambda step: step.finished_at)]
+        while path[-1].after:
+            path.append(max((self.steps[name] for name in path[-1].after),
+                            key=lambda step: step.finished_at))
+        return path[::-1]
+
+    def timing_frame(self):
+        """ Return the times of every step as a DataFrame indexed by name
+
+        :rtype: pandas.DataFrame
+
+        """
+        columns = ["status", "job_id", "ready_at", "started_at", "submitted_at", "finished_at",
+                   "waited", "submitting", "running"]
+        return pd.DataFrame([[getattr(step, column) for column in columns] for step in self.steps.values()],
+                            index=pd.Index(list(self.steps), name="step"), columns=columns)
+
+    def report(self):
+        """ Return the time spent along the critical path as text
+
+        :rtype: string
+
+        """
+        lines = ["{} steps, {} in {:.1f} s, critical path:".format(
+            len(self.steps), "success" if self.ok else "failed", self.elapsed)]
+        for step in self.critical_path():
+            lines.append("  {:<20} {:<8} waited {:>8.1f} s  submitting {:>8.1f} s  running {:>8.1f} s".format(
+                step.name, step.status, step.waited or 0.0, step.submitting or 0.0, step.running or 0.0))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<WorkflowResult ok={} elapsed={:.1f}>".format(self.ok, self.elapsed)
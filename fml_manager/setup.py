@@ -18,6 +18,10 @@ setuptools.setup(
         'requests>=2.21.0',
         'pandas>=1.1.0'
     ],
+    extras_require={
+        'async': ['aiohttp>=3.6.0'],
+        'fast': ['orjson>=3.0.0']
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache Software License",
@@ -0,0 +1,95 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compression ratio and upload time of load_data with and without compress
+
+The bundled Examples/*/data CSVs and synthetic tables are uploaded to the
+stub, which reads the bodies at --bandwidth MB/s to emulate a link between
+sites. The gzip column uploads a .gz copy of the file, which is passed
+through without compressing it again.
+
+Usage: python tests/bench_compression.py [--bandwidth 12.5] [size_mb ...]
+default synthetic sizes are 16 and 128 MB
+"""
+
+import argparse
+import glob
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+from fml_manager import FMLManager
+from fate_flow_stub import FateFlowStub, upload_route
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Examples")
+
+
+def write_table(path, size):
+    # a guest table of ids, labels and float features, like the examples
+    with open(path, "w") as f:
+        f.write("id,y," + ",".join("x{}".format(i) for i in range(10)) + "\n")
+        row = 0
+        while f.tell() < size:
+            f.write("{},{},".format(row, row % 2) +
+                    ",".join("{:.6f}".format((row * (i + 7)) % 1000 / 997.0 - 0.5) for i in range(10)) + "\n")
+            row += 1
+
+
+def upload(manager, stub, path, compress):
+    start = time.perf_counter()
+    manager.load_data(path, "bench", "compression", 1, 1, 4, compress=compress)
+    return time.perf_counter() - start, stub.uploads[-1]["wire_size"]
+
+
+def bench(manager, stub, path):
+    gz_path = path + ".gz"
+    with open(path, "rb") as f, gzip.open(gz_path, "wb") as fw:
+        shutil.copyfileobj(f, fw)
+
+    plain, plain_size = upload(manager, stub, path, False)
+    compressed, compressed_size = upload(manager, stub, path, True)
+    passthrough, _ = upload(manager, stub, gz_path, True)
+    os.remove(gz_path)
+
+    print("{:<28} {:>9.1f} MB {:>7.2f}x {:>9.2f} s {:>9.2f} s {:>9.2f} s {:>+8.0f}%".format(
+        os.path.basename(path)[:28], os.path.getsize(path) / 1024.0 / 1024.0,
+        plain_size / float(compressed_size), plain, compressed, passthrough,
+        (compressed - plain) / plain * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bandwidth", type=float, default=12.5,
+                        help="MB/s read by the stub, 0 for no limit")
+    parser.add_argument("sizes", type=int, nargs="*", default=[16, 128])
+    args = parser.parse_args()
+
+    with FateFlowStub() as stub, tempfile.TemporaryDirectory() as work_dir:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        if args.bandwidth > 0:
+            stub.bandwidth = args.bandwidth * 1024 * 1024
+        stub.export_host()
+        manager = FMLManager()
+
+        print("{:<28} {:>12} {:>8} {:>11} {:>11} {:>11} {:>9}".format(
+            "file", "size", "ratio", "plain", "gzip", ".gz", "change"))
+        for path in sorted(glob.glob(os.path.join(EXAMPLES, "*", "data", "*.csv"))):
+            copy = os.path.join(work_dir, os.path.basename(path))
+            shutil.copy(path, copy)
+            bench(manager, stub, copy)
+        for size_mb in args.sizes:
+            path = os.path.join(work_dir, "synthetic_{}mb.csv".format(size_mb))
+            write_table(path, size_mb * 1024 * 1024)
+            bench(manager, stub, path)
+            os.remove(path)
@@ -0,0 +1,121 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Peak RSS and time of load_dataframe versus writing a CSV and uploading it
+
+Every upload runs in its own process, the RSS growth is measured from
+the point the DataFrame is built, on Linux only. The modes are:
+
+    csv      DataFrame.to_csv to a temporary file, then load_data
+    memory   DataFrame.to_csv to a string, then load_data of a BytesIO, the naive way
+    measured load_dataframe, the CSV is rendered twice to send it with Content-Length
+    chunked  load_dataframe with allow_chunked, the CSV is rendered once
+    parquet  load_dataframe of a Parquet file, only if pyarrow is installed
+
+Usage: python tests/bench_dataframe.py [rows ...]
+default sizes are 1000000 and 5000000 rows of 20 float features
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from fml_manager import FMLManager, flow_requests
+from fate_flow_stub import FateFlowStub, upload_route
+
+
+def build_frame(rows):
+    random = np.random.RandomState(0)
+    frame = pd.DataFrame(random.uniform(-1, 1, size=(rows, 20)).round(6),
+                         columns=["x{}".format(i) for i in range(20)])
+    frame.insert(0, "y", random.randint(0, 2, size=rows))
+    frame.insert(0, "id", np.arange(rows))
+    return frame
+
+
+def reset_peak_rss():
+    # Linux only, building the DataFrame has a higher peak than uploading it
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+
+
+def child(mode, rows, host, work_dir):
+    os.environ["FATE_FLOW_HOST"] = host
+    frame = build_frame(int(rows))
+    parquet_path = os.path.join(work_dir, "bench.parquet")
+    if mode == "parquet":
+        frame.to_parquet(parquet_path)
+        del frame
+    manager = FMLManager()
+    reset_peak_rss()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "csv":
+        path = os.path.join(work_dir, "bench.csv")
+        frame.to_csv(path, index=False)
+        manager.load_data(path, "bench", "frame", 1, 1, 4)
+        os.remove(path)
+    elif mode == "memory":
+        text = frame.to_csv(index=False).encode("utf-8")
+        request = flow_requests.load_data(None, "bench", "frame", 1, 1, 4)
+        manager._upload(request, io.BytesIO(text), "bench.csv", len(text), 1024 * 1024, None)
+    elif mode == "measured":
+        manager.load_dataframe(frame, "bench", "frame", 1, 4)
+    elif mode == "chunked":
+        manager.load_dataframe(frame, "bench", "frame", 1, 4, allow_chunked=True)
+    else:
+        manager.load_dataframe(parquet_path, "bench", "frame", 1, 4)
+        os.remove(parquet_path)
+    elapsed = time.perf_counter() - start
+    print("{:.1f} {:.1f} {:.3f}".format(baseline, peak_rss_mb(), elapsed))
+
+
+def run(mode, rows, host, work_dir):
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--child", mode, str(rows), host, work_dir], env=dict(os.environ))
+    baseline, peak, elapsed = [float(x) for x in output.split()[-3:]]
+    print("{:<10} {:>9} {:>10.1f} MB {:>10.1f} MB {:>9.2f} s".format(
+        mode, rows, peak, peak - baseline, elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:6])
+        sys.exit(0)
+
+    sizes = [int(rows) for rows in sys.argv[1:]] or [1000000, 5000000]
+    try:
+        import pyarrow  # noqa: F401
+        modes = ["csv", "memory", "measured", "chunked", "parquet"]
+    except ImportError:
+        modes = ["csv", "memory", "measured", "chunked"]
+
+    with FateFlowStub() as stub, tempfile.TemporaryDirectory() as work_dir:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        print("{:<10} {:>9} {:>13} {:>13} {:>11}".format(
+            "mode", "rows", "peak RSS", "RSS growth", "time"))
+        for rows in sizes:
+            for mode in modes:
+                run(mode, rows, stub.host, work_dir)
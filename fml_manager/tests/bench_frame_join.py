@@ -0,0 +1,84 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wall time and peak memory of joining the guest predictions with the host features
+
+The baseline fetches both outputs with track_component_output_data, one
+after the other, and joins them with DataFrame.merge. The streamed join
+fetches both at once with join_component_output_data, and only the
+joined rows are counted. Peak memory is the peak of the Python
+allocations, tracemalloc, during the join.
+
+Usage: python tests/bench_frame_join.py [--guest-rows 100000] [--host-rows 1000000] [--features 20]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from fml_manager import FMLManager
+from fate_flow_stub import FateFlowStub
+
+
+def output_body(header, rows):
+    return json.dumps({"data": rows, "meta": {"header": header},
+                       "retcode": 0, "retmsg": "success"}).encode("utf-8")
+
+
+def output_route(bodies):
+    def handler(request):
+        body = bodies[request.json()["role"]]
+        return 200, (body[i:i + 65536] for i in range(0, len(body), 65536))
+    return handler
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<16} {:>8} rows {:>9.2f} s {:>9.1f} MB".format(label, rows, elapsed, peak / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guest-rows", type=int, default=100000)
+    parser.add_argument("--host-rows", type=int, default=1000000)
+    parser.add_argument("--features", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    guest = output_body(["id", "label", "predict_result", "predict_score"],
+                        [[str(i), i % 2, i % 2, rng.random()] for i in range(0, args.guest_rows * 2, 2)])
+    host = output_body(["id"] + ["x{}".format(i) for i in range(args.features)],
+                       [[str(i)] + [round(rng.random(), 6) for _ in range(args.features)] for i in range(args.host_rows)])
+    print("guest {:.1f} MB, host {:.1f} MB of JSON".format(len(guest) / 1024.0 / 1024.0, len(host) / 1024.0 / 1024.0))
+
+    with FateFlowStub({"/v1/tracking/component/output/data": output_route({"guest": guest, "host": host})}) as stub:
+        stub.export_host()
+        manager = FMLManager()
+        parties = [("guest", 9999, "hetero_lr_0"), ("host", 10000, "dataio_0")]
+
+        def merged():
+            frames = [manager.track_component_output_data("job", role, party_id, component)
+                      for role, party_id, component in parties]
+            return len(frames[0].merge(frames[1], on="id"))
+
+        def streamed():
+            return sum(len(frame) for frame in manager.join_component_output_data("job", None, parties))
+
+        measure("fetch + merge", merged)
+        measure("streamed join", streamed)
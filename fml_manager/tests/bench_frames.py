@@ -0,0 +1,97 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory and conversion time of the DataFrame of a component output
+
+Every mode runs in its own process on the same rows decoded from JSON, the
+rows of a FATE output: an id, a label and 20 features as text. The RSS
+growth is measured from the point the rows are decoded, on Linux only,
+the frame size is its deep memory usage.
+
+    untyped  pd.DataFrame(rows), the frame track_component_output_data used to return
+    cast     pd.DataFrame(rows) then astype of every column, the manual way
+    typed    typed_frame
+    float32  typed_frame with float32 features
+
+Usage: python tests/bench_frames.py [rows ...]
+default size is 1000000 rows
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from fml_manager.utils.frames import typed_frame
+
+HEADER = ["id", "label"] + ["x{}".format(i) for i in range(20)]
+
+
+def build_rows(rows):
+    random = np.random.RandomState(0)
+    features = random.uniform(-1, 1, size=(rows, 20)).round(6).astype(str).tolist()
+    labels = random.randint(0, 2, size=rows).tolist()
+    data = [[str(i), label] + row for i, label, row in zip(range(rows), labels, features)]
+    # the rows as they come out of the response
+    return json.loads(json.dumps(data))
+
+
+def reset_peak_rss():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+
+
+def child(mode, rows):
+    data = build_rows(int(rows))
+    reset_peak_rss()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "untyped":
+        frame = pd.DataFrame(data, columns=HEADER)
+    elif mode == "cast":
+        frame = pd.DataFrame(data, columns=HEADER)
+        frame = frame.astype(dict([("id", "category"), ("label", "category")] +
+                                  [(name, "float64") for name in HEADER[2:]]))
+    else:
+        frame = typed_frame(data, HEADER, float32=mode == "float32")
+    elapsed = time.perf_counter() - start
+    size = frame.memory_usage(deep=True).sum() / 1024.0 / 1024.0
+    print("{:.1f} {:.1f} {:.3f}".format(size, peak_rss_mb() - baseline, elapsed))
+
+
+def run(mode, rows):
+    output = subprocess.check_output([sys.executable, __file__, "--child", mode, str(rows)])
+    size, growth, elapsed = [float(x) for x in output.split()[-3:]]
+    print("{:<8} {:>9} {:>10.1f} MB {:>10.1f} MB {:>9.2f} s".format(
+        mode, rows, size, growth, elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:4])
+        sys.exit(0)
+
+    sizes = [int(rows) for rows in sys.argv[1:]] or [1000000]
+    print("{:<8} {:>9} {:>13} {:>13} {:>11}".format("mode", "rows", "frame", "RSS growth", "time"))
+    for rows in sizes:
+        for mode in ("untyped", "cast", "typed", "float32"):
+            run(mode, rows)
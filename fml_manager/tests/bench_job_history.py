@@ -0,0 +1,86 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time of syncing a job history and of the analytical queries over it
+
+The stub lists the jobs of a status in one job query, as FATE Flow does.
+The first sync writes every job, the second one finds no change and
+queries the tasks of none, and the third one after a tenth of the jobs
+changed writes them only. The queries then run against the local
+database.
+
+Usage: python tests/bench_job_history.py [--jobs 50000]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from fml_manager import FMLManager
+from fate_flow_stub import FateFlowStub
+
+MODULES = ["HomoLR", "HeteroLR", "HeteroSecureBoost", "HomoNN", "Evaluation"]
+NOW = time.time()
+
+
+def fate_job(index, rng, status="success"):
+    created = NOW - rng.random() * 30 * 86400
+    elapsed = rng.lognormvariate(6, 0.5)
+    return {"f_job_id": "job_{}".format(index), "f_role": "guest", "f_party_id": 9999, "f_status": status,
+            "f_is_initiator": 1, "f_create_time": int(created * 1000), "f_start_time": int(created * 1000),
+            "f_end_time": int((created + elapsed) * 1000), "f_elapsed": int(elapsed * 1000),
+            "f_update_time": int((created + elapsed) * 1000),
+            "f_dsl": {"components": {"dataio_0": {"module": "DataIO"},
+                                     "model_0": {"module": MODULES[index % len(MODULES)]}}}}
+
+
+def measure(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print("{:<32} {:>10.1f} ms  {}".format(label, (time.perf_counter() - start) * 1000.0, result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    jobs = [fate_job(i, rng) for i in range(args.jobs)]
+
+    def query_job(request):
+        status = request.json().get("status")
+        found = [job for job in jobs if status is not None and job["f_status"] == status]
+        if not found:
+            return {"retcode": 101, "retmsg": "find job failed"}
+        return {"retcode": 0, "retmsg": "success", "data": found}
+
+    routes = {"/v1/job/query": query_job,
+              "/v1/job/task/query": lambda request: {"retcode": 0, "retmsg": "success", "data": []}}
+
+    with FateFlowStub(routes) as stub, tempfile.TemporaryDirectory() as log_path:
+        stub.export_host()
+        manager = FMLManager(log_path=log_path)
+        measure("first sync, without tasks", lambda: manager.sync_job_history(tasks=False))
+        measure("sync, nothing changed", lambda: manager.sync_job_history())
+        for i in range(0, args.jobs, 10):
+            jobs[i] = fate_job(i, rng, status="failed")
+        measure("sync, a tenth changed", lambda: manager.sync_job_history(tasks=False))
+
+        history = manager.job_history
+        week = NOW - 7 * 86400
+        measure("p95 of HomoLR this week", lambda: history.runtime_stats(
+            module="HomoLR", since=week)["p95"].iloc[0])
+        measure("runtime by module", lambda: len(history.runtime_stats()))
+        measure("failed jobs of the week", lambda: len(history.jobs(status="failed", since=week)))
+        manager.close()
@@ -0,0 +1,127 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wall time and disk bytes written by fetch_job_log, streamed versus tarball on disk
+
+The baseline is the former fetch_job_log: the body is written to a
+tarball by 1KB chunks, re-opened, extracted member by member and deleted.
+The streamed rows pipe the body into the tar reader, with every member or
+with members="guest/*ERROR*" only. Disk bytes are the bytes of the files
+written, the tarball included.
+
+Usage: python tests/bench_job_log.py [size_mb ...]
+default log sizes are 64 and 512 MB
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+from contextlib import closing
+
+from fml_manager import FMLManager
+from fml_manager import flow_requests
+from fate_flow_stub import FateFlowStub
+
+ROLES = ("guest/9999", "host/10000", "arbiter/10000")
+LEVELS = ("INFO", "DEBUG", "WARNING", "ERROR")
+
+
+def write_archive(path, size):
+    # repetitive log lines, they compress about 3x
+    words = [b"task", b"partition", b"epoch", b"loss", b"federation", b"remote", b"get", b"tag"]
+    rng = random.Random(0)
+    line = lambda: b" ".join(rng.choice(words) + b"%d" % rng.randrange(1000) for _ in range(12)) + b"\n"
+    block = b"".join(line() for _ in range(20000))
+    member_size = size // (len(ROLES) * len(LEVELS))
+    with tarfile.open(path, "w:gz", compresslevel=1) as tar:
+        for role in ROLES:
+            for level in LEVELS:
+                info = tarfile.TarInfo("{}/{}.log".format(role, level))
+                info.size = member_size - member_size % len(block)
+                tar.addfile(info, io.BytesIO(block * (info.size // len(block))))
+
+
+def file_route(path):
+    def handler(request):
+        def body():
+            with open(path, "rb") as f:
+                while True:
+                    data = f.read(64 * 1024)
+                    if not data:
+                        return
+                    yield data
+        return 200, body()
+    return handler
+
+
+def tree_size(root):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(root) for name in names)
+
+
+def fetch_to_disk(manager, job_id, log_path):
+    # the former fetch_job_log
+    tar_file_name = os.path.join(log_path, "job_{}_log.tar.gz".format(job_id))
+    extract_dir = os.path.join(log_path, "job_{}_log".format(job_id))
+    request = flow_requests.fetch_job_log(job_id)
+    with closing(manager._send(request)) as response:
+        with open(tar_file_name, "wb") as fw:
+            for chunk in response.iter_content(1024):
+                if chunk:
+                    fw.write(chunk)
+    written = os.path.getsize(tar_file_name)
+    tar = tarfile.open(tar_file_name, "r:gz")
+    for file_name in tar.getnames():
+        tar.extract(file_name, extract_dir)
+    tar.close()
+    os.remove(tar_file_name)
+    return written + tree_size(extract_dir)
+
+
+def run(label, fetch, log_path):
+    start = time.perf_counter()
+    written = fetch()
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>9.2f} s {:>11.1f} MB".format(label, elapsed, written / 1024.0 / 1024.0))
+    shutil.rmtree(log_path)
+    os.makedirs(log_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", type=int, nargs="*", default=[64, 512])
+    args = parser.parse_args()
+
+    with FateFlowStub() as stub, tempfile.TemporaryDirectory() as work_dir:
+        stub.export_host()
+        log_path = os.path.join(work_dir, "logs")
+        os.makedirs(log_path)
+        manager = FMLManager(log_path=log_path)
+
+        for size_mb in args.sizes:
+            archive = os.path.join(work_dir, "log_{}mb.tar.gz".format(size_mb))
+            write_archive(archive, size_mb * 1024 * 1024)
+            stub.routes["/v1/job/log"] = file_route(archive)
+            print("{} MB of logs, {:.1f} MB archive".format(size_mb, os.path.getsize(archive) / 1024.0 / 1024.0))
+            print("{:<24} {:>11} {:>14}".format("mode", "time", "disk written"))
+
+            run("tarball on disk", lambda: fetch_to_disk(manager, "job", log_path), log_path)
+            run("streamed", lambda: tree_size(manager.fetch_job_log("job")["directory"]), log_path)
+            run("streamed guest/*ERROR*", lambda: tree_size(
+                manager.fetch_job_log("job", members="guest/*ERROR*")["directory"]), log_path)
+            os.remove(archive)
+            print()
@@ -0,0 +1,144 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fetch time of many job logs and query time of the log index versus a rescan
+
+The stub answers every log request after --latency seconds, like a
+remote FATE Flow packing the logs. The logs are fetched and indexed one
+after another with fetch_job_log, then with fetch_job_logs. The query looks for the
+ERROR records of hetero_lr_0 mentioning a timeout in the last --last jobs,
+from the index and by scanning the extracted files.
+
+Usage: python tests/bench_log_index.py [--jobs 300] [--last 300] [--latency 0.2] [--job-mb 2] [--parallelism 8]
+"""
+
+import argparse
+import io
+import os
+import random
+import re
+import tarfile
+import tempfile
+import time
+
+from fml_manager import FMLManager
+from fate_flow_stub import FateFlowStub
+
+COMPONENTS = ("dataio_0", "intersection_0", "hetero_lr_0", "evaluation_0")
+# messages of a training task, with numbers and the tags of the federation calls
+TEMPLATES = [
+    "start task {job} partition {n} of {n}",
+    "federation remote tag {job}.hetero_lr_0.loss_{n} to party {n} with {n} bytes",
+    "federation get tag {job}.hetero_lr_0.gradient_{n} from party {n} in {f} s",
+    "epoch {n} batch {n} loss {f} converged False",
+    "compute gradient of batch {n} with {n} rows in {f} s",
+    "send {n} rows of batch_{n} to guest, waiting {f} s",
+]
+
+
+def record(rng, level, job_id):
+    message = rng.choice(TEMPLATES).format(job=job_id, n=rng.randrange(10000), f=rng.random())
+    if level == "ERROR":
+        message = "federation timeout of job {}\nTraceback (most recent call last):\n  File \"x.py\", line 1\nTimeoutError".format(job_id)
+    return "[{}] [2020-12-01 10:00:00,000] [1:140] - task_executor.py[line:80]: {}\n".format(level, message)
+
+
+def job_archive(job_id, size, rng):
+    files = {}
+    per_file = size // (2 * len(COMPONENTS))
+    for role, party_id in (("guest", "9999"), ("host", "10000")):
+        for component in COMPONENTS:
+            lines, length = [], 0
+            while length < per_file:
+                line = record(rng, "INFO", job_id)
+                lines.append(line)
+                length += len(line)
+            files["{}/{}/{}/INFO.log".format(role, party_id, component)] = "".join(lines).encode("utf-8")
+            if component == "hetero_lr_0" and rng.random() < 0.2:
+                files["{}/{}/{}/ERROR.log".format(role, party_id, component)] = record(rng, "ERROR", job_id).encode("utf-8")
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def log_route(archives, latency):
+    def handler(request):
+        time.sleep(latency)
+        return 200, archives[request.json()["job_id"]]
+    return handler
+
+
+def scan(log_path, job_ids):
+    # what a grep over the extracted trees does
+    pattern = re.compile(r"^\[ERROR\].*timeout", re.IGNORECASE)
+    found = 0
+    for job_id in job_ids:
+        root = os.path.join(log_path, "job_{}_log".format(job_id))
+        for directory, _, names in os.walk(root):
+            if os.path.basename(directory) != "hetero_lr_0":
+                continue
+            for name in names:
+                with open(os.path.join(directory, name), errors="replace") as f:
+                    found += sum(1 for line in f if pattern.match(line))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--last", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--job-mb", type=float, default=2)
+    parser.add_argument("--parallelism", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    job_ids = ["2020120110000{:05d}".format(i) for i in range(args.jobs)]
+    archives = {job_id: job_archive(job_id, int(args.job_mb * 1024 * 1024), rng) for job_id in job_ids}
+
+    with FateFlowStub({"/v1/job/log": log_route(archives, args.latency)}) as stub, \
+            tempfile.TemporaryDirectory() as work_dir:
+        stub.export_host()
+        manager = FMLManager(log_path=work_dir)
+
+        sample = job_ids[:min(20, args.jobs)]
+        start = time.perf_counter()
+        for job_id in sample:
+            manager.fetch_job_log(job_id, index=True)
+        sequential = (time.perf_counter() - start) / len(sample) * len(job_ids)
+
+        start = time.perf_counter()
+        manager.fetch_job_logs(job_ids, parallelism=args.parallelism)
+        parallel = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = manager.log_index.search(component="hetero_lr_0", level="ERROR", text="timeout", last=args.last)
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanned = scan(work_dir, manager.log_index.jobs()[:args.last])
+        rescan = time.perf_counter() - start
+
+        logs = sum(os.path.getsize(os.path.join(d, n)) for d, _, names in os.walk(work_dir)
+                   for n in names if n.endswith(".log"))
+        index_path = manager.log_index.path
+        manager.close()
+        print("{} jobs, {:.0f} MB of logs, index {:.1f} MB".format(
+            args.jobs, logs / 1024.0 / 1024.0, os.path.getsize(index_path) / 1024.0 / 1024.0))
+        print("fetch one by one (estimated from {} jobs) {:>9.2f} s".format(len(sample), sequential))
+        print("fetch_job_logs parallelism={:<14} {:>9.2f} s".format(args.parallelism, parallel))
+        print("query index, {} records {:>19.1f} ms".format(len(records), indexed * 1000))
+        print("rescan of the logs, {} records {:>12.1f} ms".format(scanned, rescan * 1000))
@@ -0,0 +1,87 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cost of handling a large tracking response, eager versus lazy
+
+The payload is the body of track_component_output_data with --rows rows.
+"eager verbose" is the former call with verbose printing: the body is
+decoded and dumped with indent=4 on every call, then decoded again by the
+caller. "lazy" only reads the status, "lazy + json()" decodes once, with
+json and with orjson when it is installed.
+
+Usage: python tests/bench_response.py [--rows 200000] [--repeat 5]
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+from contextlib import redirect_stdout
+
+from fml_manager import FlowResponse
+from fml_manager.utils import core
+
+
+def payload(rows):
+    rng = random.Random(0)
+    data = [[str(i), rng.randrange(2)] + [rng.random() for _ in range(10)] for i in range(rows)]
+    return json.dumps({"retcode": 0, "retmsg": "success", "data": data,
+                       "meta": {"header": ["id", "label"] + ["x{}".format(i) for i in range(10)]}}).encode("utf-8")
+
+
+def eager(content):
+    # the former verbose printing, followed by the caller's json()
+    with redirect_stdout(io.StringIO()):
+        print("Success!")
+        print(json.dumps(json.loads(content), indent=4, ensure_ascii=False))
+    return json.loads(content)["retcode"]
+
+
+def lazy(content):
+    return FlowResponse(200, content).ok
+
+
+def lazy_json(content):
+    return FlowResponse(200, content)["retcode"]
+
+
+def measure(label, fn, content, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        best = min(best, time.perf_counter() - start)
+    print("{:<24} {:>10.1f} ms".format(label, best * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    content = payload(args.rows)
+    print("{} rows, {:.1f} MB body".format(args.rows, len(content) / 1024.0 / 1024.0))
+
+    core.set_json_decoder(json.loads)
+    measure("eager verbose", eager, content, args.repeat)
+    measure("lazy", lazy, content, args.repeat)
+    measure("lazy + json() json", lazy_json, content, args.repeat)
+    try:
+        import orjson
+    except ImportError:
+        print("orjson is not installed")
+    else:
+        core.set_json_decoder(orjson.loads)
+        measure("lazy + json() orjson", lazy_json, content, args.repeat)
+    core.set_json_decoder()
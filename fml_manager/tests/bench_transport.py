@@ -0,0 +1,51 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Requests per second of query_job with and without the pooled transport
+
+Usage: python tests/bench_transport.py [calls]
+"""
+
+import sys
+import time
+
+import requests
+
+from fml_manager import QueryCondition
+from fate_flow_stub import FateFlowStub, manager_for
+
+
+def job_query(request):
+    return {"retcode": 0, "retmsg": "success",
+            "data": [{"f_job_id": request.json()["job_id"], "f_status": "running"}]}
+
+
+def bench(name, call, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>8.1f} req/s".format(name, calls / elapsed))
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with FateFlowStub({"/v1/job/query": job_query}) as stub:
+        manager = manager_for(stub)
+        condition = QueryCondition("202010101010101010101")
+        url = "/".join([manager.server_url, "job", "query"])
+
+        bench("one connection per call", lambda: requests.post(
+            url, json=condition.to_dict()), calls)
+        bench("pooled keep-alive transport", lambda: manager.query_job(condition), calls)
+        manager.close()
@@ -0,0 +1,99 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Peak RSS and throughput of load_data, streaming versus an in-memory multipart body
+
+Every upload runs in its own process so its peak RSS is not polluted by
+the previous ones. The in-memory baseline is only run up to --buffered-max-mb.
+The parallel mode uploads 4 shards at once, as load_data(parallel=True).
+
+Usage: python tests/bench_upload.py [--buffered-max-mb 1024] [size_mb ...]
+default sizes are 100, 1024 and 5120 MB
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from fml_manager import FMLManager
+from fate_flow_stub import FateFlowStub, upload_route
+
+
+def write_csv(path, size):
+    line = b"".join(b"%d,%d,%.6f,%.6f\n" % (i, i % 2, i * 0.5, i * 0.25) for i in range(10000))
+    with open(path, "wb") as f:
+        f.write(b"id,y,x0,x1\n")
+        written = 0
+        while written < size:
+            f.write(line)
+            written += len(line)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def child(mode, path, host):
+    os.environ["FATE_FLOW_HOST"] = host
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "streaming":
+        FMLManager().load_data(path, "bench", "upload", 1, 1, 4)
+    elif mode == "parallel":
+        FMLManager().load_data(path, "bench", "upload", 1, 1, 4, parallel=True)
+    else:
+        with open(path, "rb") as f:
+            requests.post("http://{}/v1/data/upload".format(host),
+                          params={"namespace": "bench", "table_name": "upload"}, files={"file": f})
+    elapsed = time.perf_counter() - start
+    print("{:.1f} {:.1f} {:.3f}".format(baseline, peak_rss_mb(), elapsed))
+
+
+def run(mode, path, host):
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--child", mode, path, host], env=dict(os.environ))
+    baseline, peak, elapsed = [float(x) for x in output.split()[-3:]]
+    size_mb = os.path.getsize(path) / 1024.0 / 1024.0
+    print("{:<10} {:>8.0f} MB {:>10.1f} MB {:>10.1f} MB {:>10.1f} MB/s".format(
+        mode, size_mb, peak, peak - baseline, size_mb / elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buffered-max-mb", type=int, default=1024)
+    parser.add_argument("sizes", type=int, nargs="*", default=[100, 1024, 5120])
+    args = parser.parse_args()
+
+    with FateFlowStub() as stub, tempfile.TemporaryDirectory() as work_dir:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0}
+        print("{:<10} {:>11} {:>13} {:>13} {:>15}".format(
+            "mode", "file", "peak RSS", "RSS growth", "throughput"))
+        for size_mb in args.sizes:
+            path = os.path.join(work_dir, "bench_{}mb.csv".format(size_mb))
+            write_csv(path, size_mb * 1024 * 1024)
+            run("streaming", path, stub.host)
+            run("parallel", path, stub.host)
+            if size_mb <= args.buffered_max_mb:
+                run("buffered", path, stub.host)
+            os.remove(path)
@@ -0,0 +1,312 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local stand-in of FATE Flow used by the tests and benchmarks"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def iter_body(self, chunk_size=65536):
+        """ Yield the request body, both Content-Length and chunked bodies are supported
+        """
+        self._body_consumed = True
+        bandwidth = self.server.stub.bandwidth
+        for data in self._iter_wire_body(chunk_size):
+            self.wire_size += len(data)
+            if bandwidth is not None:
+                # emulate a slow link between sites
+                time.sleep(len(data) / float(bandwidth))
+            yield data
+
+    def iter_decoded_body(self):
+        """ Yield the request body decoded from its Content-Encoding, a gzip body may have several members
+        """
+        if self.headers.get("Content-Encoding", "").lower() != "gzip":
+            yield from self.iter_body()
+            return
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for data in self.iter_body():
+            while data:
+                decoded = decompressor.decompress(data)
+                if decoded:
+                    yield decoded
+                if not decompressor.eof:
+                    break
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _iter_wire_body(self, chunk_size):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                remain = size
+                while remain > 0:
+                    data = self.rfile.read(min(chunk_size, remain))
+                    if not data:
+                        return
+                    remain -= len(data)
+                    yield data
+                self.rfile.readline()
+        else:
+            remain = int(self.headers.get("Content-Length", 0))
+            while remain > 0:
+                data = self.rfile.read(min(chunk_size, remain))
+                if not data:
+                    return
+                remain -= len(data)
+                yield data
+
+    def read_body(self):
+        return b"".join(self.iter_body())
+
+    def json(self):
+        body = self.read_body()
+        return json.loads(body) if body else {}
+
+    def _dispatch(self):
+        self._body_consumed = False
+        self.wire_size = 0
+        path = self.path.split("?")[0]
+        stub = self.server.stub
+        with stub.lock:
+            stub.calls.append(path)
+        handler = stub.routes.get(path)
+        if handler is None:
+            status, payload, headers = 404, {"retcode": 404, "retmsg": "no route"}, {}
+        else:
+            result = handler(self)
+            if result is None:
+                # the handler has dropped the connection on purpose
+                self.close_connection = True
+                return
+            if not isinstance(result, tuple):
+                result = (200, result)
+            status, payload = result[0], result[1]
+            headers = result[2] if len(result) > 2 else {}
+        if not self._body_consumed:
+            for _ in self.iter_body():
+                pass
+
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        if not isinstance(payload, bytes):
+            # an iterable payload is sent with chunked transfer encoding
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for data in payload:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+
+_UNSET = object()
+
+
+class FateFlowStub:
+    """FateFlowStub serves canned FATE Flow responses on a local port
+
+    Routes map a path such as "/v1/job/query" to a callable taking the
+    request handler and returning a dict, bytes or (status, payload, headers).
+    A payload which is an iterable of bytes is sent chunked.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+        self.lock = threading.Lock()
+
+        #: Number of TCP connections accepted
+        self.connections = 0
+
+        #: Paths of every request received
+        self.calls = []
+
+        #: Bytes per second read from every request body, None means no limit
+        self.bandwidth = None
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+        # FATE_FLOW_HOST before export_host, restored by stop
+        self._saved_host = _UNSET
+
+    @property
+    def host(self):
+        return "{}:{}".format(*self._server.server_address)
+
+    @property
+    def url(self):
+        return "http://{}/v1".format(self.host)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def export_host(self):
+        """ Point the managers built next to the stub by FATE_FLOW_HOST, until stop() restores it
+        """
+        if self._saved_host is _UNSET:
+            self._saved_host = os.environ.get("FATE_FLOW_HOST")
+        os.environ["FATE_FLOW_HOST"] = self.host
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._saved_host is not _UNSET:
+            if self._saved_host is None:
+                os.environ.pop("FATE_FLOW_HOST", None)
+            else:
+                os.environ["FATE_FLOW_HOST"] = self._saved_host
+            self._saved_host = _UNSET
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def job_query_route(statuses):
+    """ Return a /job/query handler replaying a status sequence per job
+
+    :param statuses: Job id to list of statuses, the last one is repeated
+    :type statuses: dict
+
+    """
+    lock = threading.Lock()
+    served = {}
+
+    def handler(request):
+        job_id = request.json().get("job_id")
+        with lock:
+            sequence = statuses.get(job_id)
+            if sequence is None:
+                return {"retcode": 101, "retmsg": "job not found", "data": []}
+            index = min(served.get(job_id, 0), len(sequence) - 1)
+            served[job_id] = index + 1
+        return {"retcode": 0, "retmsg": "success",
+                "data": [{"f_job_id": job_id, "f_status": sequence[index]}]}
+
+    return handler
+
+
+def submit_route(submitted, job_id=None):
+    """ Return a /job/submit handler which records the bodies in submitted
+
+    The model of a job is named model_<job id>, its version is the job id.
+
+    :param submitted: List the submitted bodies are appended to
+    :type submitted: list
+    :param job_id: Called with the body to name the job, default job_<number of submits>
+    :type job_id: callable
+
+    """
+    lock = threading.Lock()
+
+    def handler(request):
+        body = request.json()
+        with lock:
+            submitted.append(body)
+            name = job_id(body) if job_id is not None else "job_{}".format(len(submitted))
+        return {"retcode": 0, "retmsg": "success", "jobId": name,
+                "data": {"model_info": {"model_id": "model_" + name, "model_version": name}}}
+
+    return handler
+
+
+def upload_route(stub, keep_content=False):
+    """ Return a /data/upload handler which streams the file part and records it in stub.uploads
+
+    Only the size and sha256 of the file are kept, so the stub can take
+    uploads of any size, unless keep_content is set.
+    """
+    stub.uploads = []
+
+    def handler(request):
+        boundary = request.headers["Content-Type"].split("boundary=")[1].encode("utf-8")
+        tail = len(b"\r\n--" + boundary + b"--\r\n")
+        digest = hashlib.sha256()
+        size = 0
+        content = []
+        buffer = b""
+        in_file = False
+        for data in request.iter_decoded_body():
+            buffer += data
+            if not in_file:
+                end = buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    continue
+                buffer = buffer[end + 4:]
+                in_file = True
+            # hold back the closing boundary
+            if len(buffer) > tail:
+                digest.update(buffer[:-tail])
+                if keep_content:
+                    content.append(buffer[:-tail])
+                size += len(buffer) - tail
+                buffer = buffer[-tail:]
+        params = {k: v[0] for k, v in parse_qs(urlparse(request.path).query).items()}
+        upload = {"params": params, "size": size, "sha256": digest.hexdigest(),
+                  "wire_size": request.wire_size, "headers": dict(request.headers)}
+        if keep_content:
+            upload["content"] = b"".join(content)
+        with stub.lock:
+            stub.uploads.append(upload)
+        return {"retcode": 0, "retmsg": "success", "jobId": uuid.uuid1().hex}
+
+    return handler
+
+
+def manager_for(stub, **kwargs):
+    """ Build a FMLManager pointing to the stub
+    """
+    from fml_manager import FMLManager
+
+    stub.export_host()
+    return FMLManager(**kwargs)
@@ -0,0 +1,114 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from collections import Counter
+
+from fml_manager import AdmissionController
+from fate_flow_stub import FateFlowStub, manager_for
+
+
+class Cluster:
+    # jobs named by their config, running for a few polls, or until released if held
+    def __init__(self, polls=2, held=()):
+        self.polls = polls
+        self.held = set(held)
+        self.lock = threading.Lock()
+        self.served = Counter()
+        self.finished = set()
+        self.submitted = []
+        self.peak = 0
+
+    def submit(self, request):
+        name = request.json()["job_runtime_conf"]["name"]
+        with self.lock:
+            self.submitted.append(name)
+            self.peak = max(self.peak, len(self.submitted) - len(self.finished))
+        if name.startswith("rejected"):
+            return {"retcode": 100, "retmsg": "invalid config"}
+        return {"retcode": 0, "retmsg": "success", "jobId": name}
+
+    def query(self, request):
+        job_id = request.json()["job_id"]
+        with self.lock:
+            self.served[job_id] += 1
+            if job_id not in self.held and self.served[job_id] > self.polls:
+                self.finished.add(job_id)
+            status = "success" if job_id in self.finished else "running"
+        return {"retcode": 0, "retmsg": "success", "data": [{"f_job_id": job_id, "f_status": status}]}
+
+    def routes(self):
+        return {"/v1/job/submit": self.submit, "/v1/job/query": self.query}
+
+
+def job(name):
+    return {"components": {}}, {"name": name}
+
+
+def test_capacity_holds_the_submissions():
+    cluster = Cluster()
+    with FateFlowStub(cluster.routes()) as stub:
+        manager = manager_for(stub)
+        manager.job_watcher.interval = 0.01
+        controller = manager.admission
+        controller.resize(3)
+        futures = controller.submit_jobs([job("sweep_{}".format(i)) for i in range(12)], user="alice")
+        assert controller.join(10)
+        stats = controller.stats()
+        manager.close()
+
+    assert [future.result().job_id for future in futures] == ["sweep_{}".format(i) for i in range(12)]
+    assert cluster.peak == 3
+    assert stats["admitted"] == stats["finished"] == 12
+    assert stats["pending"] == stats["active"] == 0
+    assert stats["throughput"] > 0 and stats["wait_max"] >= stats["wait_p50"] > 0
+    assert stats["users"]["alice"]["admitted"] == 12
+
+
+def test_priorities_and_fair_share():
+    cluster = Cluster(held=["alice_0"])
+    with FateFlowStub(cluster.routes()) as stub:
+        manager = manager_for(stub)
+        manager.job_watcher.interval = 0.01
+        with AdmissionController(manager, capacity=1) as controller:
+            controller.submit(*job("alice_0"), user="alice").result(10)
+            for i in range(1, 3):
+                controller.submit(*job("alice_{}".format(i)), user="alice")
+            controller.submit(*job("bob_0"), user="bob")
+            controller.submit(*job("carol_0"), priority=5, user="carol")
+            assert controller.stats()["users"]["bob"]["pending"] == 1
+            cluster.held.clear()
+            assert controller.join(10)
+        manager.close()
+
+    # the priority first, then bob whose share is unused, then alice again
+    assert cluster.submitted == ["alice_0", "carol_0", "bob_0", "alice_1", "alice_2"]
+    assert cluster.peak == 1
+
+
+def test_rejected_and_cancelled_jobs_free_their_slot():
+    cluster = Cluster(held=["held_0"])
+    with FateFlowStub(cluster.routes()) as stub:
+        manager = manager_for(stub)
+        manager.job_watcher.interval = 0.01
+        controller = AdmissionController(manager, capacity=1)
+        rejected = controller.submit(*job("rejected_0"))
+        held = controller.submit(*job("held_0"))
+        queued = controller.submit(*job("queued_0"))
+        assert not rejected.result(10).ok
+        assert held.result(10).job_id == "held_0"
+        assert controller.active() == ["held_0"]
+        controller.close()
+        manager.close()
+
+    assert queued.cancelled()
+    assert cluster.submitted == ["rejected_0", "held_0"]
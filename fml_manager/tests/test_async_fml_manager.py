@@ -0,0 +1,105 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import inspect
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from fml_manager import AsyncFMLManager, FMLManager, QueryCondition, ResultCache
+from fate_flow_stub import FateFlowStub, job_query_route
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.bodies = []
+
+    def __call__(self, request):
+        body = request.json()
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            self.bodies.append(body)
+        time.sleep(0.05)
+        with self.lock:
+            self.current -= 1
+        return {"retcode": 0, "retmsg": "success", "data": {"train": ["loss"]}}
+
+
+def test_every_public_api_is_a_coroutine():
+    utils = {"with_timeout"}
+    for name, method in inspect.getmembers(FMLManager, inspect.isfunction):
+        if name.startswith("_") or name in utils:
+            continue
+        method = getattr(AsyncFMLManager, name)
+        assert inspect.iscoroutinefunction(method) or inspect.isasyncgenfunction(method), name
+
+
+def test_fan_out_with_bounded_concurrency():
+    counter = InFlightCounter()
+    with FateFlowStub({"/v1/tracking/component/metrics": counter}) as stub:
+        stub.export_host()
+
+        async def fan_out():
+            async with AsyncFMLManager(max_concurrency=4) as manager:
+                return await asyncio.gather(*[
+                    manager.track_component_metric_type(
+                        "job_{}".format(i), "guest", 10000, "homo_lr_0")
+                    for i in range(20)])
+
+        responses = asyncio.run(fan_out())
+
+    assert [r.json()["data"] for r in responses] == [{"train": ["loss"]}] * 20
+    assert 1 < counter.peak <= 4
+
+
+def test_same_request_body_as_sync_client():
+    counter = InFlightCounter()
+    with FateFlowStub({"/v1/job/query": counter}) as stub:
+        stub.export_host()
+
+        FMLManager().query_job(QueryCondition("job_0"))
+
+        async def query():
+            async with AsyncFMLManager() as manager:
+                await manager.query_job(QueryCondition("job_0"))
+
+        asyncio.run(query())
+
+    assert counter.bodies[0] == counter.bodies[1] == {"job_id": "job_0"}
+
+
+def test_cache_shared_with_sync_client(tmp_path):
+    counter = InFlightCounter()
+    routes = {"/v1/tracking/component/metrics": counter,
+              "/v1/job/query": job_query_route({"job_0": ["success"]})}
+    with FateFlowStub(routes) as stub:
+        stub.export_host()
+        cache = ResultCache(str(tmp_path))
+        FMLManager(cache=cache).track_component_metric_type("job_0", "guest", 10000, "homo_lr_0")
+
+        async def track():
+            async with AsyncFMLManager(cache=cache) as manager:
+                return await manager.track_component_metric_type("job_0", "guest", 10000, "homo_lr_0")
+
+        response = asyncio.run(track())
+
+    assert response.json()["data"] == {"train": ["loss"]}
+    assert len(counter.bodies) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
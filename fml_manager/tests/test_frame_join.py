@@ -0,0 +1,154 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pandas as pd
+import pytest
+
+from fml_manager.utils.frame_join import HashJoin
+from fate_flow_stub import FateFlowStub, manager_for
+
+OUTPUT_DATA = "/v1/tracking/component/output/data"
+
+
+def chunks(frame, size):
+    return [frame.iloc[i:i + size] for i in range(0, len(frame), size)]
+
+
+def run_join(join, sides, size):
+    # feed the sides in turns like the managers do
+    pending = {label: chunks(frame, size) for label, frame in sides.items()}
+    joined = []
+    while pending:
+        for label in list(pending):
+            if pending[label]:
+                joined.extend(join.feed(label, pending[label].pop(0)))
+            else:
+                del pending[label]
+                joined.extend(join.end(label))
+    return pd.concat(joined, ignore_index=True) if joined else pd.DataFrame()
+
+
+def guest_frame(count):
+    return pd.DataFrame({"id": pd.Categorical([str(i) for i in range(count)]),
+                         "label": [i % 2 for i in range(count)],
+                         "predict_score": [i / count for i in range(count)]})
+
+
+def host_frame(ids):
+    return pd.DataFrame({"id": [str(i) for i in ids], "label": [1] * len(ids),
+                         "x0": [float(i) for i in ids]})
+
+
+def test_two_sides_match_a_pandas_merge():
+    guest = guest_frame(50)
+    host = host_frame(range(200, -1, -3))
+    join = HashJoin(["guest_9999", "host_10000"])
+
+    joined = run_join(join, {"guest_9999": guest, "host_10000": host}, 7)
+
+    # the smallest side ended first and is the only one kept
+    assert join.build_label == "guest_9999"
+    assert list(joined.columns) == ["id", "label_guest_9999", "predict_score", "label_host_10000", "x0"]
+    expected = guest.astype({"id": object}).merge(host, on="id", suffixes=("_guest_9999", "_host_10000"))
+    pd.testing.assert_frame_equal(
+        joined.sort_values("id").reset_index(drop=True),
+        expected[joined.columns].sort_values("id").reset_index(drop=True), check_dtype=False)
+
+
+def test_duplicated_keys_and_three_sides():
+    guest = guest_frame(10)
+    host = host_frame([1, 1, 2, 5, 30])
+    other = pd.DataFrame({"id": ["5", "1", "9"], "x1": [50, 10, 90]})
+    join = HashJoin(["guest_9999", "host_10000", "host_10001"], chunk_size=2)
+
+    frames = []
+    for label, frame in (("host_10000", host), ("guest_9999", guest), ("host_10001", other)):
+        frames.extend(join.feed(label, frame))
+    assert frames == []
+    frames.extend(join.end("host_10001"))
+    frames.extend(join.end("host_10000"))
+    assert frames == []
+    frames.extend(join.end("guest_9999"))
+
+    joined = pd.concat(frames, ignore_index=True)
+    assert [len(frame) for frame in frames] == [2, 1]
+    assert list(joined.columns) == ["id", "label_guest_9999", "predict_score", "label_host_10000", "x0", "x1"]
+    assert sorted(zip(joined["id"], joined["x0"], joined["x1"])) == [("1", 1.0, 10), ("1", 1.0, 10), ("5", 5.0, 50)]
+
+
+def test_side_without_rows_joins_nothing():
+    join = HashJoin(["guest_9999", "host_10000"])
+    assert run_join(join, {"guest_9999": guest_frame(0), "host_10000": host_frame([1, 2])}, 5).empty
+    with pytest.raises(ValueError):
+        HashJoin(["guest_9999", "guest_9999"])
+
+
+def output_route(outputs):
+    # the output of the role and party of the request, streamed in small pieces
+    def handler(request):
+        body = request.json()
+        header, rows = outputs[(body["role"], str(body["party_id"]), body["component_name"])]
+        content = json.dumps({"data": rows, "meta": {"header": header},
+                              "retcode": 0, "retmsg": "success"}).encode("utf-8")
+        return 200, (content[i:i + 4096] for i in range(0, len(content), 4096))
+    return handler
+
+
+def test_join_component_output_data_of_guest_and_host():
+    guest_rows = [[str(i), i % 2, 0.5] for i in range(3000)]
+    host_rows = [[str(i), float(i)] for i in range(0, 10000, 2)]
+    outputs = {("guest", "9999", "hetero_lr_0"): (["id", "label", "predict_score"], guest_rows),
+               ("host", "10000", "dataio_0"): (["id", "x0"], host_rows)}
+
+    with FateFlowStub({OUTPUT_DATA: output_route(outputs)}) as stub:
+        manager = manager_for(stub)
+        frames = list(manager.join_component_output_data(
+            "job_0", "hetero_lr_0", [("guest", 9999), ("host", 10000, "dataio_0")], chunk_size=500))
+
+    joined = pd.concat(frames, ignore_index=True)
+    assert list(joined.columns) == ["id", "label", "predict_score", "x0"]
+    assert len(joined) == 1500
+    assert (joined["x0"] == joined["id"].astype(float)).all()
+
+
+def test_join_raises_the_error_of_a_side():
+    def failing(request):
+        if request.json()["role"] == "host":
+            return {"retcode": 100, "retmsg": "no output data"}
+        return {"data": [["1", 0]], "meta": {"header": ["id", "label"]}, "retcode": 0, "retmsg": "success"}
+
+    with FateFlowStub({OUTPUT_DATA: failing}) as stub:
+        manager = manager_for(stub)
+        with pytest.raises(Exception, match="no output data"):
+            list(manager.join_component_output_data("job_0", "dataio_0", [("guest", 9999), ("host", 10000)]))
+
+
+def test_async_join_component_output_data():
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from fml_manager import AsyncFMLManager
+
+    outputs = {("guest", "9999", "dataio_0"): (["id", "label"], [[str(i), 0] for i in range(100)]),
+               ("host", "10000", "dataio_0"): (["id", "x0"], [[str(i), 1.0] for i in range(50, 300)])}
+    with FateFlowStub({OUTPUT_DATA: output_route(outputs)}) as stub:
+        stub.export_host()
+
+        async def join():
+            async with AsyncFMLManager() as manager:
+                return [frame async for frame in manager.join_component_output_data(
+                    "job_0", "dataio_0", [("guest", 9999), ("host", 10000)], chunk_size=30)]
+
+        frames = asyncio.run(join())
+
+    assert sum(len(frame) for frame in frames) == 50
@@ -0,0 +1,139 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pandas as pd
+import pytest
+
+from fml_manager import JobHistory
+from fate_flow_stub import FateFlowStub, manager_for
+
+DAY = 86400.0
+NOW = 1600000000.0
+
+
+def fate_job(index, module, status="success", elapsed=60.0, age=0.0, party_id=9999):
+    created = NOW - age
+    return {"f_job_id": "job_{}".format(index), "f_role": "guest", "f_party_id": party_id, "f_status": status,
+            "f_is_initiator": 1, "f_create_time": int(created * 1000), "f_start_time": int(created * 1000),
+            "f_end_time": int((created + elapsed) * 1000), "f_elapsed": int(elapsed * 1000),
+            "f_update_time": int((created + elapsed) * 1000),
+            "f_dsl": {"components": {"dataio_0": {"module": "DataIO"}, "model_0": {"module": module}}}}
+
+
+def fate_tasks(job):
+    return [{"f_job_id": job["f_job_id"], "f_component_name": component, "f_role": "guest", "f_party_id": 9999,
+             "f_task_id": "{}_{}".format(job["f_job_id"], component), "f_status": job["f_status"],
+             "f_create_time": job["f_create_time"], "f_start_time": job["f_start_time"],
+             "f_end_time": job["f_end_time"], "f_elapsed": job["f_elapsed"] // 2}
+            for component in job["f_dsl"]["components"]]
+
+
+def query_jobs(jobs, conditions):
+    # as FATE Flow, a query without conditions finds nothing
+    found = [job for job in jobs if conditions and all(
+        str(job.get("f_" + key)) == str(value) for key, value in conditions.items())]
+    if not found:
+        return {"retcode": 101, "retmsg": "find job failed"}
+    return {"retcode": 0, "retmsg": "success", "data": found}
+
+
+def cluster_routes(jobs, task_queries):
+    def query_job(request):
+        return query_jobs(jobs.values(), request.json())
+
+    def query_task(request):
+        job_id = request.json()["job_id"]
+        task_queries.append(job_id)
+        return {"retcode": 0, "retmsg": "success", "data": fate_tasks(jobs[job_id])}
+
+    return {"/v1/job/query": query_job, "/v1/job/task/query": query_task}
+
+
+def test_sync_writes_only_new_and_changed_jobs(tmp_path):
+    jobs = {"job_{}".format(i): fate_job(i, "HomoLR", status="running" if i == 2 else "success")
+            for i in range(5)}
+    task_queries = []
+    with FateFlowStub(cluster_routes(jobs, task_queries)) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        assert manager.sync_job_history() == 5
+        assert sorted(task_queries) == sorted(jobs)
+
+        del task_queries[:]
+        assert manager.sync_job_history() == 0
+        assert task_queries == []
+
+        jobs["job_2"] = fate_job(2, "HomoLR", elapsed=90.0)
+        jobs["job_5"] = fate_job(5, "HeteroSecureBoost")
+        assert manager.sync_job_history() == 2
+        assert sorted(task_queries) == ["job_2", "job_5"]
+
+        jobs["job_6"] = fate_job(6, "HomoLR", status="failed")
+        assert manager.sync_job_history({"job_id": "job_6"}, tasks=False) == 1
+        with pytest.raises(ValueError):
+            manager.sync_job_history({})
+        history = manager.job_history
+        assert history.count() == 7
+        assert os.path.exists(str(tmp_path / "job_history.db"))
+        tasks = history.tasks(module="HeteroSecureBoost")
+        manager.close()
+
+    assert list(tasks["component"]) == ["model_0"]
+    assert tasks["elapsed"].iloc[0] == 30.0
+
+
+def test_analytics_over_the_recorded_jobs(tmp_path):
+    jobs = [fate_job(i, "HomoLR" if i % 3 else "HeteroLR", status="failed" if i % 10 == 9 else "success",
+                     elapsed=float(10 + i), age=i * DAY / 10, party_id=9999 if i % 2 else 10000)
+            for i in range(200)]
+    with JobHistory(str(tmp_path / "history.db")) as history:
+        history.record(jobs, {job["f_job_id"]: fate_tasks(job) for job in jobs[:10]})
+
+        week = history.jobs(module="HomoLR", since=NOW - 7 * DAY)
+        expected = [job for i, job in enumerate(jobs) if i % 3 and i * DAY / 10 <= 7 * DAY]
+        assert sorted(week["job_id"]) == sorted(job["f_job_id"] for job in expected)
+        assert list(week["create_time"]) == sorted(week["create_time"], reverse=True)
+
+        stats = history.runtime_stats(module="HomoLR", since=NOW - 7 * DAY)
+        succeeded = pd.Series([job["f_elapsed"] / 1000.0 for job in expected if job["f_status"] == "success"])
+        assert list(stats.index) == ["HomoLR"]
+        assert stats.loc["HomoLR", "count"] == len(succeeded)
+        assert stats.loc["HomoLR", "p95"] == pytest.approx(succeeded.quantile(0.95))
+
+        by_module = history.runtime_stats(status=None)
+        assert set(by_module.index) == {"DataIO", "HomoLR", "HeteroLR"}
+        assert by_module.loc["DataIO", "count"] == 200
+        assert history.runtime_stats(by="party_id").loc["10000", "count"] == 100
+        assert len(history.jobs(status=["failed"], party_id=9999, limit=5)) == 5
+        assert len(history.tasks(job_ids=["job_0", "job_1"])) == 4
+        with pytest.raises(ValueError):
+            history.runtime_stats(by="tag")
+
+
+def test_async_sync_job_history(tmp_path):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from fml_manager import AsyncFMLManager
+
+    jobs = {"job_{}".format(i): fate_job(i, "HomoLR") for i in range(3)}
+    task_queries = []
+    with FateFlowStub(cluster_routes(jobs, task_queries)) as stub:
+        stub.export_host()
+
+        async def sync():
+            async with AsyncFMLManager(log_path=str(tmp_path)) as manager:
+                return [await manager.sync_job_history(), await manager.sync_job_history()]
+
+        assert asyncio.run(sync()) == [3, 0]
+
+    assert sorted(task_queries) == sorted(jobs)
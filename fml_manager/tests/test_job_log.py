@@ -0,0 +1,145 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import io
+import os
+import tarfile
+import threading
+
+import pytest
+
+from fml_manager.utils.tar_stream import ChunkPipe, extract_tar_stream
+from fate_flow_stub import FateFlowStub, manager_for
+
+LOGS = {
+    "fate_flow_schedule.log": b"schedule\n",
+    "guest/9999/INFO.log": b"info\n" * 1000,
+    "guest/9999/ERROR.log": b"error\n",
+    "host/10000/ERROR.log": b"host error\n",
+}
+
+
+def log_archive(files=LOGS, extra=None):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        for info in extra or []:
+            tar.addfile(info)
+    return buffer.getvalue()
+
+
+def log_route(content, chunk_size=4096):
+    def handler(request):
+        # sent chunked, like a log of unknown length
+        return 200, (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    return handler
+
+
+def read_tree(root):
+    tree = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, root).replace(os.sep, "/")] = f.read()
+    return tree
+
+
+def test_fetch_job_log_extracts_without_writing_the_archive(tmp_path, monkeypatch):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    monkeypatch.chdir(str(work_dir))
+    with FateFlowStub({"/v1/job/log": log_route(log_archive())}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path / "logs"))
+        response = manager.fetch_job_log("job_1")
+
+    assert response["retcode"] == 0
+    assert sorted(response["files"]) == sorted(LOGS)
+    assert read_tree(response["directory"]) == LOGS
+    assert os.listdir(str(work_dir)) == []
+
+
+def test_fetch_job_log_extracts_matching_members(tmp_path):
+    with FateFlowStub({"/v1/job/log": log_route(log_archive())}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        response = manager.fetch_job_log("job_1", members="guest/*ERROR*")
+        assert response["files"] == ["guest/9999/ERROR.log"]
+        assert read_tree(response["directory"]) == {"guest/9999/ERROR.log": b"error\n"}
+
+        response = manager.fetch_job_log("job_2", members=lambda name: name.startswith("host/"))
+        assert response["files"] == ["host/10000/ERROR.log"]
+
+
+def test_fetch_job_log_returns_flow_error():
+    error = {"retcode": 100, "retmsg": "no log of job job_1"}
+    with FateFlowStub({"/v1/job/log": lambda request: error}) as stub:
+        assert manager_for(stub).fetch_job_log("job_1").json() == error
+
+
+def test_extract_skips_members_outside_the_directory(tmp_path):
+    link = tarfile.TarInfo("guest/link.log")
+    link.type = tarfile.SYMTYPE
+    link.linkname = "/etc/passwd"
+    content = log_archive({"../escape.log": b"x", "guest/ok.log": b"ok"}, extra=[link])
+
+    files = extract_tar_stream(io.BytesIO(content), str(tmp_path / "logs"))
+
+    assert files == ["guest/ok.log"]
+    assert read_tree(str(tmp_path)) == {"logs/guest/ok.log": b"ok"}
+
+
+def test_chunk_pipe_feeds_a_reader_thread(tmp_path):
+    content = log_archive()
+    pipe = ChunkPipe(depth=2)
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(
+        files=extract_tar_stream(pipe, str(tmp_path), bufsize=512)))
+    reader.start()
+    for i in range(0, len(content), 100):
+        pipe.write(content[i:i + 100])
+    pipe.close()
+    reader.join(5)
+
+    assert sorted(result["files"]) == sorted(LOGS)
+
+
+def test_chunk_pipe_abort_releases_the_writer():
+    pipe = ChunkPipe(depth=1)
+    pipe.write(b"a")
+    writer = threading.Thread(target=pipe.write, args=(b"b",))
+    writer.start()
+    pipe.abort()
+    writer.join(5)
+
+    assert not writer.is_alive()
+    assert pipe.read() == b""
+
+
+def test_async_fetch_job_log_extracts_matching_members(tmp_path):
+    pytest.importorskip("aiohttp")
+    from fml_manager import AsyncFMLManager
+
+    with FateFlowStub({"/v1/job/log": log_route(log_archive())}) as stub:
+        stub.export_host()
+
+        async def fetch():
+            async with AsyncFMLManager(log_path=str(tmp_path)) as manager:
+                return await manager.fetch_job_log("job_1", members=["guest/*", "fate_flow_*"])
+
+        response = asyncio.run(fetch())
+
+    assert sorted(response["files"]) == ["fate_flow_schedule.log", "guest/9999/ERROR.log", "guest/9999/INFO.log"]
+    assert read_tree(response["directory"])["guest/9999/INFO.log"] == LOGS["guest/9999/INFO.log"]
@@ -0,0 +1,116 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from fml_manager import JobMemo
+from fml_manager.job_memo import canonical, input_tables
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for, submit_route
+
+DSL = {"components": {"dataio_0": {"module": "DataIO", "input": {"data": {"data": ["args.train_data"]}}}}}
+
+
+def config(table="breast_b", **parameters):
+    return {"initiator": {"role": "guest", "party_id": 9999},
+            "role": {"guest": [9999], "host": [10000]},
+            "role_parameters": {"guest": {"args": {"data": {"train_data": [{"name": table, "namespace": "breast"}]}}}},
+            "algorithm_parameters": dict({"hetero_lr_0": {"max_iter": 10}}, **parameters)}
+
+
+def test_key_is_canonical():
+    reordered = {"algorithm_parameters": {"hetero_lr_0": {"max_iter": 10}},
+                 "role_parameters": config()["role_parameters"],
+                 "role": {"host": [10000], "guest": [9999]},
+                 "initiator": {"party_id": 9999, "role": "guest"}}
+    assert canonical(reordered) == canonical(config())
+    assert input_tables(config()) == [("breast", "breast_b")]
+
+
+def test_equal_submissions_return_the_earlier_job(tmp_path):
+    submitted = []
+    statuses = {"job_1": ["running", "success"], "job_2": ["failed"]}
+    routes = {"/v1/job/submit": submit_route(submitted), "/v1/job/query": job_query_route(statuses)}
+    with FateFlowStub(routes) as stub, JobMemo(str(tmp_path / "memo.db")) as memo:
+        manager = manager_for(stub, memo=memo)
+        first = manager.submit_job(DSL, config())
+        # still running, the same job stands for it
+        assert manager.submit_job(DSL, config()).json()["jobId"] == "job_1"
+        # succeeded, the status is recorded and not queried again
+        again = manager.submit_job(DSL, config())
+        queries = stub.calls.count("/v1/job/query")
+        assert manager.submit_job(DSL, config()).json() == first.json()
+        assert stub.calls.count("/v1/job/query") == queries
+
+        # another parameter is another job
+        assert manager.submit_job(DSL, config(other={"seed": 1})).json()["jobId"] == "job_2"
+        # which failed, so it is submitted again
+        assert manager.submit_job(DSL, config(other={"seed": 1})).json()["jobId"] == "job_3"
+
+        # force submits and records the new job
+        assert manager.submit_job(DSL, config(), force=True).json()["jobId"] == "job_4"
+        assert memo.find("job_1") is None
+        assert memo.find("job_4").model_version == "job_4"
+
+    assert again.json()["data"]["model_info"]["model_version"] == "job_1"
+    assert len(submitted) == 4
+    assert memo.hits == 3 and memo.misses == 4
+
+
+def test_table_changes_invalidate(tmp_path):
+    submitted = []
+    statuses = {"job_{}".format(i): ["success"] for i in range(1, 5)}
+    routes = {"/v1/job/submit": submit_route(submitted), "/v1/job/query": job_query_route(statuses),
+              "/v1/table/delete": lambda request: {"retcode": 0, "retmsg": "success"}}
+    with FateFlowStub(routes) as stub:
+        memo = JobMemo(str(tmp_path / "memo.db"))
+        manager = manager_for(stub, memo=memo)
+        manager.submit_job(DSL, config())
+        manager.submit_job(DSL, config("breast_a"))
+        assert manager.submit_job(DSL, config()).json()["jobId"] == "job_1"
+
+        # a table deleted or uploaded again by a manager with the memo has a new version
+        manager.delete_table("breast", "breast_b")
+        assert manager.submit_job(DSL, config()).json()["jobId"] == "job_3"
+        assert manager.submit_job(DSL, config("breast_a")).json()["jobId"] == "job_2"
+
+        # a table changed by another client is invalidated by hand
+        assert memo.invalidate(table=("breast", "breast_a")) == 1
+        assert manager.submit_job(DSL, config("breast_a")).json()["jobId"] == "job_4"
+        with pytest.raises(ValueError):
+            memo.invalidate()
+        memo.close()
+
+    # the memo is kept on disk
+    with JobMemo(str(tmp_path / "memo.db")) as memo:
+        assert [entry.job_id for entry in memo.entries()] == ["job_4", "job_3", "job_1"]
+        assert memo.invalidate(job_id="job_3") == 1
+        memo.clear()
+        assert memo.entries() == []
+
+
+def test_async_submit_job_with_memo(tmp_path):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from fml_manager import AsyncFMLManager
+
+    submitted = []
+    routes = {"/v1/job/submit": submit_route(submitted), "/v1/job/query": job_query_route({"job_1": ["success"]})}
+    with FateFlowStub(routes) as stub, JobMemo(str(tmp_path / "memo.db")) as memo:
+        stub.export_host()
+
+        async def submit():
+            async with AsyncFMLManager(memo=memo) as manager:
+                return [(await manager.submit_job(DSL, config())).json()["jobId"] for _ in range(3)]
+
+        assert asyncio.run(submit()) == ["job_1"] * 3
+
+    assert len(submitted) == 1
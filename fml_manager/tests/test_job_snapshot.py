@@ -0,0 +1,144 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from fml_manager import JobSnapshot, ResultCache
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for
+
+DSL = {"components": {"dataio_0": {"module": "DataIO"},
+                      "hetero_lr_0": {"module": "HeteroLR"},
+                      "evaluation_0": {"module": "Evaluation"}}}
+
+
+class Concurrency:
+    """Wrap the routes to record the peak of concurrent calls"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __call__(self, route):
+        def handler(request):
+            with self.lock:
+                self.current += 1
+                self.peak = max(self.peak, self.current)
+            time.sleep(self.delay)
+            with self.lock:
+                self.current -= 1
+            return route(request)
+        return handler
+
+
+def component_route(output_data=False):
+    def handler(request):
+        if output_data and request.json()["component_name"] == "evaluation_0":
+            return {"retcode": 100, "retmsg": "no output data"}
+        return {"retcode": 0, "retmsg": "success", "data": [["1", 0.5], ["2", 0.7]],
+                "meta": {"header": ["id", "score"]}}
+    return handler
+
+
+def job_routes(concurrency):
+    routes = {
+        "/v1/job/config": lambda request: {"retcode": 0, "retmsg": "success",
+                                           "data": {"job_id": "job_0", "dsl": DSL, "runtime_conf": {}}},
+        "/v1/job/task/query": lambda request: {"retcode": 0, "retmsg": "success",
+                                               "data": [{"f_component_name": name} for name in DSL["components"]]},
+        "/v1/tracking/job/data_view": lambda request: {"retcode": 0, "retmsg": "success", "data": {"dataset": {}}},
+        "/v1/tracking/component/metric/all": component_route(),
+        "/v1/tracking/component/parameters": component_route(),
+        "/v1/tracking/component/output/model": component_route(),
+        "/v1/tracking/component/output/data": component_route(output_data=True),
+    }
+    routes = {path: concurrency(route) for path, route in routes.items()}
+    routes["/v1/job/query"] = job_query_route({"job_0": ["success"]})
+    return routes
+
+
+def test_snapshot_fetches_the_components_of_the_dsl_concurrently(tmp_path):
+    concurrency = Concurrency(delay=0.05)
+    with FateFlowStub(job_routes(concurrency)) as stub:
+        manager = manager_for(stub)
+        snapshot = manager.snapshot_job("job_0", "guest", 9999)
+
+    assert snapshot.status == "success" and snapshot.finished
+    assert list(snapshot.components) == ["dataio_0", "hetero_lr_0", "evaluation_0"]
+    lr = snapshot.components["hetero_lr_0"]
+    assert lr.module == "HeteroLR"
+    assert lr.parameters == [["1", 0.5], ["2", 0.7]]
+    assert list(lr.output_data.columns) == ["id", "score"]
+    assert len(snapshot.tasks) == 3 and snapshot.job_data == {"dataset": {}}
+
+    # a component without output data does not fail the snapshot
+    assert list(snapshot.errors) == [("output_data", "evaluation_0")]
+    assert snapshot.components["evaluation_0"].output_data is None
+    assert snapshot.components["evaluation_0"].metrics is not None
+
+    # 1 status, 3 job calls and 4 calls for each component
+    timings = snapshot.timing_frame()
+    assert len(timings) == 1 + 3 + 4 * 3
+    assert set(timings.groupby("endpoint").size().index) == {
+        "job", "conf", "tasks", "job_data", "metrics", "parameters", "output_model", "output_data"}
+    assert concurrency.peak > 4
+    assert snapshot.elapsed < 0.05 * len(timings) / 2
+
+    path = str(tmp_path / "snapshot.pickle")
+    snapshot.save(path)
+    loaded = JobSnapshot.load(path)
+    assert loaded.components["dataio_0"].metrics == snapshot.components["dataio_0"].metrics
+
+
+def test_snapshot_of_a_finished_job_is_served_by_the_cache(tmp_path):
+    with FateFlowStub(job_routes(Concurrency(delay=0))) as stub:
+        manager = manager_for(stub, cache=ResultCache(str(tmp_path)))
+        manager.snapshot_job("job_0", "guest", 9999)
+        calls = len(stub.calls)
+        snapshot = manager.snapshot_job("job_0", "guest", 9999)
+
+        # the status was queried once per snapshot, the failed call is asked again
+        assert calls == 1 + 3 + 4 * 3
+        assert stub.calls[calls:] == ["/v1/job/query", "/v1/tracking/component/output/data"]
+    assert snapshot.components["hetero_lr_0"].metrics is not None
+
+
+def test_snapshot_without_config():
+    with FateFlowStub({"/v1/job/query": job_query_route({"job_0": ["running"]})}) as stub:
+        manager = manager_for(stub)
+        snapshot = manager.snapshot_job("job_0", "guest", 9999)
+
+    assert snapshot.status == "running" and not snapshot.finished
+    assert snapshot.components == {}
+    assert set(snapshot.errors) == {("conf", None), ("tasks", None), ("job_data", None)}
+
+
+def test_async_snapshot_job():
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from fml_manager import AsyncFMLManager
+
+    with FateFlowStub(job_routes(Concurrency(delay=0))) as stub:
+        stub.export_host()
+
+        async def snapshot():
+            async with AsyncFMLManager() as manager:
+                return await manager.snapshot_job("job_0", "guest", 9999, output_data=False)
+
+        snapshot = asyncio.run(snapshot())
+
+    assert list(snapshot.components) == ["dataio_0", "hetero_lr_0", "evaluation_0"]
+    assert snapshot.ok and len(snapshot.timings) == 1 + 3 + 3 * 3
@@ -0,0 +1,78 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from fml_manager import *
+from fate_flow_stub import FateFlowStub, manager_for
+
+
+class SubmitRoute:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.bodies = []
+
+    def __call__(self, request):
+        body = request.json()
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            self.bodies.append(body)
+        time.sleep(0.02)
+        with self.lock:
+            self.current -= 1
+
+        alpha = body["job_runtime_conf"]["algorithm_parameters"]["homo_lr_0"]["alpha"]
+        if alpha == 3:
+            return 500, b"Internal Server Error"
+        if alpha == 5:
+            return {"retcode": 100, "retmsg": "invalid config"}
+        return {"retcode": 0, "retmsg": "success", "jobId": "job_{}".format(alpha)}
+
+
+def sweep(count):
+    dsl = Pipeline(ComponentBuilder(name='homo_lr_0', module='HomoLR')
+                   .add_input_train_data('args.train_data').build())
+    for alpha in range(count):
+        algorithm_parameters = AlgorithmParametersBuilder()\
+            .add_module_config(module='homo_lr_0', config={'alpha': alpha}).build()
+        yield dsl, Config(Initiator(role='guest', party_id=10000),
+                          algorithm_parameters=algorithm_parameters)
+
+
+def test_submit_jobs_collects_errors_without_aborting():
+    route = SubmitRoute()
+    with FateFlowStub({"/v1/job/submit": route}) as stub:
+        manager = manager_for(stub)
+        results = sorted(manager.submit_jobs(sweep(12), parallelism=3),
+                         key=lambda result: result.index)
+
+    assert len(results) == 12
+    assert [r.index for r in results if not r.ok] == [3, 5]
+    assert results[0].job_id == "job_0"
+    assert results[5].job_id is None
+    assert 1 < route.peak <= 3
+    assert "components" in route.bodies[0]["job_dsl"]
+
+
+def test_submit_jobs_rate_limit():
+    with FateFlowStub({"/v1/job/submit": SubmitRoute()}) as stub:
+        manager = manager_for(stub)
+        start = time.monotonic()
+        results = list(manager.submit_jobs(sweep(6), parallelism=6, rate_limit=20))
+
+    assert len(results) == 6
+    # 6 submissions at 20 per second need at least 5 intervals of 50ms
+    assert time.monotonic() - start >= 0.25
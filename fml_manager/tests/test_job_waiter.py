@@ -0,0 +1,90 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from fml_manager import Backoff, JobWaiter, QueryCondition
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for
+
+FAST = Backoff(initial=0.01, maximum=0.05)
+
+
+def test_backoff_grows_to_maximum():
+    backoff = Backoff(initial=0.2, maximum=10, factor=2, jitter=0)
+    assert [backoff.interval(i) for i in range(3)] == [0.2, 0.4, 0.8]
+    assert backoff.interval(100) == 10
+
+
+def test_one_poller_for_many_jobs():
+    statuses = {
+        "job_{}".format(i): ["waiting", "running", "success" if i % 2 else "failed"]
+        for i in range(50)
+    }
+    finished = []
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        with JobWaiter(manager_for(stub), backoff=FAST) as waiter:
+            futures = {job_id: waiter.wait_for(job_id, callback=lambda j, s: finished.append(j))
+                       for job_id in statuses}
+            # the threads of the stub and of the transport come and go, only the pollers are counted
+            pollers = [thread for thread in threading.enumerate()
+                       if thread.name == "fml-job-waiter"]
+            assert len(pollers) == 1
+            results = {job_id: future.result(timeout=10)
+                       for job_id, future in futures.items()}
+
+    assert results == {job_id: sequence[-1] for job_id, sequence in statuses.items()}
+    assert sorted(finished) == sorted(statuses)
+    assert waiter.polls == 150
+
+
+def test_deadline_and_wait_all():
+    statuses = {"job_short": ["running", "success"], "job_long": ["running"]}
+    finished = []
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        with JobWaiter(manager_for(stub), backoff=FAST) as waiter:
+            long_job = waiter.wait_for("job_long", callback=lambda j, s: finished.append((j, s)),
+                                       deadline=0.2)
+            assert waiter.wait_all(["job_short"]) == {"job_short": "success"}
+            with pytest.raises(TimeoutError):
+                long_job.result(timeout=10)
+
+    assert finished == [("job_long", None)]
+
+
+def test_backoff_intervals_end_at_the_timeout():
+    backoff = Backoff(initial=0.2, maximum=10, factor=2, jitter=0)
+    assert list(backoff.intervals(10, max_tries=3)) == [0.2, 0.4, 0.8]
+    start = time.monotonic()
+    for interval in backoff.intervals(0.5):
+        time.sleep(interval)
+    assert 0.5 <= time.monotonic() - start < 0.7
+
+
+def test_query_job_status_does_not_wait_a_second():
+    statuses = {"job_0": ["success"]}
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        manager = manager_for(stub)
+        start = time.monotonic()
+        assert manager.query_job_status(QueryCondition("job_0")) == "success"
+        assert time.monotonic() - start < 0.5
+
+
+def test_query_job_status_waits_max_tries_seconds():
+    statuses = {"job_0": ["running"]}
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        manager = manager_for(stub)
+        start = time.monotonic()
+        assert manager.query_job_status(QueryCondition("job_0"), max_tries=1) == "failed"
+        assert 0.9 < time.monotonic() - start < 1.5
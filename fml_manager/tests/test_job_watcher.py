@@ -0,0 +1,96 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from fml_manager import JobWatcher
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for
+
+
+def test_readers_share_the_cached_status():
+    statuses = {"job_{}".format(i): ["running"] for i in range(20)}
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        with JobWatcher(manager_for(stub), interval=60, max_staleness=60) as watcher:
+            watcher.watch(list(statuses))
+            first = watcher.statuses(list(statuses))
+
+            # many callers, e.g. a notebook and a dashboard, read the same jobs
+            readers = [threading.Thread(target=lambda: [watcher.status(job_id) for job_id in statuses])
+                       for _ in range(5)]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+            calls = len(stub.calls)
+
+    assert set(first.values()) == {"running"}
+    assert calls == 20
+    assert watcher.polls == 20
+    assert watcher.reads == 20 + 5 * 20
+    assert watcher.hits >= 5 * 20
+
+
+def test_rounds_refresh_and_notify_the_transitions():
+    statuses = {"job_a": ["waiting", "running", "success"], "job_b": ["running", "running", "failed"]}
+    changes = []
+    done = threading.Event()
+
+    def record(job_id, old, new):
+        changes.append((job_id, old, new))
+        if len([change for change in changes if change[2] in ("success", "failed")]) == 2:
+            done.set()
+
+    with FateFlowStub({"/v1/job/query": job_query_route(statuses)}) as stub:
+        with JobWatcher(manager_for(stub), interval=0.02) as watcher:
+            watcher.subscribe(record, list(statuses))
+            assert done.wait(10)
+            pollers = [thread for thread in threading.enumerate() if thread.name == "fml-job-watcher"]
+            # terminal jobs are not polled again
+            time.sleep(0.1)
+            calls = len(stub.calls)
+            assert watcher.status("job_a", max_staleness=0) == "success"
+            assert len(stub.calls) == calls
+
+    assert len(pollers) == 1
+    assert [change for change in changes if change[0] == "job_a"] == [
+        ("job_a", None, "waiting"), ("job_a", "waiting", "running"), ("job_a", "running", "success")]
+    assert ("job_b", "running", "failed") in changes
+    assert watcher.polls == 6
+
+
+def test_stale_read_polls_once_for_every_reader():
+    lock = threading.Lock()
+    served = []
+
+    def slow_query(request):
+        with lock:
+            served.append(request.json()["job_id"])
+        time.sleep(0.2)
+        return {"retcode": 0, "retmsg": "success", "data": [{"f_status": "running"}]}
+
+    with FateFlowStub({"/v1/job/query": slow_query}) as stub:
+        manager = manager_for(stub)
+        watcher = manager.job_watcher
+        watcher.interval = 60
+        results = []
+        readers = [threading.Thread(target=lambda: results.append(watcher.status("job_0")))
+                   for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        manager.close()
+
+    assert results == ["running"] * 4
+    assert served == ["job_0"]
+    assert watcher.polls == 1 and watcher.reads == 4
@@ -0,0 +1,188 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import tarfile
+import threading
+import time
+
+import pytest
+
+from fml_manager import LogIndex
+from fml_manager.log_index import log_file_location, tokenize
+from fate_flow_stub import FateFlowStub, manager_for
+
+ERROR = (b"[ERROR] [2020-12-01 10:00:01,000] [1:140] - task_executor.py[line:120]: Federation timeout of job {job}\n"
+         b"Traceback (most recent call last):\n"
+         b"  File \"task_executor.py\", line 120, in run\n"
+         b"TimeoutError: remote get\n")
+INFO = b"[INFO] [2020-12-01 10:00:00,000] [1:140] - task_executor.py[line:80]: Start task of {job}\n"
+
+
+def job_log(job_id):
+    # FATE also writes the records of a level in the files of the lower levels
+    error = ERROR.replace(b"{job}", job_id.encode("utf-8"))
+    info = INFO.replace(b"{job}", job_id.encode("utf-8"))
+    return {
+        "fate_flow_schedule.log": b"[INFO] [2020-12-01 09:59:59,000] [1:1] - scheduler.py[line:10]: schedule\n",
+        "guest/9999/INFO.log": info,
+        "guest/9999/hetero_lr_0/INFO.log": info + error,
+        "guest/9999/hetero_lr_0/ERROR.log": error,
+        "host/10000/hetero_lr_0/INFO.log": info,
+        "guest/9999/hetero_lr_0/model.json": b"{\"retcode\": 0}",
+    }
+
+
+def log_archive(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class LogRoute:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __call__(self, request):
+        job_id = request.json()["job_id"]
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(self.delay)
+        with self.lock:
+            self.current -= 1
+        return 200, log_archive(job_log(job_id))
+
+
+def test_location_and_tokens():
+    assert log_file_location("guest/9999/hetero_lr_0/ERROR.log") == ("guest", "9999", "hetero_lr_0")
+    assert log_file_location("job_1/guest/9999/INFO.log", "job_1") == ("guest", "9999", None)
+    assert log_file_location("fate_flow_schedule.log") == (None, None, None)
+    assert tokenize("Federation timeout of job_1 at 10:00") == {"federation", "timeout", "of", "job_1", "at"}
+
+
+def test_fetch_job_logs_in_parallel_and_search(tmp_path):
+    route = LogRoute(delay=0.1)
+    job_ids = ["job_{}".format(i) for i in range(8)]
+    with FateFlowStub({"/v1/job/log": route}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        responses = manager.fetch_job_logs(job_ids, parallelism=4)
+
+    assert sorted(responses) == job_ids
+    assert route.peak == 4
+    index = manager.log_index
+    assert sorted(index.jobs()) == job_ids
+
+    errors = index.search(component="hetero_lr_0", level="ERROR")
+    # indexed once, from ERROR.log, with the traceback
+    assert [record.job_id for record in errors] == job_ids
+    record = errors[0]
+    assert (record.role, record.party_id, record.level) == ("guest", "9999", "ERROR")
+    assert record.message.startswith("[ERROR]") and record.message.endswith("TimeoutError: remote get")
+
+    assert len(index.search(level="INFO")) == 8 * 4
+    assert len(index.search(role="host", level="INFO")) == 8
+    assert [r.job_id for r in index.search(text="Federation TIMEOUT job_3")] == ["job_3"]
+    assert index.search(text="timeout", level="INFO") == []
+    assert len(index.search(level="ERROR", last=3)) == 3
+    assert len(index.search(job_ids=["job_1", "job_2"], limit=3)) == 3
+    manager.close()
+
+
+def test_fetch_again_replaces_the_records_of_the_job(tmp_path):
+    with FateFlowStub({"/v1/job/log": LogRoute()}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        manager.fetch_job_logs(["job_1"])
+        manager.fetch_job_logs(["job_1"], members="guest/9999/hetero_lr_0/*")
+
+    assert len(manager.log_index.search(job_ids=["job_1"])) == 2
+
+
+def test_failed_extraction_is_not_indexed(tmp_path):
+    index = LogIndex(str(tmp_path / "index"))
+    content = log_archive(job_log("job_1"))
+    with FateFlowStub({"/v1/job/log": lambda request: (200, content[:len(content) // 2])}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        with pytest.raises(Exception):
+            manager.fetch_job_log("job_1", index=index)
+
+    assert index.jobs() == []
+    assert index.search() == []
+
+
+def test_records_of_levels_without_their_file_are_kept(tmp_path):
+    critical = b"[CRITICAL] [2020-12-01 10:00:02,000] [1:140] - task_executor.py[line:130]: Out of memory\n"
+    files = job_log("job_1")
+    files["guest/9999/hetero_lr_0/INFO.log"] += critical
+    files["guest/9999/hetero_lr_0/ERROR.log"] += critical
+    content = log_archive(files)
+    with FateFlowStub({"/v1/job/log": lambda request: (200, content)}) as stub:
+        manager = manager_for(stub, log_path=str(tmp_path))
+        manager.fetch_job_logs(["job_1"])
+        index = manager.log_index
+        # there is no CRITICAL.log, the record is indexed once from a lower file
+        assert len(index.search(level="CRITICAL")) == 1
+        assert len(index.search(level="ERROR")) == 1
+
+        # without ERROR.log, the ERROR record is indexed from INFO.log
+        manager.fetch_job_logs(["job_1"], members="*/INFO.log")
+        errors = index.search(level="ERROR")
+        assert [os.path.basename(record.path) for record in errors] == ["INFO.log"]
+        assert len(index.search(level="CRITICAL")) == 1
+        manager.close()
+
+
+def test_index_directory_and_blocks_split_inside_lines(tmp_path):
+    directory = tmp_path / "job_1_log" / "guest" / "9999" / "hetero_lr_0"
+    directory.mkdir(parents=True)
+    (directory / "ERROR.log").write_bytes((ERROR * 3).replace(b"{job}", b"job_1"))
+    index = LogIndex(str(tmp_path / "index"))
+
+    assert index.index_directory("job_1", str(tmp_path / "job_1_log")) == 3
+
+    # the same records, parsed from blocks of 7 bytes
+    indexer = index.indexer("job_2", str(tmp_path / "job_1_log"))
+    parser = indexer("guest/9999/hetero_lr_0/ERROR.log", str(directory / "ERROR.log"))
+    content = (directory / "ERROR.log").read_bytes()
+    for i in range(0, len(content), 7):
+        parser.write(content[i:i + 7])
+    parser.close()
+
+    first = index.search(job_ids=["job_1"])
+    assert [r.offset for r in index.search(job_ids=["job_2"])] == [r.offset for r in first]
+    assert index.search(text="remote")[0].message == first[0].message
+
+
+def test_async_fetch_job_logs(tmp_path):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from fml_manager import AsyncFMLManager
+
+    with FateFlowStub({"/v1/job/log": LogRoute()}) as stub:
+        stub.export_host()
+
+        async def fetch():
+            async with AsyncFMLManager(log_path=str(tmp_path)) as manager:
+                await manager.fetch_job_logs(["job_1", "job_2"], parallelism=2)
+                return manager.log_index.search(level="ERROR")
+
+        records = asyncio.run(fetch())
+
+    assert [record.job_id for record in records] == ["job_1", "job_2"]
@@ -0,0 +1,106 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from fml_manager import flow_requests
+from fate_flow_stub import FateFlowStub, manager_for
+
+METRICS = {"train": ["loss"], "validate": ["auc"]}
+
+
+def loss(job_id):
+    return [[step, 1.0 / (step + 1 + int(job_id[-1]))] for step in range(10)]
+
+
+class MetricRoutes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def metric_types(self, request):
+        return {"retcode": 0, "retmsg": "success", "data": METRICS}
+
+    def metric_data(self, request):
+        body = request.json()
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(0.05)
+        with self.lock:
+            self.current -= 1
+        if body["metric_name"] == "loss":
+            data = loss(body["job_id"])
+        else:
+            data = [["auc", 0.9]]
+        return {"retcode": 0, "retmsg": "success", "data": data, "meta": {}}
+
+    def routes(self):
+        return {"/v1/tracking/component/metrics": self.metric_types,
+                "/v1/tracking/component/metric_data": self.metric_data}
+
+
+def test_metric_frame_of_many_jobs():
+    metric_routes = MetricRoutes()
+    job_ids = ["job_{}".format(i) for i in range(4)]
+    with FateFlowStub(metric_routes.routes()) as stub:
+        frame = manager_for(stub).get_metric_frame(job_ids, "homo_lr_0", "guest", 10000)
+
+    assert list(frame.index.names) == ["job_id", "namespace", "metric", "step"]
+    assert len(frame) == 4 * (10 + 1)
+    assert frame["value"].dtype == "float64"
+    assert frame.index.get_level_values("job_id").dtype.name == "category"
+    curve = frame.xs(("job_2", "train", "loss"))["value"]
+    assert list(curve.index) == list(range(10))
+    assert list(curve) == [value for _, value in loss("job_2")]
+    assert frame.xs(("job_1", "validate", "auc", "auc"))["value"] == 0.9
+    assert metric_routes.peak > 1
+
+
+def test_metric_frame_filters_metrics():
+    with FateFlowStub(MetricRoutes().routes()) as stub:
+        manager = manager_for(stub)
+        frame = manager.get_metric_frame("job_0", "homo_lr_0", "guest", 10000, metrics=["loss"])
+        assert set(frame.index.get_level_values("metric")) == {"loss"}
+        frame = manager.get_metric_frame("job_0", "homo_lr_0", "guest", 10000,
+                                         metrics=[("validate", "auc")])
+        assert len(frame) == 1
+
+        stub.calls.clear()
+        frame = manager.get_metric_frame([], "homo_lr_0", "guest", 10000)
+        assert frame.empty and stub.calls == []
+
+
+def test_metric_frame_raises_on_error():
+    with pytest.raises(Exception, match="component not found"):
+        flow_requests.metric_names({"retcode": 100, "retmsg": "component not found"})
+
+
+def test_async_metric_frame_matches_sync():
+    pytest.importorskip("aiohttp")
+    from fml_manager import AsyncFMLManager
+
+    job_ids = ["job_0", "job_1"]
+    with FateFlowStub(MetricRoutes().routes()) as stub:
+        expected = manager_for(stub).get_metric_frame(job_ids, "homo_lr_0", "guest", 10000)
+
+        async def fetch():
+            async with AsyncFMLManager() as manager:
+                return await manager.get_metric_frame(job_ids, "homo_lr_0", "guest", 10000)
+
+        pd.testing.assert_frame_equal(asyncio.run(fetch()), expected)
@@ -0,0 +1,127 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from fml_manager import Backoff, MetricWatcher
+from fml_manager.metric_watcher import MetricSeries
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for
+
+FAST = Backoff(initial=0.01, maximum=0.05, jitter=0)
+
+
+class GrowingMetrics:
+    """ Serve a loss series which grows by 3 points on every call, and a fixed auc """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, request):
+        with self.lock:
+            self.calls += 1
+            size = 3 * self.calls
+        return {"retcode": 0, "retmsg": "success", "data": {
+            "train": {"loss": {"data": [[step, 1.0 / (step + 1)] for step in range(size)], "meta": {}}},
+            "validate": {"auc": {"data": [["auc", 0.9]], "meta": {}}}}}
+
+
+def routes(metrics, statuses):
+    return {"/v1/job/query": job_query_route({"job_0": statuses}),
+            "/v1/tracking/component/metric/all": metrics}
+
+
+def test_watch_metrics_yields_each_point_once():
+    metrics = GrowingMetrics()
+    with FateFlowStub(routes(metrics, ["running"] * 4 + ["success"])) as stub:
+        manager = manager_for(stub)
+        with MetricWatcher(manager, backoff=FAST) as watcher:
+            updates = list(manager.watch_metrics("job_0", "hetero_lr_0", "guest", 10000,
+                                                 metrics=["loss"], watcher=watcher))
+
+    steps = [point[0] for update in updates for point in update.points]
+    # the points logged until the job succeeded are all delivered
+    assert steps == list(range(3 * metrics.calls))
+    assert {(update.namespace, update.metric) for update in updates} == {("train", "loss")}
+    assert metrics.calls == 5
+
+
+def test_one_poller_for_many_watches():
+    metrics = GrowingMetrics()
+    received = {"loss": [], "auc": []}
+    with FateFlowStub(routes(metrics, ["running"] * 3 + ["success"])) as stub:
+        with MetricWatcher(manager_for(stub), backoff=FAST) as watcher:
+            futures = [watcher.watch("job_0", "hetero_lr_0", "guest", 10000,
+                                     lambda update, name=name: received[name].append(update), [name])
+                       for name in received]
+            pollers = [thread for thread in threading.enumerate()
+                       if thread.name == "fml-metric-watcher"]
+            assert len(pollers) == 1
+            assert [future.result(timeout=10) for future in futures] == ["success", "success"]
+
+    # the component is polled once for both watches
+    assert watcher.polls == metrics.calls == 4
+    assert len(received["auc"]) == 1
+    assert sum(len(update.points) for update in received["loss"]) == 12
+
+
+def test_watch_again_after_unwatch_polls_once():
+    metrics = GrowingMetrics()
+    slow = Backoff(initial=0.3, maximum=0.3, jitter=0)
+    with FateFlowStub(routes(metrics, ["running"])) as stub:
+        with MetricWatcher(manager_for(stub), backoff=slow) as watcher:
+            first = watcher.watch("job_0", "hetero_lr_0", "guest", 10000, lambda update: None)
+            deadline = time.monotonic() + 5
+            while watcher.polls == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            watcher.unwatch(first)
+            watcher.watch("job_0", "hetero_lr_0", "guest", 10000, lambda update: None)
+            time.sleep(0.75)
+            polls = watcher.polls
+
+    assert first.cancelled()
+    # the first poll, then the new watch at 0, 0.3 and 0.6 s, the old entry is dropped
+    assert polls == 4
+
+
+def test_series_keeps_the_last_seen_step():
+    series = MetricSeries("job_0", "hetero_lr_0")
+    result = {"retcode": 0, "data": {"train": {"loss": {"data": [[0, 0.5], [1, 0.4]]}}}}
+    assert series.update(result)[0].points == [[0, 0.5], [1, 0.4]]
+    assert series.update(result) == []
+    result["data"]["train"]["loss"]["data"].append([2, 0.3])
+    assert series.update(result)[0].points == [[2, 0.3]]
+    assert series.update({"retcode": 100, "retmsg": "no metric"}) == []
+
+
+def test_async_watch_metrics():
+    pytest.importorskip("aiohttp")
+    from fml_manager import AsyncFMLManager
+
+    metrics = GrowingMetrics()
+    with FateFlowStub(routes(metrics, ["running", "running", "success"])) as stub:
+        manager_for(stub)
+
+        async def watch():
+            async with AsyncFMLManager() as manager:
+                return [update async for update in manager.watch_metrics(
+                    "job_0", "hetero_lr_0", "guest", 10000, backoff=FAST)]
+
+        updates = asyncio.run(watch())
+
+    loss = [point[0] for update in updates if update.metric == "loss" for point in update.points]
+    assert loss == list(range(9))
+    assert len([update for update in updates if update.metric == "auc"]) == 1
@@ -0,0 +1,151 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pandas as pd
+import pytest
+
+from fml_manager.utils.frames import typed_frame
+from fml_manager.utils.json_stream import JsonMemberStream
+from fate_flow_stub import FateFlowStub, manager_for
+
+HEADER = ["id", "label", "x0"]
+
+
+def output_rows(count):
+    return [[str(i), i % 2, "{:.4f}".format(i * 0.1)] for i in range(count)]
+
+
+def output_route(rows, meta_first=False, chunk=4096):
+    """ Return a component output data handler which streams the response chunked
+
+    FATE Flow sorts the keys, so the meta comes after the data unless meta_first.
+    """
+    members = [("data", rows), ("meta", {"header": HEADER, "total": len(rows)}),
+               ("retcode", 0), ("retmsg", "success")]
+    if meta_first:
+        members.insert(0, members.pop(1))
+    body = json.dumps(dict(members), sort_keys=False).encode("utf-8")
+
+    def handler(request):
+        return 200, (body[i:i + chunk] for i in range(0, len(body), chunk))
+
+    return handler
+
+
+def test_json_member_stream_survives_any_split():
+    document = {"data": [[1, "a]\"b", None, 2.5e-3], [], [True, {"k": [1]}, "数据"]],
+                "meta": {"header": ["x"]}, "retcode": 0}
+    encoded = json.dumps(document, indent=2, ensure_ascii=False).encode("utf-8")
+    for step in (1, 2, 5, len(encoded)):
+        stream = JsonMemberStream("data")
+        items = []
+        for i in range(0, len(encoded), step):
+            items.extend(stream.feed(encoded[i:i + step]))
+        items.extend(stream.close())
+        assert items == document["data"]
+        assert stream.members == {"meta": {"header": ["x"]}, "retcode": 0}
+
+    with pytest.raises(ValueError):
+        stream = JsonMemberStream("data")
+        stream.feed(encoded[:-3])
+        stream.close()
+
+
+def test_iter_component_output_data_yields_chunks():
+    rows = output_rows(25000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/tracking/component/output/data"] = output_route(rows)
+        manager = manager_for(stub)
+        frames = list(manager.iter_component_output_data(
+            "job", "guest", 10000, "dataio_0", chunk_size=10000, typed=False))
+
+    assert [len(frame) for frame in frames] == [10000, 10000, 5000]
+    assert list(frames[0].columns) == HEADER
+    expected = pd.DataFrame(rows, columns=HEADER)
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), expected)
+
+
+@pytest.mark.parametrize("meta_first", [True, False])
+def test_iter_component_output_data_limit_and_offset(meta_first):
+    rows = output_rows(5000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/tracking/component/output/data"] = output_route(rows, meta_first)
+        manager = manager_for(stub)
+        head = list(manager.iter_component_output_data(
+            "job", "guest", 10000, "dataio_0", chunk_size=8, limit=20, offset=5))
+
+    assert [len(frame) for frame in head] == [8, 8, 4]
+    assert list(pd.concat(head)["id"]) == [str(i) for i in range(5, 25)]
+
+
+def test_iter_component_output_data_raises_on_error():
+    with FateFlowStub() as stub:
+        stub.routes["/v1/tracking/component/output/data"] = lambda request: {
+            "retcode": 100, "retmsg": "no component output"}
+        manager = manager_for(stub)
+        with pytest.raises(Exception, match="no component output"):
+            list(manager.iter_component_output_data("job", "guest", 10000, "dataio_0"))
+
+
+def test_typed_frame_infers_dtypes():
+    rows = [["a{}".format(i), i % 2, i * 0.5, str(i), "{:.1f}".format(i / 4.0), i % 3 == 0, "x"]
+            for i in range(3000)]
+    rows[2500][3] = "2500.5"
+    rows[2600][2] = None
+    header = ["id", "label", "x0", "count", "ratio", "flag", "tag"]
+
+    frame = typed_frame(rows, header)
+    assert frame["id"].dtype.name == "category"
+    assert frame["label"].dtype.name == "category"
+    assert frame["x0"].dtype == "float64" and frame["x0"].isna().sum() == 1
+    # the fraction after the sampled rows is kept
+    assert frame["count"].dtype == "float64" and frame["count"][2500] == 2500.5
+    assert frame["ratio"].dtype == "float64"
+    assert frame["flag"].dtype == "bool"
+    assert frame["tag"].dtype.name == "category"
+    assert typed_frame(rows, header, float32=True)["x0"].dtype == "float32"
+    assert typed_frame(rows[:10], header)["count"].dtype == "int64"
+
+
+def test_typed_frame_keeps_large_ints_exact():
+    rows = [[9007199254740993, "9007199254740993", 2 ** 70], [1, "-2", 1]]
+    frame = typed_frame(rows, ["x0", "x1", "x2"])
+    assert frame["x0"].dtype == "int64" and frame["x0"][0] == 9007199254740993
+    assert frame["x1"].dtype == "int64" and list(frame["x1"]) == [9007199254740993, -2]
+    # beyond int64 the column is float rather than wrapped around
+    assert frame["x2"].dtype == "float64" and frame["x2"][0] == 2.0 ** 70
+
+
+def test_typed_frame_keeps_values_of_mismatching_columns():
+    rows = [[str(i), float(i)] for i in range(2000)] + [["z", "not a number"]]
+    frame = typed_frame(rows, ["sid", "x0"])
+    assert frame["x0"].dtype == object
+    assert frame["x0"].iloc[-1] == "not a number"
+    assert list(frame["x0"].iloc[:3]) == [0.0, 1.0, 2.0]
+
+
+def test_track_component_output_data_is_typed():
+    rows = output_rows(3000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/tracking/component/output/data"] = output_route(rows)
+        manager = manager_for(stub)
+        frame = manager.track_component_output_data("job", "guest", 10000, "dataio_0")
+        chunks = list(manager.iter_component_output_data(
+            "job", "guest", 10000, "dataio_0", chunk_size=1000, float32=True))
+
+    assert [str(dtype) for dtype in frame.dtypes] == ["category", "category", "float64"]
+    assert [str(dtype) for dtype in chunks[-1].dtypes] == ["category", "category", "float32"]
@@ -0,0 +1,95 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+
+import pytest
+
+from fml_manager import FlowResponse
+from fml_manager.utils import core
+from fate_flow_stub import FateFlowStub, manager_for
+
+PARAMETERS = "/v1/tracking/component/parameters"
+
+
+class CountingDecoder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, src):
+        self.calls += 1
+        return json.loads(src)
+
+
+@pytest.fixture
+def decoder():
+    decoder = CountingDecoder()
+    core.set_json_decoder(decoder)
+    yield decoder
+    core.set_json_decoder()
+
+
+def test_body_is_decoded_once_on_first_access(decoder):
+    with FateFlowStub({PARAMETERS: lambda request: {"retcode": 0, "retmsg": "success",
+                                                    "data": {"alpha": 0.01}}}) as stub:
+        manager = manager_for(stub)
+        response = manager.track_component_parameters("job_0", "guest", 9999, "hetero_lr_0")
+
+    assert isinstance(response, FlowResponse)
+    assert response.ok and decoder.calls == 0
+    assert response.retcode == 0
+    assert response["data"] == {"alpha": 0.01}
+    assert response.json() is response.json()
+    assert decoder.calls == 1
+    assert json.loads(str(response)) == response.json()
+    assert repr(response) == "<FlowResponse [200]>"
+
+
+def test_result_built_by_the_client_is_encoded_on_demand():
+    result = {"retcode": 0, "directory": "/tmp/job_0_log", "files": ["INFO.log"]}
+    response = FlowResponse.from_result(result)
+
+    assert response.json() is result
+    assert response["directory"] == "/tmp/job_0_log"
+    assert json.loads(response.content) == result
+    assert FlowResponse.of(result).json() == result
+    assert FlowResponse.of(response) is response
+    # a mapping as the dicts these results used to be
+    assert "files" in response and "data" not in response
+    assert dict(response) == result
+    assert list(response.keys()) == list(result) and dict(response.items()) == result
+
+
+def test_body_that_is_not_an_object():
+    response = FlowResponse(502, b"<html>Bad Gateway</html>")
+
+    assert not response.ok
+    assert response.retcode is None and response.get("data", []) == []
+    assert "data" not in response and len(response) == 0
+    assert str(response) == "<html>Bad Gateway</html>"
+    with pytest.raises(ValueError):
+        response.json()
+
+
+def test_fallback_to_json_for_what_the_decoder_rejects():
+    def strict(src):
+        if b"NaN" in src:
+            raise ValueError("NaN")
+        return json.loads(src)
+
+    core.set_json_decoder(strict)
+    try:
+        assert core.json_loads(b"[1, 2]") == [1, 2]
+        assert math.isnan(FlowResponse(200, b"{\"loss\": NaN}").json()["loss"])
+    finally:
+        core.set_json_decoder()
@@ -0,0 +1,115 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from fml_manager import ResultCache
+from fml_manager.response import FlowResponse
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for
+
+PARAMETERS = "/v1/tracking/component/parameters"
+OUTPUT_DATA = "/v1/tracking/component/output/data"
+
+
+def parameters_route(request):
+    body = request.json()
+    return {"retcode": 0, "retmsg": "success",
+            "data": {"component": body["component_name"], "alpha": 0.01}}
+
+
+def tracking_calls(stub):
+    return [path for path in stub.calls if path.startswith("/v1/tracking")]
+
+
+def test_finished_job_is_served_from_disk(tmp_path):
+    routes = {"/v1/job/query": job_query_route({"job_0": ["success"]}),
+              PARAMETERS: parameters_route,
+              OUTPUT_DATA: lambda request: {"retcode": 0, "retmsg": "success",
+                                            "data": [["1", 0, 0.5], ["2", 1, 1.5]],
+                                            "meta": {"header": ["id", "label", "x0"]}}}
+    with FateFlowStub(routes) as stub:
+        cache = ResultCache(str(tmp_path))
+        manager = manager_for(stub, cache=cache)
+        first = manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0").json()
+        frame = manager.track_component_output_data("job_0", "guest", 10000, "dataio_0")
+        assert manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0").json() == first
+        assert manager.track_component_parameters("job_0", "guest", 10000, "dataio_0").json() != first
+        assert (cache.hits, cache.misses) == (1, 3)
+        # the status of the job is queried once
+        assert stub.calls.count("/v1/job/query") == 1
+
+        # a notebook opened again sends no request
+        stub.calls.clear()
+        reopened = ResultCache(str(tmp_path))
+        manager = manager_for(stub, cache=reopened)
+        assert manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0").json() == first
+        assert manager.track_component_output_data("job_0", "guest", 10000, "dataio_0").equals(frame)
+        assert stub.calls == []
+        assert (reopened.hits, reopened.misses) == (2, 0)
+
+
+def test_running_job_and_errors_are_not_stored(tmp_path):
+    routes = {"/v1/job/query": job_query_route({"job_0": ["running", "running", "success"]}),
+              PARAMETERS: parameters_route}
+    with FateFlowStub(routes) as stub:
+        # every call queries the status again
+        cache = ResultCache(str(tmp_path), running_ttl=0)
+        manager = manager_for(stub, cache=cache)
+        for _ in range(4):
+            manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0")
+        # stored once the job has succeeded
+        assert len(tracking_calls(stub)) == 3
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert stub.calls.count("/v1/job/query") == 3
+
+        stub.routes[PARAMETERS] = lambda request: {"retcode": 100, "retmsg": "no parameters"}
+        for _ in range(2):
+            manager.track_component_parameters("job_0", "guest", 10000, "dataio_0")
+        assert len(tracking_calls(stub)) == 5
+        assert (cache.hits, cache.misses) == (1, 5)
+
+
+def test_running_job_is_not_queried_before_every_call(tmp_path):
+    routes = {"/v1/job/query": job_query_route({"job_0": ["running", "success"]}),
+              PARAMETERS: parameters_route}
+    with FateFlowStub(routes) as stub:
+        cache = ResultCache(str(tmp_path), running_ttl=0.3)
+        manager = manager_for(stub, cache=cache)
+        for _ in range(3):
+            manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0")
+        assert stub.calls.count("/v1/job/query") == 1
+        assert len(tracking_calls(stub)) == 3
+
+        # once the answer expired the status is queried again, and the result stored
+        time.sleep(0.4)
+        for _ in range(2):
+            manager.track_component_parameters("job_0", "guest", 10000, "homo_lr_0")
+        assert stub.calls.count("/v1/job/query") == 2
+        assert len(tracking_calls(stub)) == 4
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size=3000)
+    for index in range(4):
+        cache.put("key{}".format(index), FlowResponse(200, b"x" * 900, url="url"))
+        os.utime(os.path.join(str(tmp_path), "key{}.entry".format(index)), (index, index))
+    assert cache.size <= 3000
+    assert cache.get("key0") is None
+    assert cache.get("key1").content == b"x" * 900
+
+    # key1 is now the most recently used, key2 goes first
+    cache.put("key4", FlowResponse(200, b"y" * 900, {"Content-Type": "text/plain"}))
+    assert cache.get("key2") is None
+    assert cache.get("key1") is not None and cache.get("key3") is not None
+    assert cache.get("key4").headers == {"Content-Type": "text/plain"}
+    assert [name for name in os.listdir(str(tmp_path)) if not name.endswith(".entry")] == []
@@ -0,0 +1,66 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import pytest
+import requests
+
+from fml_manager import HttpTransport, QueryCondition
+from fate_flow_stub import FateFlowStub, manager_for
+
+
+def job_query(request):
+    return {"retcode": 0, "retmsg": "success",
+            "data": [{"f_job_id": request.json()["job_id"], "f_status": "success"}]}
+
+
+def slow_job_query(request):
+    time.sleep(0.5)
+    return job_query(request)
+
+
+def test_calls_reuse_keep_alive_connections():
+    with FateFlowStub({"/v1/job/query": job_query}) as stub:
+        manager = manager_for(stub)
+        for _ in range(20):
+            response = manager.query_job(QueryCondition("job_0"))
+            assert response.json()["data"][0]["f_status"] == "success"
+        manager.close()
+
+    assert stub.connections == 1
+
+
+def test_transport_shared_between_managers():
+    with FateFlowStub({"/v1/job/query": job_query}) as stub:
+        transport = HttpTransport(pool_size=2)
+        first = manager_for(stub, transport=transport)
+        second = manager_for(stub, transport=transport)
+        assert first.transport is second.transport
+
+        first.query_job(QueryCondition("job_0"))
+        second.query_job(QueryCondition("job_1"))
+        transport.close()
+
+    assert stub.connections == 1
+
+
+def test_default_and_per_call_timeout():
+    with FateFlowStub({"/v1/job/query": slow_job_query}) as stub:
+        manager = manager_for(stub, timeout=0.1)
+        with pytest.raises(requests.Timeout):
+            manager.query_job(QueryCondition("job_0"))
+
+        response = manager.with_timeout(5).query_job(QueryCondition("job_0"))
+        assert response.status_code == 200
+        assert manager.timeout == 0.1
+        manager.close()
@@ -0,0 +1,415 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import tarfile
+
+import pandas as pd
+import pytest
+import requests
+
+from fml_manager.fml_manager import HttpDownloader
+from fml_manager.utils import file_utils, upload_manifest
+from fml_manager.utils.csv_stream import CsvBatchStream
+from fml_manager.utils.multipart import MultipartFileStream
+from fml_manager.utils.shards import split_lines
+from fate_flow_stub import FateFlowStub, manager_for, upload_route
+
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        f.write("id,y,x0,x1\n")
+        for i in range(rows):
+            f.write("{},{},{:.6f},{:.6f}\n".format(i, i % 2, i * 0.5, i * 0.25))
+
+
+def sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_multipart_stream_reads_in_blocks():
+    source = io.BytesIO(b"x" * 1000)
+    body = MultipartFileStream(source, "data.csv", size=1000, buffer_size=64)
+    chunks = list(body)
+    assert max(len(chunk) for chunk in chunks) <= 64
+    assert sum(len(chunk) for chunk in chunks) == body.length == len(body)
+
+
+def test_load_data_streams_file_with_content_length(tmp_path):
+    path = str(tmp_path / "breast_guest.csv")
+    write_csv(path, 20000)
+    reports = []
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        manager = manager_for(stub)
+        response = manager.load_data(path, "experiment", "breast_guest", 1, 1, 4,
+                                     progress=lambda *report: reports.append(report),
+                                     buffer_size=64 * 1024)
+
+    assert response.json()["retcode"] == 0
+    upload = stub.uploads[0]
+    assert upload["sha256"] == sha256(path)
+    assert upload["params"] == {"namespace": "experiment", "table_name": "breast_guest",
+                                "work_mode": "1", "head": "1", "partition": "4", "drop": "1"}
+    assert "Transfer-Encoding" not in upload["headers"]
+
+    sent, total, rate = reports[-1]
+    assert sent == total == int(upload["headers"]["Content-Length"])
+    assert total > os.path.getsize(path)
+    assert len(reports) > 2 and rate > 0
+
+
+def remote_csv_route(path, chunked=False):
+    def handler(request):
+        with open(path, "rb") as f:
+            content = f.read()
+        if chunked:
+            return 200, iter([content[i:i + 4096] for i in range(0, len(content), 4096)])
+        return content
+
+    return handler
+
+
+def test_load_data_pipes_url_without_temp_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "remote.csv")
+    write_csv(path, 5000)
+
+    def no_spool(*args, **kwargs):
+        raise AssertionError("the upload is spooled to disk")
+
+    monkeypatch.setattr("fml_manager.fml_manager.HttpDownloader.download_to", no_spool)
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        stub.routes["/remote/data.csv"] = remote_csv_route(path)
+        stub.routes["/remote/chunked.csv"] = remote_csv_route(path, chunked=True)
+        manager = manager_for(stub)
+        manager.load_data("http://{}/remote/data.csv".format(stub.host), "remote", "t", 1, 1, 4)
+        manager.load_data("http://{}/remote/chunked.csv".format(stub.host), "remote", "t", 1, 1, 4,
+                          allow_chunked=True)
+
+    assert [upload["sha256"] for upload in stub.uploads] == [sha256(path)] * 2
+    assert "Content-Length" in stub.uploads[0]["headers"]
+    assert stub.uploads[1]["headers"]["Transfer-Encoding"] == "chunked"
+
+
+def test_load_data_spools_url_of_unknown_length(tmp_path):
+    path = str(tmp_path / "remote.csv")
+    write_csv(path, 5000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        stub.routes["/remote/chunked.csv"] = remote_csv_route(path, chunked=True)
+        manager = manager_for(stub)
+        manager.load_data("http://{}/remote/chunked.csv".format(stub.host), "remote", "t", 1, 1, 4)
+
+    upload = stub.uploads[0]
+    assert upload["sha256"] == sha256(path)
+    assert "Content-Length" in upload["headers"]
+    assert not os.path.exists(os.path.join(
+        file_utils.get_project_base_directory(), "chunked.csv"))
+
+
+def test_upload_name_from_content_disposition_or_url():
+    def filename(url, disposition=None):
+        return HttpDownloader(url).filename({"content-disposition": disposition} if disposition else {})
+
+    assert filename("http://host/", 'attachment; filename="data.csv"') == "data.csv"
+    assert filename("http://host/", "attachment; filename=x.csv; filename*=UTF-8''y%C3%A9.csv") == "y\u00e9.csv"
+    assert filename("http://host/", 'attachment; filename="../../guest.csv"') == "guest.csv"
+    assert filename("http://host/remote/data%20set.csv?token=1") == "data set.csv"
+    assert filename("http://host/remote/", "inline") == "upload.csv"
+
+
+def test_split_lines_keeps_lines_whole(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 1001)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    header, ranges = split_lines(path, 4)
+    assert header == b"id,y,x0,x1\n"
+    assert len(ranges) == 4
+    assert ranges[0][0] == len(header) and ranges[-1][1] == len(content)
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+        assert content[end - 1:end] == b"\n"
+
+
+def test_load_data_uploads_shards_in_parallel(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 20000)
+    reports = []
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub, keep_content=True)
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0, "retmsg": "success"}
+        manager = manager_for(stub)
+        responses = manager.load_data(path, "experiment", "guest", 1, 1, 4, parallel=True,
+                                      progress=lambda *report: reports.append(report))
+
+    assert len(responses) == 4
+    assert stub.calls.count("/v1/table/delete") == 1
+    assert stub.calls.index("/v1/table/delete") == 0
+    assert all(upload["params"]["drop"] == "0" for upload in stub.uploads)
+
+    with open(path, "rb") as f:
+        header = f.readline()
+        rows = f.read()
+    # the shards arrive in any order, sort them by their first id
+    shards = sorted((upload["content"] for upload in stub.uploads),
+                    key=lambda shard: int(shard.split(b"\n")[1].split(b",")[0]))
+    assert all(shard.startswith(header) for shard in shards)
+    assert b"".join(shard[len(header):] for shard in shards) == rows
+
+    sent, total, rate = reports[-1]
+    assert sent == total == sum(int(upload["headers"]["Content-Length"]) for upload in stub.uploads)
+
+
+def test_load_data_compresses_upload(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 20000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub)
+        manager = manager_for(stub)
+        manager.load_data(path, "experiment", "guest", 1, 1, 4, compress=True)
+
+    upload = stub.uploads[0]
+    assert upload["sha256"] == sha256(path)
+    assert upload["headers"]["Content-Encoding"] == "gzip"
+    assert upload["headers"]["Transfer-Encoding"] == "chunked"
+    assert upload["wire_size"] < os.path.getsize(path) / 2
+
+
+def test_load_data_passes_gzip_file_through(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 20000)
+    with open(path, "rb") as f, gzip.open(path + ".gz", "wb") as fw:
+        fw.write(f.read())
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub, keep_content=True)
+        manager = manager_for(stub)
+        manager.load_data(path + ".gz", "experiment", "guest", 1, 1, 4, compress=True)
+
+    upload = stub.uploads[0]
+    assert upload["sha256"] == sha256(path)
+    assert upload["headers"]["Content-Encoding"] == "gzip"
+    assert int(upload["headers"]["Content-Length"]) == upload["wire_size"]
+    assert upload["wire_size"] < os.path.getsize(path + ".gz") + 512
+
+
+def test_fetch_job_log_switches_response_compression(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    accepted = []
+
+    def log_route(request):
+        accepted.append(request.headers.get("Accept-Encoding"))
+        tar_path = str(tmp_path / "log.tar.gz")
+        with tarfile.open(tar_path, "w:gz") as tar:
+            tar.add(__file__, arcname="fate_flow_schedule.log")
+        with open(tar_path, "rb") as f:
+            content = gzip.compress(f.read())
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            return 200, content, {"Content-Encoding": "gzip"}
+        return 200, gzip.decompress(content)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/job/log"] = log_route
+        manager = manager_for(stub, log_path=str(tmp_path))
+        for compress in (True, False):
+            response = manager.fetch_job_log("job_{}".format(compress), compress=compress)
+            assert os.path.exists(os.path.join(response["directory"], "fate_flow_schedule.log"))
+
+    assert "gzip" in accepted[0]
+    assert accepted[1] == "identity"
+
+
+def dropping_route(route, dropped_calls):
+    """ Wrap a route to kill the connection in the middle of the given calls, counted from 1
+    """
+    calls = itertools.count(1)
+
+    def handler(request):
+        if next(calls) in dropped_calls:
+            next(request.iter_body(), None)
+            return None
+        return route(request)
+
+    return handler
+
+
+def test_resumable_upload_resumes_after_dropped_connection(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 40000)
+    manifest = path + ".manifest.json"
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = dropping_route(
+            upload_route(stub, keep_content=True), {3})
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0, "retmsg": "success"}
+        manager = manager_for(stub)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                              resumable=True, chunk_size=256 * 1024)
+        with open(manifest) as f:
+            chunks = json.load(f)["chunks"]
+        assert len(chunks) > 4
+        assert [chunk["sha256"] is not None for chunk in chunks[:3]] == [True, True, False]
+
+        responses = manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                                      resumable=True, chunk_size=256 * 1024)
+
+    assert len(responses) == len(chunks) - 2
+    assert not os.path.exists(manifest)
+    # the table is dropped once up front, not again on resume
+    assert stub.calls.count("/v1/table/delete") == 1
+    assert [upload["params"]["drop"] for upload in stub.uploads] == ["0"] * len(chunks)
+
+    with open(path, "rb") as f:
+        header = f.readline()
+        rows = f.read()
+    assert all(upload["content"].startswith(header) for upload in stub.uploads)
+    assert b"".join(upload["content"][len(header):] for upload in stub.uploads) == rows
+
+
+def test_resumable_upload_restarts_when_file_changes(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 40000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = dropping_route(upload_route(stub), {2})
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0, "retmsg": "success"}
+        manager = manager_for(stub)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                              resumable=True, chunk_size=256 * 1024)
+        write_csv(path, 40001)
+        manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                          resumable=True, chunk_size=256 * 1024)
+
+    assert stub.calls.count("/v1/table/delete") == 2
+    assert {upload["params"]["drop"] for upload in stub.uploads} == {"0"}
+    assert sum(upload["size"] for upload in stub.uploads[1:]) > os.path.getsize(path)
+
+
+def test_resumable_upload_restarts_when_parameters_change(tmp_path):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 40000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = dropping_route(upload_route(stub), {2})
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0, "retmsg": "success"}
+        manager = manager_for(stub)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                              resumable=True, chunk_size=256 * 1024)
+        # without a drop the confirmed rows would be appended twice
+        with pytest.raises(Exception, match="drop the table"):
+            manager.load_data(path, "experiment", "guest", 1, 1, 8, drop=0,
+                              resumable=True, chunk_size=256 * 1024)
+        manager.load_data(path, "experiment", "guest", 1, 1, 8,
+                          resumable=True, chunk_size=256 * 1024)
+
+    # the chunk confirmed with 4 partitions is sent again with 8
+    assert [upload["params"]["partition"] for upload in stub.uploads[:2]] == ["4", "8"]
+    assert stub.calls.count("/v1/table/delete") == 2
+    assert sum(upload["size"] for upload in stub.uploads[1:]) > os.path.getsize(path)
+
+
+def test_resume_hashes_the_last_confirmed_chunk_only(tmp_path, monkeypatch):
+    path = str(tmp_path / "guest.csv")
+    write_csv(path, 40000)
+    hashed = []
+    hash_range = upload_manifest.hash_range
+    monkeypatch.setattr(upload_manifest, "hash_range",
+                        lambda *args: hashed.append(args[1]) or hash_range(*args))
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = dropping_route(upload_route(stub), {4})
+        stub.routes["/v1/table/delete"] = lambda request: {"retcode": 0, "retmsg": "success"}
+        manager = manager_for(stub)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                              resumable=True, chunk_size=256 * 1024)
+        with open(path + ".manifest.json") as f:
+            starts = [chunk["start"] for chunk in json.load(f)["chunks"]]
+        manager.load_data(path, "experiment", "guest", 1, 1, 4,
+                          resumable=True, chunk_size=256 * 1024)
+
+    # three chunks were confirmed, the third one is hashed
+    assert hashed == [starts[2]]
+
+
+def guest_frame(rows):
+    return pd.DataFrame({"id": range(rows), "y": [i % 2 for i in range(rows)],
+                         "x0": [i * 0.5 for i in range(rows)], "x1": [i * 0.25 for i in range(rows)]})
+
+
+def test_load_dataframe_streams_csv_in_batches(tmp_path):
+    frame = guest_frame(5000)
+    expected = frame.to_csv(index=False).encode("utf-8")
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub, keep_content=True)
+        manager = manager_for(stub)
+        manager.load_dataframe(frame, "experiment", "guest", 1, 4, batch_rows=700)
+        manager.load_dataframe(frame, "experiment", "guest", 1, 4, batch_rows=700,
+                               allow_chunked=True)
+
+    measured, chunked = stub.uploads
+    assert measured["content"] == chunked["content"] == expected
+    assert measured["params"]["head"] == "1"
+    assert "Content-Length" in measured["headers"]
+    assert chunked["headers"]["Transfer-Encoding"] == "chunked"
+
+
+def test_load_dataframe_reads_arrow_and_parquet(tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    frame = guest_frame(3000)
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    path = str(tmp_path / "guest.parquet")
+    pyarrow.parquet.write_table(table, path, row_group_size=1000)
+
+    with FateFlowStub() as stub:
+        stub.routes["/v1/data/upload"] = upload_route(stub, keep_content=True)
+        manager = manager_for(stub)
+        manager.load_dataframe(table, "experiment", "guest", 1, 4, batch_rows=400)
+        manager.load_dataframe(path, "experiment", "guest", 1, 4, batch_rows=400)
+
+    expected = frame.to_csv(index=False).encode("utf-8")
+    assert [upload["content"] for upload in stub.uploads] == [expected] * 2
+
+
+def read_all(stream):
+    return b"".join(iter(stream.read, b""))
+
+
+def test_csv_of_arrow_batches_keeps_the_dtypes_of_the_schema():
+    pyarrow = pytest.importorskip("pyarrow")
+
+    # only the second batch holds a null, its ints must not become floats
+    table = pyarrow.table({"id": [1, 2, 3, 4], "x0": [1, 2, None, 4], "flag": [True, False, None, True]})
+    assert read_all(CsvBatchStream(table, batch_rows=2)) == b"id,x0,flag\n1,1,True\n2,2,False\n3,,\n4,4,True\n"
+
+    # an empty source still sends the header line
+    assert read_all(CsvBatchStream(table.slice(0, 0))) == b"id,x0,flag\n"
+    assert read_all(CsvBatchStream(guest_frame(0))) == b"id,y,x0,x1\n"
@@ -0,0 +1,112 @@
+# Copyright 2019-2020 VMware, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# you may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+from fml_manager import Backoff, Workflow
+from fate_flow_stub import FateFlowStub, job_query_route, manager_for, submit_route
+
+FAST = Backoff(initial=0.01, maximum=0.02, jitter=0)
+
+
+def job_name(body):
+    # the job id is the name in the config
+    return body["job_runtime_conf"]["name"]
+
+
+def test_outputs_flow_into_the_downstream_configs():
+    submitted = []
+    statuses = {"train": ["running", "success"], "predict": ["running", "success"]}
+    routes = {"/v1/job/submit": submit_route(submitted, job_name), "/v1/job/query": job_query_route(statuses)}
+    with FateFlowStub(routes) as stub:
+        manager = manager_for(stub)
+        flow = Workflow(manager, backoff=FAST)
+        flow.add("prepare", lambda outputs: {"table": "breast_b"})
+        flow.add_job("train", {"components": {}}, {"name": "train", "table": "${prepare.table}"}, after="prepare")
+        flow.add_job("predict", {"components": {}},
+                     {"name": "predict", "job_parameters": {"model_id": "${train.model_id}",
+                                                            "model_version": "${train.model_version}"},
+                      "note": "after ${train.job_id}"}, after=["train"])
+        flow.add("evaluate", lambda outputs: {"auc": 0.9, "of": outputs["predict"].job_id}, after=["predict"])
+        result = flow.run()
+
+    assert result.ok
+    assert submitted[0]["job_runtime_conf"]["table"] == "breast_b"
+    assert submitted[1]["job_runtime_conf"]["job_parameters"] == {"model_id": "model_train", "model_version": "train"}
+    assert submitted[1]["job_runtime_conf"]["note"] == "after train"
+    assert result["evaluate"].value == {"auc": 0.9, "of": "predict"}
+    assert [step.name for step in result.critical_path()] == ["prepare", "train", "predict", "evaluate"]
+    frame = result.timing_frame()
+    assert list(frame.index) == ["prepare", "train", "predict", "evaluate"]
+    assert (frame["finished_at"] >= frame["submitted_at"]).all()
+    assert "critical path" in result.report()
+
+
+def test_ready_steps_run_at_once_up_to_max_running():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def step(outputs):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.pop()
+        return None
+
+    flow = Workflow(None, max_running=2)
+    for i in range(6):
+        flow.add("upload_{}".format(i), step)
+    flow.add("train", step, after=["upload_{}".format(i) for i in range(6)])
+    result = flow.run()
+
+    assert result.ok
+    assert max(peak) == 2
+    # three rounds of uploads, then the training
+    assert 0.35 < result.elapsed < 1.0
+    assert result["train"].ready_at == max(result["upload_{}".format(i)].finished_at for i in range(6))
+    assert sum(result["upload_{}".format(i)].waited > 0.05 for i in range(6)) == 4
+
+
+def test_steps_after_a_failure_are_skipped():
+    submitted = []
+    statuses = {"train": ["running", "failed"], "other": ["success"]}
+    routes = {"/v1/job/submit": submit_route(submitted, job_name), "/v1/job/query": job_query_route(statuses)}
+    with FateFlowStub(routes) as stub:
+        flow = Workflow(manager_for(stub), backoff=FAST)
+        flow.add_job("train", {}, {"name": "train"})
+        flow.add_job("other", {}, {"name": "other"})
+        flow.add_job("predict", {}, {"name": "predict"}, after="train")
+        flow.add("evaluate", lambda outputs: 1, after=["predict", "other"])
+        flow.add("broken", lambda outputs: 1 / 0, after="other")
+        result = flow.run()
+
+    assert not result.ok
+    assert [result[name].status for name in ("train", "other", "predict", "evaluate", "broken")] == [
+        "failed", "success", "skipped", "skipped", "failed"]
+    assert "failed" in str(result["train"].error)
+    assert isinstance(result["broken"].error, ZeroDivisionError)
+    assert sorted(body["job_runtime_conf"]["name"] for body in submitted) == ["other", "train"]
+
+
+def test_dependencies_are_added_first():
+    flow = Workflow(None)
+    flow.add("upload", lambda outputs: None)
+    with pytest.raises(ValueError):
+        flow.add("train", lambda outputs: None, after=["predict"])
+    with pytest.raises(ValueError):
+        flow.add("upload", lambda outputs: None)